@@ -0,0 +1,82 @@
+"""Load-test request throughput against the stub backend and the local mock server.
+
+Usage: python -m benchmarks.backend_benchmark [--snippets 2000] [--latency 0.05] [--concurrency 8]
+
+Requests to the mock server go over HTTP through the same pooled client used for OpenAI, so the
+number of connections it accepted shows how well keep-alive connections are reused.
+"""
+
+from commit_suggestions.backends import OpenAIBackend, StubBackend
+from commit_suggestions.llm import generate_commit_suggestions_async, plan_batches
+from commit_suggestions.mock_server import MockServer
+from commit_suggestions.models import (
+    ModifiedCodeSnippet,
+    ModifiedCodeSnippets,
+    TokenUsage,
+)
+import argparse
+import asyncio
+import time
+
+
+def make_snippets(num_snippets: int) -> ModifiedCodeSnippets:
+    return ModifiedCodeSnippets(
+        modified_code_snippets=[
+            ModifiedCodeSnippet(
+                filename=f"pkg{number % 50}/module{number}.py",
+                modified_code=f"-    return {number}\n+    return {number} + 1",
+                start_line=5,
+                end_line=6,
+            )
+            for number in range(num_snippets)
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snippets", type=int, default=2000)
+    parser.add_argument("--token-budget", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds each request takes"
+    )
+    args = parser.parse_args()
+
+    snippets = make_snippets(args.snippets)
+    num_batches = len(plan_batches(snippets, args.token_budget))
+    print(f"{args.snippets} snippets in {num_batches} requests")
+
+    async def run(backend):
+        async with backend:
+            return await generate_commit_suggestions_async(
+                backend,
+                snippets,
+                token_budget=args.token_budget,
+                concurrency=args.concurrency,
+                usage=TokenUsage(),
+            )
+
+    start = time.perf_counter()
+    asyncio.run(run(StubBackend(latency=args.latency)))
+    seconds = time.perf_counter() - start
+    print(f"  {'stub':>12}: {seconds:7.2f} s {num_batches / seconds:8.1f} requests/s")
+
+    with MockServer(latency=args.latency) as server:
+        start = time.perf_counter()
+        asyncio.run(
+            run(
+                OpenAIBackend(
+                    base_url=server.base_url, max_connections=args.concurrency
+                )
+            )
+        )
+        seconds = time.perf_counter() - start
+    print(
+        f"  {'mock server':>12}: {seconds:7.2f} s {num_batches / seconds:8.1f} requests/s "
+        f"({server.connections} connections for {server.requests} requests)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark collecting `git diff` with one call against sharding the changed paths over processes.
+
+Usage: python -m benchmarks.diff_benchmark [--scenarios many_small_files ...] [--workers 8]
+
+Peak memory is measured in this process only, where the single call parses the whole diff.
+"""
+
+from benchmarks.pipeline_benchmark import measure
+from benchmarks.synthetic import SCENARIOS, create_scenario_repo
+from commit_suggestions.diff_collection import iter_parallel_hunks
+from commit_suggestions.utils import iter_git_diff_lines, iter_hunks
+from pathlib import Path
+import argparse
+import os
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenarios", nargs="+", default=["many_small_files", "mixed_changes"]
+    )
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"Unknown scenario: {scenario}")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_dir = Path(temp_dir)
+            create_scenario_repo(repo_dir, scenario, args.scale)
+
+            single = measure(
+                lambda: list(iter_hunks(iter_git_diff_lines(str(repo_dir))))
+            )
+            parallel = measure(
+                lambda: list(iter_parallel_hunks(str(repo_dir), args.workers))
+            )
+            # Both ways must find the same hunks in the same order
+            assert single["result"] == parallel["result"]
+
+        print(f"{scenario} ({len(single['result'])} hunks):")
+        for name, measurement in [
+            ("single call", single),
+            (f"{args.workers} workers", parallel),
+        ]:
+            print(
+                f"  {name:>12}: {measurement['seconds']:7.3f} s "
+                f"{measurement['peak_bytes'] / 1e6:8.1f} MB peak"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Benchmark the parse -> snippet -> group -> stage pipeline on synthetic diffs.
+
+Usage: python -m benchmarks.pipeline_benchmark [--scenarios huge_file ...] [--compare OLD.json]
+
+Results are saved to benchmarks/results/<commit>.json so runs can be compared between commits.
+"""
+
+from benchmarks.synthetic import SCENARIOS, create_scenario_repo, git
+from commit_suggestions.grouping import group_snippets
+from commit_suggestions.models import (
+    CommitSuggestion,
+    CommitSuggestions,
+    Hunks,
+    ModifiedCodeSnippets,
+)
+from commit_suggestions.staging import stage_hunks
+from commit_suggestions.utils import (
+    color_code,
+    get_snippets_from_hunks,
+    parse_git_diff_into_hunks,
+)
+from commit_suggestions.viewer import render_code
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+import argparse
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def fake_llm(modified_code_snippets: ModifiedCodeSnippets) -> CommitSuggestions:
+    """Suggest one commit per file instantly, standing in for the model."""
+    file_indices: Dict[str, List[int]] = {}
+    for index, snippet in enumerate(modified_code_snippets.modified_code_snippets):
+        file_indices.setdefault(snippet.filename, []).append(index)
+    return CommitSuggestions(
+        commit_suggestions=[
+            CommitSuggestion(
+                message=f"chore: update {filename}", code_snippet_indices=indices
+            )
+            for filename, indices in file_indices.items()
+        ]
+    )
+
+
+def stage_all(hunks: Hunks, commit_suggestions: CommitSuggestions, repo_dir: Path):
+    """Stage every suggestion the way the review loop does, then unstage again."""
+    for commit_suggestion in commit_suggestions.commit_suggestions:
+        stage_hunks(hunks, commit_suggestion.code_snippet_indices, str(repo_dir))
+    git(repo_dir, "reset", "-q")
+
+
+def measure(function: Callable[[], Any]) -> Dict[str, Any]:
+    """Time a stage, then run it again under tracemalloc to find its peak memory."""
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"result": result, "seconds": seconds, "peak_bytes": peak_bytes}
+
+
+def run_scenario(scenario: str, scale: int) -> Dict[str, Any]:
+    """Run every stage of the pipeline on one scenario."""
+    stages: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_dir = Path(temp_dir)
+        create_scenario_repo(repo_dir, scenario, scale)
+
+        diff_txt = git(repo_dir, "diff")
+        diff_bytes = len(diff_txt.encode("utf-8"))
+        results: Dict[str, Any] = {}
+        pipeline = [
+            ("parse", lambda: parse_git_diff_into_hunks(diff_txt)),
+            ("snippets", lambda: get_snippets_from_hunks(results["parse"])),
+            ("group", lambda: group_snippets(results["snippets"])),
+            (
+                "color_code",
+                lambda: [
+                    color_code(snippet.modified_code)
+                    for snippet in results["snippets"].modified_code_snippets
+                ],
+            ),
+            (
+                "render",
+                lambda: [
+                    render_code(snippet.modified_code)
+                    for snippet in results["snippets"].modified_code_snippets
+                ],
+            ),
+            ("serialize", lambda: results["snippets"].model_dump_json(indent=2)),
+            ("fake_llm", lambda: fake_llm(results["snippets"])),
+            (
+                "stage",
+                lambda: stage_all(results["parse"], results["fake_llm"], repo_dir),
+            ),
+        ]
+        for name, function in pipeline:
+            try:
+                measurement = measure(function)
+            except Exception as error:
+                # Later stages depend on this one, so stop here
+                stages[name] = {"error": f"{type(error).__name__}: {error}"}
+                break
+            results[name] = measurement.pop("result")
+            measurement["mb_per_second"] = (
+                diff_bytes / 1e6 / measurement["seconds"]
+                if measurement["seconds"]
+                else None
+            )
+            if "parse" in results:
+                measurement["hunks_per_second"] = (
+                    len(results["parse"].hunks) / measurement["seconds"]
+                    if measurement["seconds"]
+                    else None
+                )
+            stages[name] = measurement
+
+    num_hunks = len(results["parse"].hunks) if "parse" in results else None
+    return {"diff_bytes": diff_bytes, "hunks": num_hunks, "stages": stages}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print how much slower or faster each stage is compared to a baseline run."""
+    print(f"\nCompared to {baseline['commit']}:")
+    for scenario, scenario_results in results["scenarios"].items():
+        baseline_stages = baseline["scenarios"].get(scenario, {}).get("stages", {})
+        for stage, measurement in scenario_results["stages"].items():
+            baseline_measurement = baseline_stages.get(stage, {})
+            if "seconds" not in measurement or "seconds" not in baseline_measurement:
+                continue
+            ratio = measurement["seconds"] / max(baseline_measurement["seconds"], 1e-9)
+            print(f"  {scenario:>18} {stage:>10}: {ratio:6.2f}x time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--scale", type=int, default=1, help="Multiply scenario sizes")
+    parser.add_argument(
+        "--compare", type=Path, help="Earlier results file to compare to"
+    )
+    args = parser.parse_args()
+    # Read the baseline first since it may be overwritten by this run's results
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+
+    commit = git(Path(__file__).parent, "rev-parse", "--short", "HEAD").strip()
+    results: Dict[str, Any] = {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "scenarios": {},
+    }
+    for scenario in args.scenarios:
+        scenario_results = run_scenario(scenario, args.scale)
+        results["scenarios"][scenario] = scenario_results
+        print(
+            f"{scenario} ({scenario_results['diff_bytes'] / 1e6:.1f} MB diff, "
+            f"{scenario_results['hunks']} hunks)"
+        )
+        for stage, measurement in scenario_results["stages"].items():
+            if "error" in measurement:
+                print(f"  {stage:>10}: {measurement['error']}")
+                continue
+            print(
+                f"  {stage:>10}: {measurement['seconds'] * 1000:9.1f} ms "
+                f"{measurement['mb_per_second'] or 0:8.1f} MB/s "
+                f"{measurement['peak_bytes'] / 1e6:8.1f} MB peak"
+            )
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    results_path = RESULTS_DIR / f"{commit}.json"
+    results_path.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"\nSaved results to {results_path}")
+
+    if baseline is not None:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measure how many prompt tokens each prompt encoding sends for the synthetic diffs.
+
+Usage: python -m benchmarks.prompt_benchmark [--scenarios mixed_changes ...] [--context-lines 1]
+
+Tokens are estimated the same way requests are planned (about 4 characters per token).
+"""
+
+from benchmarks.synthetic import SCENARIOS, create_scenario_repo, git
+from commit_suggestions.llm import (
+    batch_snippets,
+    create_prompt,
+    estimate_tokens,
+    plan_batches,
+)
+from commit_suggestions.models import ModifiedCodeSnippets, PromptEncoding
+from commit_suggestions.prompt_encoding import encode_snippets
+from commit_suggestions.utils import get_snippets_from_hunks, parse_git_diff_into_hunks
+from pathlib import Path
+from typing import Dict
+import argparse
+import tempfile
+
+
+def count_prompt_tokens(
+    modified_code_snippets: ModifiedCodeSnippets, encoding: PromptEncoding
+) -> int:
+    """Estimate the prompt tokens of every request needed for the snippets."""
+    tokens = 0
+    for batch in plan_batches(modified_code_snippets, encoding=encoding):
+        snippets = batch_snippets(modified_code_snippets, batch)
+        tokens += estimate_tokens(create_prompt(len(batch), encoding))
+        tokens += estimate_tokens(encode_snippets(snippets, encoding))
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--scale", type=int, default=1, help="Multiply scenario sizes")
+    parser.add_argument(
+        "--context-lines", type=int, default=1, help="Context kept when trimming"
+    )
+    args = parser.parse_args()
+
+    encodings: Dict[str, PromptEncoding] = {
+        "json": PromptEncoding(),
+        "json, trimmed": PromptEncoding(context_lines=args.context_lines),
+        "compact": PromptEncoding(compact=True),
+        "compact, trimmed": PromptEncoding(
+            compact=True, context_lines=args.context_lines
+        ),
+    }
+    for scenario in args.scenarios:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_dir = Path(temp_dir)
+            create_scenario_repo(repo_dir, scenario, args.scale)
+            snippets = get_snippets_from_hunks(
+                parse_git_diff_into_hunks(git(repo_dir, "diff"))
+            )
+
+        print(f"{scenario} ({len(snippets.modified_code_snippets)} hunks)")
+        baseline_tokens = None
+        for name, encoding in encodings.items():
+            tokens = count_prompt_tokens(snippets, encoding)
+            if baseline_tokens is None:
+                baseline_tokens = tokens
+            reduction = 1 - tokens / baseline_tokens if baseline_tokens else 0
+            print(f"  {name:>16}: {tokens:12,} tokens {reduction:7.1%} smaller")
+
+
+if __name__ == "__main__":
+    main()
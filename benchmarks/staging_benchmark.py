@@ -0,0 +1,112 @@
+"""Compare staging hunks one `git apply` at a time against one combined `git apply`.
+
+Usage: python -m benchmarks.staging_benchmark --hunks 200
+"""
+
+from commit_suggestions.models import Hunks
+from commit_suggestions.staging import stage_hunks
+from commit_suggestions.utils import parse_git_diff_into_hunks
+from contextlib import contextmanager
+import argparse
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+
+@contextmanager
+def count_spawns():
+    """Count the processes started through `subprocess.Popen`."""
+    counter = {"spawns": 0}
+    original_init = subprocess.Popen.__init__
+
+    def counting_init(self, *args, **kwargs):
+        counter["spawns"] += 1
+        original_init(self, *args, **kwargs)
+
+    subprocess.Popen.__init__ = counting_init
+    try:
+        yield counter
+    finally:
+        subprocess.Popen.__init__ = original_init
+
+
+def git(repo_dir: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo_dir, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def create_repo(repo_dir: Path, num_hunks: int) -> Hunks:
+    """Create a repository with one file that has `num_hunks` unstaged hunks."""
+    git(repo_dir, "init", "-q")
+    lines = [f"line {number}" for number in range(num_hunks * 10)]
+    (repo_dir / "big.txt").write_text("\n".join(lines) + "\n")
+    git(repo_dir, "add", ".")
+    git(
+        repo_dir,
+        "-c",
+        "user.name=b",
+        "-c",
+        "user.email=b@b",
+        "commit",
+        "-q",
+        "-m",
+        "init",
+    )
+
+    # Changes 10 lines apart never share context, so each is its own hunk
+    for number in range(0, num_hunks * 10, 10):
+        lines[number] = f"changed {number}"
+    (repo_dir / "big.txt").write_text("\n".join(lines) + "\n")
+    return parse_git_diff_into_hunks(git(repo_dir, "diff"))
+
+
+def stage_per_hunk(hunks: Hunks, indices, repo_dir: str):
+    """Stage hunks the way `prompt_user` used to, with one `git apply` per hunk."""
+    for index in indices:
+        hunk = hunks.hunks[index]
+        patch = "\n".join(
+            [
+                hunk.file_header,
+                hunk.index_line,
+                hunk.file_path_indicators,
+                hunk.hunk_header,
+                hunk.modified_code,
+                "",
+            ]
+        )
+        subprocess.run(
+            ["git", "apply", "--cached", "-"],
+            input=patch,
+            text=True,
+            cwd=repo_dir,
+            capture_output=True,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hunks", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_dir = Path(temp_dir)
+        hunks = create_repo(repo_dir, args.hunks)
+        indices = list(range(len(hunks.hunks)))
+
+        for name, stage in [("per hunk", stage_per_hunk), ("combined", stage_hunks)]:
+            git(repo_dir, "reset", "-q")
+            with count_spawns() as counter:
+                start = time.perf_counter()
+                stage(hunks, indices, str(repo_dir))
+                elapsed = time.perf_counter() - start
+            staged = git(repo_dir, "diff", "--cached", "--numstat").split()[:2]
+            print(
+                f"{name:>9}: {counter['spawns']:5d} spawns {elapsed * 1000:9.1f} ms "
+                f"(+{staged[0]} -{staged[1]} lines staged)"
+            )
+
+
+if __name__ == "__main__":
+    main()
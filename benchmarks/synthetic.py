@@ -0,0 +1,135 @@
+"""Synthetic repositories with unstaged changes for benchmarking the pipeline."""
+
+from pathlib import Path
+from typing import Callable, Dict
+import os
+import subprocess
+
+
+def git(repo_dir: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo_dir, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def commit_all(repo_dir: Path):
+    git(repo_dir, "add", "-A")
+    git(
+        repo_dir,
+        "-c",
+        "user.name=bench",
+        "-c",
+        "user.email=bench@bench",
+        "commit",
+        "-q",
+        "-m",
+        "init",
+    )
+
+
+def many_small_files(repo_dir: Path, scale: int = 1):
+    """Many small files with a single changed line each."""
+    num_files = 2000 * scale
+    for number in range(num_files):
+        path = repo_dir / f"pkg{number % 50}" / f"module{number}.py"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(
+            f"import os\n\n\ndef function_{number}():\n    return {number}\n"
+        )
+    commit_all(repo_dir)
+
+    for number in range(num_files):
+        path = repo_dir / f"pkg{number % 50}" / f"module{number}.py"
+        path.write_text(
+            f"import os\n\n\ndef function_{number}():\n    return {number} + 1\n"
+        )
+
+
+def huge_file(repo_dir: Path, scale: int = 1):
+    """One huge file with a change every 50 lines."""
+    num_lines = 200_000 * scale
+    lines = [f"value_{number} = {number}" for number in range(num_lines)]
+    (repo_dir / "huge.py").write_text("\n".join(lines) + "\n")
+    commit_all(repo_dir)
+
+    for number in range(0, num_lines, 50):
+        lines[number] = f"value_{number} = {number} * 2"
+    (repo_dir / "huge.py").write_text("\n".join(lines) + "\n")
+
+
+def binary_mode_heavy(repo_dir: Path, scale: int = 1):
+    """Binary edits, mode changes, and deletions mixed with a few text changes."""
+    num_files = 300 * scale
+    for number in range(num_files):
+        (repo_dir / f"asset{number}.bin").write_bytes(bytes([0, number % 256]) * 512)
+        (repo_dir / f"script{number}.sh").write_text(f"echo {number}\n")
+        (repo_dir / f"old{number}.txt").write_text(f"old {number}\n")
+        (repo_dir / f"text{number}.txt").write_text(f"a\nb {number}\nc\n")
+    commit_all(repo_dir)
+
+    for number in range(num_files):
+        (repo_dir / f"asset{number}.bin").write_bytes(bytes([1, number % 256]) * 512)
+        os.chmod(repo_dir / f"script{number}.sh", 0o755)
+        (repo_dir / f"old{number}.txt").unlink()
+        (repo_dir / f"text{number}.txt").write_text(f"a\nB {number}\nc\n")
+
+
+def million_lines(repo_dir: Path, scale: int = 1):
+    """A diff that is a million lines long, spread over a few large files."""
+    num_files = 10
+    lines_per_file = 50_000 * scale
+    for number in range(num_files):
+        lines = [f"row {number} {line}" for line in range(lines_per_file)]
+        (repo_dir / f"data{number}.txt").write_text("\n".join(lines) + "\n")
+    commit_all(repo_dir)
+
+    # Rewriting every line puts each line in the diff twice
+    for number in range(num_files):
+        lines = [f"ROW {number} {line}" for line in range(lines_per_file)]
+        (repo_dir / f"data{number}.txt").write_text("\n".join(lines) + "\n")
+
+
+def mixed_changes(repo_dir: Path, scale: int = 1):
+    """Typical feature work: code edits next to a lockfile, reformatting, and repeated edits."""
+    num_files = 100 * scale
+    lockfile_lines = [f'"package-{number}": "1.0.{number}",' for number in range(5000)]
+    (repo_dir / "package-lock.json").write_text("\n".join(lockfile_lines) + "\n")
+    for number in range(num_files):
+        body = "".join(f"    total += {line}\n" for line in range(20))
+        (repo_dir / f"feature{number}.py").write_text(
+            f"import logging\n\n\ndef feature_{number}(total):\n{body}    return total\n"
+        )
+    commit_all(repo_dir)
+
+    for number in range(0, len(lockfile_lines), 3):
+        lockfile_lines[number] = lockfile_lines[number].replace("1.0.", "1.1.")
+    (repo_dir / "package-lock.json").write_text("\n".join(lockfile_lines) + "\n")
+    for number in range(num_files):
+        lines = [f"    total += {line}\n" for line in range(20)]
+        if number % 3 == 0:
+            # Reformatting only
+            lines[10] = "    total  +=  10\n"
+        elif number % 3 == 1:
+            # The same edit in many files
+            lines[19] = "    logging.info(total)\n"
+        else:
+            lines[10] = f"    total += {number} * 10\n"
+        (repo_dir / f"feature{number}.py").write_text(
+            f"import logging\n\n\ndef feature_{number}(total):\n{''.join(lines)}    return total\n"
+        )
+
+
+SCENARIOS: Dict[str, Callable[[Path, int], None]] = {
+    "many_small_files": many_small_files,
+    "huge_file": huge_file,
+    "binary_mode_heavy": binary_mode_heavy,
+    "million_lines": million_lines,
+    "mixed_changes": mixed_changes,
+}
+
+
+def create_scenario_repo(repo_dir: Path, scenario: str, scale: int = 1):
+    """Create a repository in `repo_dir` with the unstaged changes of `scenario`."""
+    git(repo_dir, "init", "-q")
+    git(repo_dir, "config", "core.fileMode", "true")
+    SCENARIOS[scenario](repo_dir, scale)
@@ -0,0 +1,230 @@
+from commit_suggestions.backends import LLMBackend, create_backend
+from commit_suggestions.cache import ResponseCache, can_cache
+from commit_suggestions.config import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MODEL,
+    DEFAULT_TOKEN_BUDGET,
+)
+from commit_suggestions.diff_collection import (
+    iter_parallel_hunks,
+    parse_diff_output,
+    run_git,
+)
+from commit_suggestions.llm import (
+    generate_commit_suggestions,
+    generate_commit_suggestions_async,
+    prepare_generation,
+)
+from commit_suggestions.hunk_splitting import iter_split_hunks
+from commit_suggestions.models import (
+    BackendConfig,
+    CommitSuggestions,
+    Hunks,
+    PromptEncoding,
+    TokenUsage,
+)
+from commit_suggestions.pipeline import run_git_async
+from commit_suggestions.utils import (
+    get_snippets_from_hunks,
+    iter_git_diff_lines,
+    iter_hunks,
+)
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import subprocess
+
+
+def get_git_dir(repo_dir: str) -> str:
+    """Get the absolute path of a repository's `.git` directory."""
+    return run_git(repo_dir, ["rev-parse", "--absolute-git-dir"]).decode().strip()
+
+
+def get_hunks(
+    repo_dir: str = ".",
+    split_hunks: bool = False,
+    diff_workers: Optional[int] = None,
+) -> Hunks:
+    """Parse the unstaged changes of a repository into hunks."""
+    if diff_workers:
+        diff_hunks = iter_parallel_hunks(repo_dir, diff_workers)
+    else:
+        diff_hunks = iter_hunks(iter_git_diff_lines(repo_dir))
+    if split_hunks:
+        diff_hunks = iter_split_hunks(diff_hunks)
+    return Hunks(hunks=list(diff_hunks))
+
+
+def suggest_commits(
+    repo_dir: str = ".",
+    hunks: Optional[Hunks] = None,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    use_cache: bool = True,
+    usage: Optional[TokenUsage] = None,
+    encoding: Optional[PromptEncoding] = None,
+    pre_group: bool = False,
+    backend_config: Optional[BackendConfig] = None,
+) -> Optional[CommitSuggestions]:
+    """Suggest commits for a repository's `hunks`, which are parsed with `get_hunks` if not given.
+
+    Returns None if the model couldn't answer.
+    """
+    if hunks is None:
+        hunks = get_hunks(repo_dir)
+    return generate_commit_suggestions(
+        get_snippets_from_hunks(hunks),
+        model=model,
+        token_budget=token_budget,
+        concurrency=concurrency,
+        cache=ResponseCache.for_git_dir(get_git_dir(repo_dir)) if use_cache else None,
+        usage=usage,
+        encoding=encoding or PromptEncoding(),
+        pre_group=pre_group,
+        backend_config=backend_config,
+    )
+
+
+async def read_git_diff_async(repo_dir: str) -> bytes:
+    """Capture the output of `git diff` without blocking the event loop."""
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        "diff",
+        cwd=repo_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode("utf-8", "replace").strip())
+    return stdout
+
+
+class RepoState:
+    """The last diff parsed for a repository, and the suggestions made for it."""
+
+    __slots__ = ("git_dir", "diff_digest", "hunks", "suggestions", "lock")
+
+    def __init__(self, git_dir: str):
+        self.git_dir = git_dir
+        self.diff_digest = ""
+        self.hunks = Hunks(hunks=[])
+        self.suggestions: Optional[CommitSuggestions] = None
+        # Requests for the same repository wait for each other instead of parsing twice
+        self.lock = asyncio.Lock()
+
+
+class SuggestionSession:
+    """Keeps a model backend, response caches, and each repository's parsed diff warm across requests.
+
+    This is what the daemon serves from. Use it as an async context manager inside a single
+    event loop. A request for a repository whose diff hasn't changed is answered from memory
+    after one `git diff` call.
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        use_cache: bool = True,
+        encoding: Optional[PromptEncoding] = None,
+        pre_group: bool = False,
+        backend_config: Optional[BackendConfig] = None,
+    ):
+        self.model = model
+        self.token_budget = token_budget
+        self.concurrency = concurrency
+        self.use_cache = use_cache and can_cache(backend_config)
+        self.encoding = encoding or PromptEncoding()
+        self.pre_group = pre_group
+        self.backend_config = backend_config
+        self.backend: Optional[LLMBackend] = None
+        self.usage = TokenUsage()
+        self.repos: Dict[str, RepoState] = {}
+
+    async def __aenter__(self) -> "SuggestionSession":
+        # The client and its pool of connections are reused by every request
+        self.backend = create_backend(self.backend_config, self.concurrency)
+        await self.backend.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.backend is not None:
+            await self.backend.__aexit__(*exc_info)
+            self.backend = None
+
+    async def _get_repo_state(self, repo_dir: str) -> RepoState:
+        repo_dir = os.path.realpath(repo_dir)
+        state = self.repos.get(repo_dir)
+        if state is None:
+            return_code, git_dir, error = await run_git_async(
+                repo_dir, "rev-parse", "--absolute-git-dir"
+            )
+            if return_code != 0:
+                raise RuntimeError(error)
+            # Another request may have added it while git was running
+            state = self.repos.setdefault(repo_dir, RepoState(git_dir))
+        return state
+
+    async def _refresh(self, repo_dir: str, state: RepoState) -> bool:
+        """Parse the repository's diff again if it changed, returning whether it did."""
+        diff_bytes = await read_git_diff_async(repo_dir)
+        diff_digest = hashlib.sha256(diff_bytes).hexdigest()
+        if diff_digest == state.diff_digest:
+            return False
+        state.diff_digest = diff_digest
+        state.hunks = Hunks(hunks=parse_diff_output(diff_bytes))
+        state.suggestions = None
+        return True
+
+    async def get_hunks(self, repo_dir: str = ".") -> Hunks:
+        """Get the hunks of a repository's unstaged changes, parsing the diff only if it changed."""
+        state = await self._get_repo_state(repo_dir)
+        async with state.lock:
+            await self._refresh(repo_dir, state)
+            return state.hunks
+
+    async def suggest_commits(
+        self, repo_dir: str = "."
+    ) -> Tuple[Hunks, Optional[CommitSuggestions]]:
+        """Get the hunks of a repository and the commits suggested for them.
+
+        The suggestions are reused until the diff changes. The suggestions are None if the
+        model couldn't answer.
+        """
+        state = await self._get_repo_state(repo_dir)
+        async with state.lock:
+            await self._refresh(repo_dir, state)
+            if state.suggestions is None and not state.hunks.hunks:
+                state.suggestions = CommitSuggestions(commit_suggestions=[])
+            elif state.suggestions is None:
+                if self.backend is None:
+                    raise RuntimeError("The session must be entered with `async with`")
+                modified_code_snippets = get_snippets_from_hunks(state.hunks)
+                cache, groups, state.suggestions = prepare_generation(
+                    modified_code_snippets,
+                    model=self.model,
+                    token_budget=self.token_budget,
+                    cache=ResponseCache.for_git_dir(state.git_dir)
+                    if self.use_cache
+                    else None,
+                    encoding=self.encoding,
+                    pre_group=self.pre_group,
+                    backend_config=self.backend_config,
+                )
+                if state.suggestions is None:
+                    state.suggestions = await generate_commit_suggestions_async(
+                        self.backend,
+                        modified_code_snippets,
+                        model=self.model,
+                        token_budget=self.token_budget,
+                        concurrency=self.concurrency,
+                        cache=cache,
+                        usage=self.usage,
+                        encoding=self.encoding,
+                        groups=groups,
+                    )
+            return state.hunks, state.suggestions
@@ -0,0 +1,208 @@
+from commit_suggestions.config import DEFAULT_CONCURRENCY
+from commit_suggestions.grouping import suggest_commits_offline
+from commit_suggestions.models import (
+    BackendConfig,
+    CommitSuggestion,
+    CommitSuggestions,
+    ModifiedCodeSnippets,
+    TokenUsage,
+)
+from commit_suggestions.prompt_encoding import estimate_tokens
+from commit_suggestions.streaming import SuggestionStreamParser
+from abc import ABC, abstractmethod
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import httpx
+import os
+
+# Idle connections are kept open this long so later batches can reuse them
+KEEPALIVE_SECONDS = 30.0
+
+Messages = List[Dict[str, str]]
+
+
+class LLMBackend(ABC):
+    """Answers a single request for commit suggestions.
+
+    Backends are async context managers, and hold their connections until they are closed.
+    """
+
+    @abstractmethod
+    async def complete(
+        self,
+        modified_code_snippets: ModifiedCodeSnippets,
+        messages: Messages,
+        model: str,
+    ) -> Tuple[Optional[CommitSuggestions], Optional[Any]]:
+        """Get the suggestions for the snippets (encoded in `messages`) and the token usage, if known."""
+
+    async def stream(
+        self,
+        modified_code_snippets: ModifiedCodeSnippets,
+        messages: Messages,
+        model: str,
+        usage: Optional[TokenUsage] = None,
+    ) -> AsyncIterator[CommitSuggestion]:
+        """Yield each suggestion as soon as it is complete, adding the token usage to `usage` at the end.
+
+        Backends that can't stream answer all at once.
+        """
+        commit_suggestions, completion_usage = await self.complete(
+            modified_code_snippets, messages, model
+        )
+        if usage is not None and completion_usage is not None:
+            usage.add(completion_usage)
+        if commit_suggestions is not None:
+            for commit_suggestion in commit_suggestions.commit_suggestions:
+                yield commit_suggestion
+
+    async def aclose(self):
+        pass
+
+    async def __aenter__(self) -> "LLMBackend":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+class OpenAIBackend(LLMBackend):
+    """Uses structured outputs of the OpenAI API, or of any server compatible with it at `base_url`."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_connections: int = DEFAULT_CONCURRENCY,
+        client: Optional[AsyncOpenAI] = None,
+    ):
+        self.base_url = base_url
+        if client is None:
+            # One pool of keep-alive connections is shared by every batch
+            client = AsyncOpenAI(
+                base_url=base_url,
+                # Local servers usually don't check the key, but the client needs one
+                api_key=os.environ.get("OPENAI_API_KEY")
+                or (None if base_url is None else "unused"),
+                # Retries are handled by `request_commit_suggestions`
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_connections,
+                        keepalive_expiry=KEEPALIVE_SECONDS,
+                    )
+                ),
+            )
+        self.client = client
+
+    async def complete(
+        self,
+        modified_code_snippets: ModifiedCodeSnippets,
+        messages: Messages,
+        model: str,
+    ) -> Tuple[Optional[CommitSuggestions], Optional[Any]]:
+        completion = await self.client.beta.chat.completions.parse(
+            model=model,
+            # Only OpenAI itself knows about stored completions
+            store=self.base_url is None,
+            messages=messages,
+            response_format=CommitSuggestions,
+        )
+        return completion.choices[0].message.parsed, getattr(completion, "usage", None)
+
+    async def stream(
+        self,
+        modified_code_snippets: ModifiedCodeSnippets,
+        messages: Messages,
+        model: str,
+        usage: Optional[TokenUsage] = None,
+    ) -> AsyncIterator[CommitSuggestion]:
+        parser = SuggestionStreamParser()
+        async with self.client.beta.chat.completions.stream(
+            model=model,
+            store=self.base_url is None,
+            messages=messages,
+            response_format=CommitSuggestions,
+            stream_options={"include_usage": True},
+        ) as completion_stream:
+            async for event in completion_stream:
+                if event.type == "content.delta":
+                    for commit_suggestion in parser.feed(event.delta):
+                        yield commit_suggestion
+            completion = await completion_stream.get_final_completion()
+        if usage is not None and completion.usage is not None:
+            usage.add(completion.usage)
+
+    async def aclose(self):
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+
+class StubBackend(LLMBackend):
+    """Answers without a network, suggesting one commit per local group of snippets after `latency` seconds.
+
+    The answers only depend on the snippets, so runs are repeatable.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+
+    async def complete(
+        self,
+        modified_code_snippets: ModifiedCodeSnippets,
+        messages: Messages,
+        model: str,
+    ) -> Tuple[Optional[CommitSuggestions], Optional[Any]]:
+        self.requests += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        commit_suggestions = suggest_commits_offline(modified_code_snippets)
+        return commit_suggestions, self.estimate_usage(messages, commit_suggestions)
+
+    async def stream(
+        self,
+        modified_code_snippets: ModifiedCodeSnippets,
+        messages: Messages,
+        model: str,
+        usage: Optional[TokenUsage] = None,
+    ) -> AsyncIterator[CommitSuggestion]:
+        self.requests += 1
+        commit_suggestions = suggest_commits_offline(modified_code_snippets)
+        # Spread the latency over the suggestions like a model generating them one by one
+        num_suggestions = max(len(commit_suggestions.commit_suggestions), 1)
+        for commit_suggestion in commit_suggestions.commit_suggestions:
+            if self.latency > 0:
+                await asyncio.sleep(self.latency / num_suggestions)
+            yield commit_suggestion
+        if usage is not None:
+            usage.add(self.estimate_usage(messages, commit_suggestions))
+
+    @staticmethod
+    def estimate_usage(
+        messages: Messages, commit_suggestions: CommitSuggestions
+    ) -> TokenUsage:
+        """Estimate the tokens a model would have used."""
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        completion_tokens = estimate_tokens(commit_suggestions.model_dump_json())
+        return TokenUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+
+
+def create_backend(
+    config: Optional[BackendConfig] = None,
+    max_connections: int = DEFAULT_CONCURRENCY,
+) -> LLMBackend:
+    """Create the backend described by `config`. This must run inside the event loop that uses it."""
+    if config is None:
+        config = BackendConfig()
+    if config.provider == "stub":
+        return StubBackend(latency=config.latency)
+    if config.provider == "openai":
+        return OpenAIBackend(base_url=config.base_url, max_connections=max_connections)
+    raise ValueError(f"Unknown backend: {config.provider}")
@@ -0,0 +1,187 @@
+from commit_suggestions.cache import ResponseCache
+from commit_suggestions.config import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MODEL,
+    DEFAULT_TOKEN_BUDGET,
+)
+from commit_suggestions.diff_collection import iter_parallel_hunks
+from commit_suggestions.grouping import OFFLINE_MODEL, suggest_commits_offline
+from commit_suggestions.hunk_index import HunkIndex
+from commit_suggestions.hunk_splitting import iter_split_hunks
+from commit_suggestions.incremental import generate_incrementally, get_state_path
+from commit_suggestions.llm import generate_commit_suggestions
+from commit_suggestions.models import (
+    BackendConfig,
+    BatchReport,
+    CommitResult,
+    HunkMapping,
+    Hunks,
+    ModifiedCodeSnippets,
+    PromptEncoding,
+)
+from commit_suggestions.pipeline import run_pipeline
+from commit_suggestions.staging import (
+    InProcessStagingBackend,
+    StagingBackend,
+    SubprocessStagingBackend,
+    TransactionStagingBackend,
+)
+from commit_suggestions.utils import (
+    get_snippet_from_hunk,
+    iter_git_diff_lines,
+    iter_hunks,
+)
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from git import Repo
+from typing import List, Optional, Sequence
+import asyncio
+import time
+
+
+def run_batch(
+    repo_dir: str,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    use_cache: bool = True,
+    incremental: bool = False,
+    staging: str = "subprocess",
+    encoding: Optional[PromptEncoding] = None,
+    pre_group: bool = False,
+    offline: bool = False,
+    backend_config: Optional[BackendConfig] = None,
+    diff_workers: Optional[int] = None,
+    split_hunks: bool = False,
+    async_pipeline: bool = False,
+) -> BatchReport:
+    """Parse, generate, and apply every commit suggestion for a repository without prompting.
+
+    `async_pipeline` runs the stages overlapped in one event loop (see `pipeline.run_pipeline`),
+    which stages with the git CLI and doesn't support the incremental, grouping, offline,
+    or parallel diff options.
+    """
+    if async_pipeline:
+        return asyncio.run(
+            run_pipeline(
+                repo_dir,
+                model=model,
+                token_budget=token_budget,
+                concurrency=concurrency,
+                use_cache=use_cache,
+                encoding=encoding,
+                backend_config=backend_config,
+                split_hunks=split_hunks,
+            )
+        )
+    report = BatchReport(repo=repo_dir)
+    run_start = time.perf_counter()
+    staging_backend: Optional[StagingBackend] = None
+    try:
+        repo = Repo(repo_dir)
+
+        # Parse the diff into hunks and snippets
+        start = time.perf_counter()
+        hunks = Hunks(hunks=[])
+        hunk_index = HunkIndex()
+        modified_code_snippets = ModifiedCodeSnippets(modified_code_snippets=[])
+        if diff_workers:
+            diff_hunks = iter_parallel_hunks(repo.working_dir, diff_workers)
+        else:
+            diff_hunks = iter_hunks(iter_git_diff_lines(repo.working_dir))
+        if split_hunks:
+            diff_hunks = iter_split_hunks(diff_hunks)
+        for hunk in diff_hunks:
+            hunks.hunks.append(hunk)
+            modified_code_snippets.modified_code_snippets.append(
+                get_snippet_from_hunk(hunk, hunk_index.add(hunk))
+            )
+        report.timings["parse"] = time.perf_counter() - start
+        report.hunks = [
+            HunkMapping(
+                index=metadata.index,
+                filename=metadata.path,
+                start_line=metadata.new_start,
+                end_line=metadata.new_start + metadata.new_length,
+            )
+            for metadata in hunk_index
+        ]
+        if not hunks.hunks:
+            return report
+
+        # Ask the model for commit suggestions
+        start = time.perf_counter()
+        generate = partial(
+            generate_commit_suggestions,
+            model=model,
+            token_budget=token_budget,
+            concurrency=concurrency,
+            cache=ResponseCache.for_git_dir(repo.git_dir) if use_cache else None,
+            usage=report.usage,
+            encoding=encoding or PromptEncoding(),
+            pre_group=pre_group,
+            backend_config=backend_config,
+        )
+        if offline:
+            generate = suggest_commits_offline
+        if incremental:
+            report.suggestions = generate_incrementally(
+                modified_code_snippets,
+                get_state_path(repo.git_dir),
+                OFFLINE_MODEL if offline else model,
+                generate,
+            )
+        else:
+            report.suggestions = generate(modified_code_snippets)
+        report.timings["generate"] = time.perf_counter() - start
+        if report.suggestions is None:
+            report.error = "There was an error generating suggestions"
+            return report
+
+        # Stage and commit every suggestion
+        start = time.perf_counter()
+        if staging == "in-process":
+            staging_backend = InProcessStagingBackend(repo, quiet=True)
+        elif staging == "transaction":
+            staging_backend = TransactionStagingBackend(repo.working_dir, quiet=True)
+        else:
+            staging_backend = SubprocessStagingBackend(repo.working_dir, quiet=True)
+        for commit_suggestion in report.suggestions.commit_suggestions:
+            staging_result = staging_backend.stage(
+                hunks, commit_suggestion.code_snippet_indices, hunk_index
+            )
+            committed = bool(staging_result.staged_indices) and staging_backend.commit(
+                commit_suggestion.message
+            )
+            report.commits.append(
+                CommitResult(
+                    message=commit_suggestion.message,
+                    code_snippet_indices=commit_suggestion.code_snippet_indices,
+                    staging_result=staging_result,
+                    committed=committed,
+                )
+            )
+        if not staging_backend.finish():
+            report.error = "HEAD moved while committing, so no commits were made"
+            for commit_result in report.commits:
+                commit_result.committed = False
+        report.timings["apply"] = time.perf_counter() - start
+    except Exception as error:
+        # One broken repository shouldn't stop the others
+        report.error = f"{type(error).__name__}: {error}"
+        if staging_backend is not None:
+            staging_backend.abort()
+    finally:
+        report.timings["total"] = time.perf_counter() - run_start
+    return report
+
+
+def run_batches(
+    repo_dirs: Sequence[str], workers: Optional[int] = None, **batch_options
+) -> List[BatchReport]:
+    """Run batch mode over many repositories in a process pool, returning reports in input order."""
+    if len(repo_dirs) == 1:
+        return [run_batch(repo_dirs[0], **batch_options)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(partial(run_batch, **batch_options), repo_dirs))
@@ -0,0 +1,110 @@
+from commit_suggestions.models import (
+    BackendConfig,
+    CommitSuggestions,
+    ModifiedCodeSnippets,
+)
+from pydantic import ValidationError
+from typing import Optional
+import hashlib
+import json
+import os
+import tempfile
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def can_cache(backend_config: Optional[BackendConfig]) -> bool:
+    """Check if answers of the backend in `backend_config` (OpenAI by default) may be cached."""
+    # Stub answers must never be mixed up with real ones
+    return backend_config is None or backend_config.provider != "stub"
+
+
+class ResponseCache:
+    """An on-disk cache of commit suggestions, evicting the least recently used entries."""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def for_git_dir(cls, git_dir: str, **kwargs) -> "ResponseCache":
+        """Create a cache stored inside a repository's `.git` directory."""
+        return cls(os.path.join(git_dir, "commit-suggestions", "cache"), **kwargs)
+
+    @staticmethod
+    def key(
+        modified_code_snippets: ModifiedCodeSnippets, prompt: str, model: str
+    ) -> str:
+        """Hash the normalized snippet payload together with the prompt and model."""
+        payload = json.dumps(
+            {
+                "model": model,
+                "prompt": prompt,
+                "snippets": modified_code_snippets.model_dump(),
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[CommitSuggestions]:
+        """Return the cached suggestions for `key`, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                commit_suggestions = CommitSuggestions.model_validate_json(
+                    cache_file.read()
+                )
+        except (OSError, ValidationError):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return commit_suggestions
+
+    def put(self, key: str, commit_suggestions: CommitSuggestions):
+        """Store suggestions for `key` and evict old entries if the cache is too big."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial entry
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(file_descriptor, "w") as cache_file:
+            cache_file.write(commit_suggestions.model_dump_json())
+        os.replace(temp_path, self._path(key))
+
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache is within its limits."""
+        entries = []
+        with os.scandir(self.cache_dir) as dir_entries:
+            for entry in dir_entries:
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        # Oldest entries come first
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (
+            len(entries) > self.max_entries or total_bytes > self.max_bytes
+        ):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
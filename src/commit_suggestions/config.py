@@ -0,0 +1,23 @@
+"""Defaults shared by the command line and the library.
+
+This module must stay free of heavy imports since the entry point reads it on every run.
+"""
+
+import argparse
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_TOKEN_BUDGET = 30_000
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 1.0
+
+
+def positive_int(value: str) -> int:
+    """Parse a command line count that must be at least 1, like a concurrency or token budget."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
@@ -0,0 +1,230 @@
+"""A long-lived server that keeps suggestions warm for git hooks and editors.
+
+Usage:
+    python -m commit_suggestions.daemon serve [--socket PATH] [--backend stub]
+    python -m commit_suggestions.daemon suggest [--repo PATH]
+
+Requests and responses are single lines of JSON over a Unix socket. The client side only
+uses the standard library, so a hook pays for little more than interpreter startup.
+"""
+
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+import argparse
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+
+if TYPE_CHECKING:
+    import asyncio
+    from commit_suggestions.api import SuggestionSession
+
+COMMANDS = ["ping", "hunks", "suggest", "stop"]
+
+
+def get_default_socket_path() -> str:
+    """Get the socket path of the current user's daemon, inside a directory only they can use."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"commit-suggestions-{os.getuid()}", "daemon.sock")
+
+
+def create_private_dir(path: str):
+    """Create a directory only the current user can access, refusing one someone else could have made."""
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    # Don't follow symlinks, since the directory may be in a shared one like /tmp
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise RuntimeError(f"{path} must be a directory only you can access")
+
+
+def send_request(
+    request: Dict[str, Any],
+    socket_path: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Send one request to the daemon and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path or get_default_socket_path())
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        # Closing our side tells the daemon there are no more requests
+        client.shutdown(socket.SHUT_WR)
+        chunks: List[bytes] = []
+        while chunk := client.recv(1 << 16):
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+
+async def handle_request(
+    session: "SuggestionSession", request: Dict[str, Any], stopped: "asyncio.Event"
+) -> Dict[str, Any]:
+    """Answer a single request. Errors are returned instead of raised, so the daemon keeps running."""
+    command = request.get("command")
+    repo_dir = request.get("repo", ".")
+    try:
+        if command == "ping":
+            return {"ok": True}
+        if command == "hunks":
+            hunks = await session.get_hunks(repo_dir)
+            return {"hunks": hunks.model_dump(mode="json")["hunks"]}
+        if command == "suggest":
+            hunks, suggestions = await session.suggest_commits(repo_dir)
+            if suggestions is None:
+                return {"error": "There was an error generating suggestions"}
+            return {
+                "hunks": hunks.model_dump(mode="json")["hunks"],
+                "suggestions": suggestions.model_dump(mode="json"),
+            }
+        if command == "stop":
+            stopped.set()
+            return {"ok": True}
+        return {"error": f"Unknown command: {command}"}
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+
+
+def remove_stale_socket(socket_path: str):
+    """Remove a socket left behind by a daemon that is gone, refusing to replace a live one."""
+    if not os.path.exists(socket_path):
+        return
+    try:
+        send_request({"command": "ping"}, socket_path, timeout=1.0)
+    except OSError:
+        os.remove(socket_path)
+        return
+    raise RuntimeError(f"A daemon is already listening on {socket_path}")
+
+
+async def serve(
+    session: "SuggestionSession",
+    socket_path: Optional[str] = None,
+    started: Optional["asyncio.Event"] = None,
+):
+    """Serve requests from `session` on a Unix socket until a `stop` request arrives.
+
+    `started` is set once the socket accepts connections.
+    """
+    import asyncio
+
+    if socket_path is None:
+        socket_path = get_default_socket_path()
+        create_private_dir(os.path.dirname(socket_path))
+    remove_stale_socket(socket_path)
+    stopped = asyncio.Event()
+
+    async def handle_connection(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as error:
+                    response = {"error": f"Invalid request: {error}"}
+                else:
+                    response = await handle_request(session, request, stopped)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async with session:
+        # The socket hands out the diffs of your repositories to anyone who can connect
+        # to it, so it is created accessible only to you rather than fixed up afterwards
+        umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(
+                handle_connection, path=socket_path
+            )
+        finally:
+            os.umask(umask)
+        try:
+            if started is not None:
+                started.set()
+            async with server:
+                await stopped.wait()
+        finally:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    from commit_suggestions.config import (
+        DEFAULT_CONCURRENCY,
+        DEFAULT_MODEL,
+        DEFAULT_TOKEN_BUDGET,
+        positive_int,
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="commit-suggestions-daemon",
+        description="Keep commit suggestions warm for git hooks and editors.",
+    )
+    parser.add_argument("command", choices=["serve", *COMMANDS])
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Unix socket the daemon listens on (defaults to one per user)",
+    )
+    parser.add_argument(
+        "--repo", default=".", help="Repository to ask about (client commands)"
+    )
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument(
+        "--token-budget", type=positive_int, default=DEFAULT_TOKEN_BUDGET
+    )
+    parser.add_argument("--concurrency", type=positive_int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--compact-prompt", action="store_true")
+    parser.add_argument("--pre-group", action="store_true")
+    parser.add_argument("--backend", choices=["openai", "stub"], default="openai")
+    parser.add_argument("--base-url", default=None)
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.command != "serve":
+        try:
+            response = send_request(
+                {"command": args.command, "repo": os.path.abspath(args.repo)},
+                args.socket,
+            )
+        except OSError as error:
+            print(f"The daemon isn't running: {error}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(response, indent=2))
+        if "error" in response:
+            sys.exit(1)
+        return
+
+    import asyncio
+    from commit_suggestions.api import SuggestionSession
+    from commit_suggestions.models import BackendConfig, PromptEncoding
+
+    session = SuggestionSession(
+        model=args.model,
+        token_budget=args.token_budget,
+        concurrency=args.concurrency,
+        use_cache=not args.no_cache,
+        encoding=PromptEncoding(compact=args.compact_prompt),
+        pre_group=args.pre_group,
+        backend_config=BackendConfig(
+            provider=args.backend, base_url=args.base_url, latency=args.stub_latency
+        ),
+    )
+    asyncio.run(serve(session, args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from commit_suggestions.models import Hunk
+from commit_suggestions.utils import iter_hunks
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+import io
+import math
+import os
+import subprocess
+
+# Shards smaller than this aren't worth a process of their own
+MIN_SHARD_SIZE = 64
+
+# Paths are passed on the command line, which has a length limit
+MAX_SHARD_SIZE = 2000
+
+# More shards than workers, so one slow shard doesn't hold up the others
+SHARDS_PER_WORKER = 4
+
+
+def run_git(repo_dir: str, args: List[str]) -> bytes:
+    # Paths are passed as they are, never as glob patterns
+    return subprocess.run(
+        ["git", "--literal-pathspecs", *args],
+        cwd=repo_dir,
+        capture_output=True,
+        check=True,
+    ).stdout
+
+
+def list_changes(repo_dir: str) -> List[List[str]]:
+    """List the paths of each unstaged change, in the order `git diff` shows them.
+
+    Renames and copies list both of their paths, so they can be diffed together.
+    """
+    output = run_git(repo_dir, ["diff", "--name-status", "-z"])
+    fields = [
+        field
+        for field in output.decode("utf-8", "surrogateescape").split("\0")
+        if field
+    ]
+    changes: List[List[str]] = []
+    # A copy's source can also be changed itself, so changes sharing a path are merged
+    change_of_path: Dict[str, List[str]] = {}
+    position = 0
+    while position < len(fields):
+        status = fields[position]
+        path_count = 2 if status[0] in "RC" else 1
+        paths = fields[position + 1 : position + 1 + path_count]
+        position += 1 + path_count
+        change = next(
+            (change_of_path[path] for path in paths if path in change_of_path), None
+        )
+        if change is None:
+            change = []
+            changes.append(change)
+        for path in paths:
+            if path not in change_of_path:
+                change.append(path)
+                change_of_path[path] = change
+    return changes
+
+
+def shard_changes(
+    changes: List[List[str]], workers: int, min_shard_size: int = MIN_SHARD_SIZE
+) -> List[List[str]]:
+    """Split changes into contiguous shards of paths, so concatenating the shards' diffs keeps `git diff`'s order.
+
+    All paths of a change go in the same shard, so `git diff` still finds renames.
+    """
+    if not changes:
+        return []
+    num_paths = sum(len(paths) for paths in changes)
+    num_shards = max(
+        min(workers * SHARDS_PER_WORKER, len(changes) // min_shard_size),
+        math.ceil(num_paths / MAX_SHARD_SIZE),
+        1,
+    )
+    shard_size = math.ceil(len(changes) / num_shards)
+    return [
+        [path for paths in changes[start : start + shard_size] for path in paths]
+        for start in range(0, len(changes), shard_size)
+    ]
+
+
+def parse_diff_output(diff_bytes: bytes) -> List[Hunk]:
+    """Parse the captured output of `git diff` into hunks."""
+    # Read lines the same way `iter_git_diff_lines` does, so hunks match a streamed `git diff`
+    diff_lines = io.StringIO(diff_bytes.decode("utf-8", "replace"), newline=None)
+    return list(iter_hunks(line.rstrip("\n") for line in diff_lines))
+
+
+def diff_shard(repo_dir: str, paths: List[str]) -> List[Hunk]:
+    """Run `git diff` on one shard of paths and parse it. This runs in a worker process."""
+    return parse_diff_output(run_git(repo_dir, ["diff", "--", *paths]))
+
+
+def iter_parallel_hunks(
+    repo_dir: str,
+    workers: Optional[int] = None,
+    min_shard_size: int = MIN_SHARD_SIZE,
+) -> Iterator[Hunk]:
+    """Yield the hunks of `git diff`, diffing and parsing shards of the changed paths in a process pool.
+
+    Both paths of a rename or copy are diffed together, so `git diff` still pairs them. Hunks
+    come out in the order of a single `git diff`, except that a copy of a file that changed
+    too follows its source. Small diffs are collected in one call, since starting processes
+    would cost more than it saves.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    shards = shard_changes(list_changes(repo_dir), workers, min_shard_size)
+    if len(shards) <= 1 or workers <= 1:
+        for shard in shards:
+            yield from diff_shard(repo_dir, shard)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+        # `map` returns shards in order while later ones are still being diffed
+        for shard_hunks in executor.map(diff_shard, [repo_dir] * len(shards), shards):
+            yield from shard_hunks
@@ -0,0 +1,323 @@
+from commit_suggestions.models import (
+    CommitSuggestion,
+    CommitSuggestions,
+    ModifiedCodeSnippet,
+    ModifiedCodeSnippets,
+)
+from commit_suggestions.prompt_encoding import is_generated_file, is_whitespace_only
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+import hashlib
+import keyword
+import os
+import re
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+
+# Words too common in changed lines to say two hunks are related
+COMMON_WORDS = frozenset(
+    [
+        *keyword.kwlist,
+        "self",
+        "cls",
+        "this",
+        "true",
+        "false",
+        "null",
+        "nil",
+        "none",
+        "var",
+        "let",
+        "const",
+        "function",
+        "func",
+        "int",
+        "str",
+        "string",
+        "bool",
+        "void",
+        "public",
+        "private",
+        "static",
+        "new",
+        "print",
+        "len",
+        "the",
+        "and",
+        "for",
+    ]
+)
+
+TEST_FILE_PATTERNS = (
+    re.compile(r"^test_(?P<stem>.+)$"),
+    re.compile(r"^(?P<stem>.+?)(?:_test|_tests|_spec|\.test|\.spec|Test|Tests)$"),
+)
+
+TEST_DIRECTORIES = frozenset(["test", "tests", "__tests__", "spec"])
+
+# MinHash signatures use one hash per token, split into bins (one permutation hashing)
+NUM_BINS = 16
+ROWS_PER_BAND = 2
+EMPTY_BIN = 1 << 64
+EMPTY_BAND = (EMPTY_BIN,) * ROWS_PER_BAND
+DEFAULT_THRESHOLD = 0.5
+
+# Stands in for the model name of offline suggestions, e.g. in the incremental state
+OFFLINE_MODEL = "offline"
+
+
+def changed_lines(modified_code: str) -> Iterable[str]:
+    """Get the added and removed lines of a snippet, without their markers."""
+    for line in modified_code.split("\n"):
+        if line[:1] in ("+", "-"):
+            yield line[1:]
+
+
+def extract_identifiers(modified_code: str) -> FrozenSet[str]:
+    """Get the identifiers used in the changed lines of a snippet."""
+    return frozenset(
+        identifier
+        for identifier in IDENTIFIER_PATTERN.findall(
+            "\n".join(changed_lines(modified_code))
+        )
+        if identifier.lower() not in COMMON_WORDS
+    )
+
+
+def get_test_subject(basename: str) -> Tuple[str, bool]:
+    """Get the name a file is about and whether its name marks it as a test.
+
+    `parser.py`, `test_parser.py`, `parser_test.py`, and `parser.test.ts` are all about `parser`.
+    """
+    name = basename.rsplit(".", 1)[0] if "." in basename[1:] else basename
+    for pattern in TEST_FILE_PATTERNS:
+        match = pattern.match(name)
+        if match is not None:
+            return match.group("stem").split(".", 1)[0], True
+    return name.split(".", 1)[0] or name, False
+
+
+def is_test_file(filename: str) -> bool:
+    """Check if a file holds tests, by its directory or name."""
+    directory, basename = os.path.split(filename)
+    if TEST_DIRECTORIES.intersection(directory.split("/")):
+        return True
+    return get_test_subject(basename)[1]
+
+
+def path_tokens(filename: str) -> FrozenSet[str]:
+    """Tokens for the directory and subject of a file, so nearby files share tokens."""
+    directory, basename = os.path.split(filename)
+    subject, _ = get_test_subject(basename)
+    return frozenset([f"dir:{directory}", f"subject:{subject}"])
+
+
+class UnionFind:
+    """Disjoint sets of hunk indices."""
+
+    def __init__(self, size: int):
+        self.parents = list(range(size))
+
+    def find(self, item: int) -> int:
+        root = item
+        while self.parents[root] != root:
+            root = self.parents[root]
+        # Point everything on the way straight at the root
+        while self.parents[item] != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, first: int, second: int):
+        first_root, second_root = self.find(first), self.find(second)
+        if first_root != second_root:
+            # The smaller index stays the root so groups are ordered by their first hunk
+            self.parents[max(first_root, second_root)] = min(first_root, second_root)
+
+    def groups(self) -> List[List[int]]:
+        groups: Dict[int, List[int]] = {}
+        for item in range(len(self.parents)):
+            groups.setdefault(self.find(item), []).append(item)
+        return list(groups.values())
+
+
+def minhash_bands(
+    tokens: FrozenSet[str], token_bins: Dict[str, Tuple[int, int]]
+) -> List[Tuple[int, ...]]:
+    """Get the LSH band keys of a token set's MinHash signature.
+
+    Each token is hashed once (and cached in `token_bins`) and lands in one of `NUM_BINS`
+    bins, keeping the minimum per bin, so similar token sets share bands with high probability.
+    """
+    signature = [EMPTY_BIN] * NUM_BINS
+    for token in tokens:
+        token_bin = token_bins.get(token)
+        if token_bin is None:
+            token_hash = int.from_bytes(
+                hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big"
+            )
+            token_bin = token_bins[token] = divmod(token_hash, NUM_BINS)
+        value, bin_index = token_bin
+        if value < signature[bin_index]:
+            signature[bin_index] = value
+
+    # Bands with only empty bins would match every small token set
+    return [
+        (band_index, *band)
+        for band_index in range(0, NUM_BINS, ROWS_PER_BAND)
+        if (band := tuple(signature[band_index : band_index + ROWS_PER_BAND]))
+        != EMPTY_BAND
+    ]
+
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+def is_deleted_file(snippet: ModifiedCodeSnippet) -> bool:
+    """Check if a snippet deletes a whole file (nothing is left of it in the new file)."""
+    if snippet.file_change is not None:
+        return snippet.file_change == "deleted"
+    return snippet.start_line == 0 and snippet.end_line == 0
+
+
+def is_added_file(snippet: ModifiedCodeSnippet) -> bool:
+    """Check if a snippet adds a whole file (it starts at the top and only adds lines)."""
+    return snippet.start_line == 1 and all(
+        line.startswith(("+", "\\")) for line in snippet.modified_code.split("\n")
+    )
+
+
+def moved_lines_key(snippet: ModifiedCodeSnippet) -> Optional[Tuple[str, str]]:
+    """Key pure removals and pure additions by their lines, so moved code matches up."""
+    markers = set()
+    lines: List[str] = []
+    for line in snippet.modified_code.split("\n"):
+        if line[:1] in ("+", "-"):
+            markers.add(line[:1])
+            stripped = line[1:].strip()
+            if stripped:
+                lines.append(stripped)
+    if len(markers) != 1 or len(lines) < 2:
+        return None
+    content_hash = hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+    return markers.pop(), content_hash
+
+
+def group_snippets(
+    modified_code_snippets: ModifiedCodeSnippets,
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[List[int]]:
+    """Cluster related snippets locally, ordered by their first snippet.
+
+    Snippets are related if they are in the same file, share enough identifiers and path
+    tokens (found with MinHash), move the same lines, rename a file, or pair a test with
+    the code it tests.
+    """
+    snippets = modified_code_snippets.modified_code_snippets
+    union_find = UnionFind(len(snippets))
+
+    first_in_file: Dict[str, int] = {}
+    token_sets: List[FrozenSet[str]] = []
+    token_bins: Dict[str, Tuple[int, int]] = {}
+    band_buckets: Dict[Tuple[int, ...], int] = {}
+    moved_lines: Dict[Tuple[str, str], int] = {}
+    subjects: Dict[Tuple[str, bool], int] = {}
+    file_tokens: Dict[str, FrozenSet[str]] = {}
+    for index, snippet in enumerate(snippets):
+        # Hunks in the same file are always grouped together
+        first_index = first_in_file.setdefault(snippet.filename, index)
+        if first_index == index:
+            file_tokens[snippet.filename] = path_tokens(snippet.filename)
+            subjects.setdefault(
+                get_test_subject(os.path.basename(snippet.filename)), index
+            )
+        else:
+            union_find.union(first_index, index)
+
+        tokens = extract_identifiers(snippet.modified_code)
+        if tokens:
+            tokens |= file_tokens[snippet.filename]
+        token_sets.append(tokens)
+        for band in minhash_bands(tokens, token_bins):
+            # Compare with the first snippet in the bucket instead of every pair
+            candidate = band_buckets.setdefault(band, index)
+            if (
+                candidate != index
+                and jaccard(tokens, token_sets[candidate]) >= threshold
+            ):
+                union_find.union(candidate, index)
+
+        # Lines removed in one place and added in another are a move
+        key = moved_lines_key(snippet)
+        if key is not None:
+            marker, content_hash = key
+            opposite = moved_lines.get(("+" if marker == "-" else "-", content_hash))
+            if opposite is not None:
+                union_find.union(opposite, index)
+            moved_lines.setdefault(key, index)
+
+    # Pair tests with the code they test, and deleted files with added files of the same name
+    for (subject, is_test), index in subjects.items():
+        if is_test and (subject, False) in subjects:
+            union_find.union(subjects[(subject, False)], index)
+    deleted_files: Dict[str, int] = {}
+    for index, snippet in enumerate(snippets):
+        if is_deleted_file(snippet):
+            deleted_files.setdefault(os.path.basename(snippet.filename), index)
+    if deleted_files:
+        for index, snippet in enumerate(snippets):
+            deleted_index = deleted_files.get(os.path.basename(snippet.filename))
+            if deleted_index is not None and is_added_file(snippet):
+                union_find.union(deleted_index, index)
+
+    return union_find.groups()
+
+
+def suggest_message(snippets: List[ModifiedCodeSnippet]) -> str:
+    """Write a Conventional Commits message for a group of snippets without a model."""
+    filenames = list(dict.fromkeys(snippet.filename for snippet in snippets))
+    if all(is_generated_file(filename) for filename in filenames):
+        commit_type = "build"
+    elif all(is_test_file(filename) for filename in filenames):
+        commit_type = "test"
+    elif all(is_whitespace_only(snippet.modified_code) for snippet in snippets):
+        commit_type = "style"
+    elif all(filename.endswith((".md", ".rst", ".txt")) for filename in filenames):
+        commit_type = "docs"
+    else:
+        commit_type = "chore"
+
+    if all(is_deleted_file(snippet) for snippet in snippets):
+        action = "remove"
+    elif all(snippet.file_change == "rename" for snippet in snippets):
+        action = "rename"
+    else:
+        action = "update"
+    if len(filenames) == 1:
+        scope = filenames[0]
+    else:
+        directory = os.path.commonpath(filenames) if filenames else ""
+        scope = (
+            f"{len(filenames)} files in {directory}"
+            if directory
+            else f"{len(filenames)} files"
+        )
+    return f"{commit_type}: {action} {scope}"[:72]
+
+
+def suggest_commits_offline(
+    modified_code_snippets: ModifiedCodeSnippets,
+) -> CommitSuggestions:
+    """Suggest one commit per local group of snippets, without calling a model."""
+    snippets = modified_code_snippets.modified_code_snippets
+    return CommitSuggestions(
+        commit_suggestions=[
+            CommitSuggestion(
+                message=suggest_message([snippets[index] for index in group]),
+                code_snippet_indices=group,
+            )
+            for group in group_snippets(modified_code_snippets)
+        ]
+    )
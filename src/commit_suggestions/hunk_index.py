@@ -0,0 +1,323 @@
+from commit_suggestions.models import Hunk, Hunks
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import re
+
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# Prefixes git puts in front of paths (including `diff.mnemonicPrefix` ones)
+PATH_PREFIX_PATTERN = re.compile(r"^[abciwo]/")
+
+# Escapes used by git when it quotes paths with special characters
+C_ESCAPES = {
+    "a": 0x07,
+    "b": 0x08,
+    "t": 0x09,
+    "n": 0x0A,
+    "v": 0x0B,
+    "f": 0x0C,
+    "r": 0x0D,
+    '"': 0x22,
+    "\\": 0x5C,
+}
+
+
+def parse_hunk_header(hunk_header: str) -> Tuple[int, int, int, int]:
+    """Get the old start, old length, new start, and new length from a hunk header.
+
+    File-level changes have no hunk header and cover no lines.
+    """
+    if not hunk_header:
+        return 0, 0, 0, 0
+    match = HUNK_HEADER_PATTERN.match(hunk_header)
+    if match is None:
+        raise ValueError(f"Invalid hunk header: {hunk_header!r}")
+    old_start, old_length, new_start, new_length = match.groups()
+
+    # A missing length means the hunk covers a single line
+    return (
+        int(old_start),
+        1 if old_length is None else int(old_length),
+        int(new_start),
+        1 if new_length is None else int(new_length),
+    )
+
+
+def unquote_git_path(path: str) -> str:
+    """Undo git's C-style quoting of paths, e.g. `"t\\303\\251st.txt"` becomes `tést.txt`."""
+    if len(path) < 2 or not path.startswith('"') or not path.endswith('"'):
+        return path
+
+    body = path[1:-1]
+    path_bytes = bytearray()
+    position = 0
+    while position < len(body):
+        character = body[position]
+        if character == "\\" and position + 1 < len(body):
+            escaped = body[position + 1]
+            if escaped in "01234567":
+                # Octal escapes are the raw UTF-8 bytes of the path
+                path_bytes.append(int(body[position + 1 : position + 4], 8) & 0xFF)
+                position += 4
+                continue
+            path_bytes.append(C_ESCAPES.get(escaped, ord(escaped)))
+            position += 2
+            continue
+        path_bytes.extend(character.encode("utf-8"))
+        position += 1
+    return path_bytes.decode("utf-8", "replace")
+
+
+def strip_path_prefix(path: str) -> Optional[str]:
+    """Turn a path from a diff (e.g. `a/src/main.py` or `/dev/null`) into a repository path."""
+    path = unquote_git_path(path)
+    if path == "/dev/null":
+        return None
+    return PATH_PREFIX_PATTERN.sub("", path, count=1)
+
+
+def get_extended_header_value(extended_header: str, prefix: str) -> Optional[str]:
+    """Get the rest of the first extended header line (e.g. `rename from x`) starting with `prefix`."""
+    for line in extended_header.split("\n"):
+        if line.startswith(prefix):
+            return line[len(prefix) :]
+    return None
+
+
+def parse_file_paths(
+    file_header: str, file_path_indicators: str, extended_header: str = ""
+) -> Tuple[Optional[str], Optional[str]]:
+    """Get the old and new paths of a file in a diff. Added files have no old path and deleted files no new path.
+
+    Files without `---`/`+++` lines (e.g. binary files, renames, and mode changes) take
+    their paths from the extended header lines in `extended_header`, if given.
+    """
+    old_path: Optional[str] = None
+    new_path: Optional[str] = None
+    found_indicators = False
+    for line in file_path_indicators.split("\n"):
+        # git ends paths that contain spaces with a tab
+        if line.startswith("--- "):
+            old_path = strip_path_prefix(line[4:].rstrip("\t"))
+            found_indicators = True
+        elif line.startswith("+++ "):
+            new_path = strip_path_prefix(line[4:].rstrip("\t"))
+            found_indicators = True
+    if found_indicators:
+        return old_path, new_path
+
+    # Renames and copies name both paths exactly
+    for source, target in (("rename from ", "rename to "), ("copy from ", "copy to ")):
+        old_value = get_extended_header_value(extended_header, source)
+        new_value = get_extended_header_value(extended_header, target)
+        if old_value is not None and new_value is not None:
+            return unquote_git_path(old_value), unquote_git_path(new_value)
+
+    old_path, new_path = parse_header_paths(file_header)
+    if get_extended_header_value(extended_header, "new file mode ") is not None:
+        return None, new_path
+    if get_extended_header_value(extended_header, "deleted file mode ") is not None:
+        return old_path, None
+    return old_path, new_path
+
+
+def parse_header_paths(file_header: str) -> Tuple[Optional[str], Optional[str]]:
+    """Get the old and new paths from a `diff --git a/... b/...` header."""
+    paths = file_header.removeprefix("diff --git ")
+    if paths.startswith('"'):
+        old_end = paths.index('" ', 1) + 1
+        return strip_path_prefix(paths[:old_end]), strip_path_prefix(
+            paths[old_end + 1 :]
+        )
+    # Unquoted paths may contain spaces, so look for the split with matching halves
+    for match in re.finditer(" ", paths):
+        old_path = strip_path_prefix(paths[: match.start()])
+        if old_path == strip_path_prefix(paths[match.end() :]):
+            return old_path, old_path
+    old_part, _, new_part = paths.partition(" b/")
+    return strip_path_prefix(old_part), new_part or None
+
+
+def get_file_change(extended_header: str) -> str:
+    """Get the kind of a file-level change (a file section without hunks) from its extended header."""
+    if (
+        get_extended_header_value(extended_header, "Binary files ") is not None
+        or get_extended_header_value(extended_header, "GIT binary patch") is not None
+    ):
+        return "binary"
+    for prefix, kind in (
+        ("rename from ", "rename"),
+        ("copy from ", "copy"),
+        ("new file mode ", "new"),
+        ("deleted file mode ", "deleted"),
+        ("new mode ", "mode"),
+    ):
+        if get_extended_header_value(extended_header, prefix) is not None:
+            return kind
+    return "other"
+
+
+def summarize_file_change(extended_header: str, metadata: "HunkMetadata") -> str:
+    """Describe a file-level change in one line, e.g. `renamed from old.py, mode 100644 -> 100755`."""
+    parts: List[str] = []
+    if metadata.file_change == "binary":
+        if metadata.old_path is None:
+            parts.append("binary file added")
+        elif metadata.new_path is None:
+            parts.append("binary file deleted")
+        else:
+            parts.append("binary file changed")
+    elif metadata.file_change == "new":
+        parts.append("empty file added")
+    elif metadata.file_change == "deleted":
+        parts.append("empty file deleted")
+    if get_extended_header_value(extended_header, "rename from ") is not None:
+        parts.append(f"renamed from {metadata.old_path}")
+    if get_extended_header_value(extended_header, "copy from ") is not None:
+        parts.append(f"copied from {metadata.old_path}")
+    old_mode = get_extended_header_value(extended_header, "old mode ")
+    new_mode = get_extended_header_value(extended_header, "new mode ")
+    if old_mode is not None and new_mode is not None:
+        parts.append(f"mode {old_mode} -> {new_mode}")
+    return ", ".join(parts) or "file changed without content changes"
+
+
+class HunkMetadata:
+    """The file identity and line ranges of a hunk, computed once when it is parsed."""
+
+    __slots__ = (
+        "index",
+        "old_path",
+        "new_path",
+        "old_start",
+        "old_length",
+        "new_start",
+        "new_length",
+        "file_change",
+    )
+
+    def __init__(
+        self,
+        index: int,
+        old_path: Optional[str],
+        new_path: Optional[str],
+        old_start: int,
+        old_length: int,
+        new_start: int,
+        new_length: int,
+        file_change: Optional[str] = None,
+    ):
+        self.index = index
+        self.old_path = old_path
+        self.new_path = new_path
+        self.old_start = old_start
+        self.old_length = old_length
+        self.new_start = new_start
+        self.new_length = new_length
+        # The kind of change (e.g. "binary" or "rename") of a file section without hunks
+        self.file_change = file_change
+
+    @classmethod
+    def from_hunk(cls, hunk: Hunk, index: int = 0) -> "HunkMetadata":
+        """Compute the metadata of a single hunk."""
+        return cls(
+            index,
+            *parse_file_paths(
+                hunk.file_header, hunk.file_path_indicators, hunk.index_line
+            ),
+            *parse_hunk_header(hunk.hunk_header),
+            None if hunk.hunk_header else get_file_change(hunk.index_line),
+        )
+
+    @property
+    def path(self) -> str:
+        """The path the hunk belongs to (the old path for deleted files)."""
+        return self.new_path if self.new_path is not None else self.old_path or ""
+
+    @property
+    def modifies_in_place(self) -> bool:
+        """Whether the hunk changes the lines of an existing file without adding, deleting, or renaming it."""
+        return (
+            self.file_change is None
+            and self.old_path is not None
+            and self.old_path == self.new_path
+        )
+
+    @property
+    def new_last_line(self) -> int:
+        """The last line of the new file covered by the hunk."""
+        return self.new_start + max(self.new_length, 1) - 1
+
+
+class HunkIndex:
+    """Hunk metadata by hunk index, and by file with lookup by line range."""
+
+    def __init__(self):
+        self.hunks: List[HunkMetadata] = []
+        self.files: Dict[str, List[HunkMetadata]] = {}
+        # File headers are shared by every hunk in a file, so their paths are parsed once
+        self._file_paths: Dict[
+            Tuple[str, str, str], Tuple[Optional[str], Optional[str]]
+        ] = {}
+
+    @classmethod
+    def from_hunks(cls, hunks: Hunks) -> "HunkIndex":
+        hunk_index = cls()
+        for hunk in hunks.hunks:
+            hunk_index.add(hunk)
+        return hunk_index
+
+    def add(self, hunk: Hunk) -> HunkMetadata:
+        """Index the next hunk of the diff."""
+        file_key = (hunk.file_header, hunk.file_path_indicators, hunk.index_line)
+        file_paths = self._file_paths.get(file_key)
+        if file_paths is None:
+            file_paths = parse_file_paths(*file_key)
+            self._file_paths[file_key] = file_paths
+
+        metadata = HunkMetadata(
+            len(self.hunks),
+            *file_paths,
+            *parse_hunk_header(hunk.hunk_header),
+            None if hunk.hunk_header else get_file_change(hunk.index_line),
+        )
+        self.hunks.append(metadata)
+        insort(
+            self.files.setdefault(metadata.path, []),
+            metadata,
+            key=lambda metadata: metadata.new_start,
+        )
+        return metadata
+
+    def __getitem__(self, index: int) -> HunkMetadata:
+        return self.hunks[index]
+
+    def __len__(self) -> int:
+        return len(self.hunks)
+
+    def __iter__(self) -> Iterator[HunkMetadata]:
+        return iter(self.hunks)
+
+    def lookup(self, path: str, start_line: int, end_line: int) -> List[HunkMetadata]:
+        """Find the hunks of `path` that overlap lines `start_line` to `end_line` of the new file."""
+        file_hunks = self.files.get(path, [])
+        # Hunks in a file only overlap when pieces of a split hunk share unchanged lines,
+        # and then each piece still ends after the one before it, so last lines are sorted too
+        position = bisect_left(
+            file_hunks, start_line, key=lambda metadata: metadata.new_last_line
+        )
+        overlapping: List[HunkMetadata] = []
+        while position < len(file_hunks) and file_hunks[position].new_start <= end_line:
+            overlapping.append(file_hunks[position])
+            position += 1
+        return overlapping
+
+    def group_by_file(self, indices: Iterable[int]) -> Dict[str, List[HunkMetadata]]:
+        """Group the hunks at `indices` by file, in the order files first appear, sorted by line."""
+        grouped: Dict[str, List[HunkMetadata]] = {}
+        for index in indices:
+            metadata = self.hunks[index]
+            grouped.setdefault(metadata.path, []).append(metadata)
+        for file_hunks in grouped.values():
+            file_hunks.sort(key=lambda metadata: metadata.new_start)
+        return grouped
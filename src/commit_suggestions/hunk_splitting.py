@@ -0,0 +1,176 @@
+from commit_suggestions.hunk_index import HUNK_HEADER_PATTERN, parse_hunk_header
+from commit_suggestions.models import Hunk
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+
+def format_range(start: int, length: int) -> str:
+    # Like git, a range of a single line is written without its length
+    return str(start) if length == 1 else f"{start},{length}"
+
+
+def format_hunk_header(
+    old_start: int, old_length: int, new_start: int, new_length: int, heading: str = ""
+) -> str:
+    """Build a hunk header, e.g. `@@ -3,7 +3,8 @@ def main():`."""
+    return (
+        f"@@ -{format_range(old_start, old_length)} "
+        f"+{format_range(new_start, new_length)} @@{heading}"
+    )
+
+
+def get_heading(hunk_header: str) -> str:
+    """Get the text after a hunk header's line ranges, such as the enclosing function."""
+    match = HUNK_HEADER_PATTERN.match(hunk_header)
+    return hunk_header[match.end() :] if match else ""
+
+
+def is_context_line(line: str) -> bool:
+    # Empty lines are unchanged empty lines whose leading space was stripped
+    return not line.startswith(("-", "+", "\\"))
+
+
+def make_piece(
+    hunk: Hunk,
+    lines: List[str],
+    old_start: int,
+    new_start: int,
+    old_end: int,
+    new_end: int,
+    heading: str,
+) -> Hunk:
+    return hunk.model_copy(
+        update={
+            "hunk_header": format_hunk_header(
+                old_start, old_end - old_start, new_start, new_end - new_start, heading
+            ),
+            "modified_code": "\n".join(lines),
+        }
+    )
+
+
+def split_hunk(hunk: Hunk) -> List[Hunk]:
+    """Split a hunk at the unchanged lines between its changes, like `git add -p`'s split.
+
+    Each piece keeps the unchanged lines around its change, so pieces next to each other
+    share them, and gets a header with its own line ranges so it can be staged on its own.
+    The hunk's lines are read in a single pass. File-level changes and hunks with a single
+    run of changes are returned as they are.
+    """
+    if not hunk.hunk_header:
+        return [hunk]
+    old_line, _, new_line, _ = parse_hunk_header(hunk.hunk_header)
+    heading = get_heading(hunk.hunk_header)
+    lines = hunk.modified_code.split("\n")
+
+    pieces: List[Hunk] = []
+    # Where the current piece starts, as a line of the hunk and lines of the old and new file
+    piece_start, piece_old, piece_new = 0, old_line, new_line
+    # Where the unchanged lines after the last change start, if there are any yet
+    run_start, run_old, run_new = -1, 0, 0
+    seen_change = False
+    for line_number, line in enumerate(lines):
+        if is_context_line(line):
+            if seen_change and run_start < 0:
+                run_start, run_old, run_new = line_number, old_line, new_line
+            old_line += 1
+            new_line += 1
+        elif line.startswith("\\"):
+            # "\ No newline at end of file" belongs to the line before it
+            continue
+        else:
+            if run_start >= 0:
+                # The piece ends with the unchanged lines, which also start the next piece
+                pieces.append(
+                    make_piece(
+                        hunk,
+                        lines[piece_start:line_number],
+                        piece_old,
+                        piece_new,
+                        old_line,
+                        new_line,
+                        heading if not pieces else "",
+                    )
+                )
+                piece_start, piece_old, piece_new = run_start, run_old, run_new
+                run_start = -1
+            seen_change = True
+            if line.startswith("-"):
+                old_line += 1
+            else:
+                new_line += 1
+
+    if not pieces:
+        return [hunk]
+    pieces.append(
+        make_piece(
+            hunk, lines[piece_start:], piece_old, piece_new, old_line, new_line, ""
+        )
+    )
+    return pieces
+
+
+def iter_split_hunks(hunks: Iterable[Hunk]) -> Iterator[Hunk]:
+    """Yield the pieces of each hunk, so each run of changes can go into its own commit."""
+    for hunk in hunks:
+        yield from split_hunk(hunk)
+
+
+def merge_overlapping_hunks(hunks: Sequence[Hunk]) -> List[Hunk]:
+    """Join hunks of a single file, ordered by line, whose old line ranges overlap.
+
+    `git apply` rejects overlapping hunks, but pieces of a split hunk share their unchanged
+    lines with the pieces next to them. Pieces staged together are joined back into one
+    hunk, keeping the shared lines once. Hunks that overlap with changed lines are left as
+    they are, since they really conflict.
+    """
+    groups: List[List[Tuple[Hunk, Tuple[int, int, int, int]]]] = []
+    old_end = 0
+    for hunk in hunks:
+        line_range = parse_hunk_header(hunk.hunk_header)
+        old_start, old_length = line_range[:2]
+        overlap = old_end - old_start
+        if (
+            hunk.hunk_header
+            and groups
+            and overlap > 0
+            and all(
+                is_context_line(line)
+                for line in hunk.modified_code.split("\n", overlap)[:overlap]
+            )
+        ):
+            groups[-1].append((hunk, line_range))
+        else:
+            groups.append([(hunk, line_range)])
+        # File-level changes have no lines to overlap with
+        old_end = max(old_end, old_start + old_length) if hunk.hunk_header else 0
+
+    merged: List[Hunk] = []
+    for group in groups:
+        first_hunk, (old_start, old_length, new_start, new_length) = group[0]
+        if len(group) == 1:
+            merged.append(first_hunk)
+            continue
+        code_parts = [first_hunk.modified_code]
+        old_end = old_start + old_length
+        for hunk, (start, length, _, hunk_new_length) in group[1:]:
+            overlap = old_end - start
+            # Skip the shared unchanged lines, which the hunk before already has
+            remaining_code = hunk.modified_code.split("\n", overlap)[overlap:]
+            code_parts.extend(remaining_code)
+            new_length += hunk_new_length - overlap
+            old_end = max(old_end, start + length)
+        merged.append(
+            first_hunk.model_copy(
+                update={
+                    "hunk_header": format_hunk_header(
+                        old_start,
+                        old_end - old_start,
+                        new_start,
+                        new_length,
+                        get_heading(first_hunk.hunk_header),
+                    ),
+                    "modified_code": "\n".join(code_parts),
+                }
+            )
+        )
+    return merged
@@ -0,0 +1,142 @@
+from commit_suggestions.llm import merge_batch_suggestions
+from commit_suggestions.models import (
+    CommitSuggestion,
+    CommitSuggestions,
+    HunkAssignment,
+    IncrementalState,
+    ModifiedCodeSnippet,
+    ModifiedCodeSnippets,
+)
+from pydantic import ValidationError
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import os
+import tempfile
+
+
+def get_state_path(git_dir: str) -> str:
+    """Get where the last run's state is stored inside a repository's `.git` directory."""
+    return os.path.join(git_dir, "commit-suggestions", "last-run.json")
+
+
+def hunk_key(snippet: ModifiedCodeSnippet) -> Tuple[str, str]:
+    """Identify a hunk by its file and a hash of its content.
+
+    Line numbers are left out on purpose, since edits above a hunk shift them.
+    """
+    content_hash = hashlib.sha256(snippet.modified_code.encode("utf-8")).hexdigest()
+    return snippet.filename, content_hash
+
+
+def load_state(state_path: str, model: str) -> Optional[IncrementalState]:
+    """Load the last run's state, ignoring it if it is missing, broken, or for another model."""
+    try:
+        with open(state_path, "rb") as state_file:
+            state = IncrementalState.model_validate_json(state_file.read())
+    except (OSError, ValidationError):
+        return None
+    if state.model != model:
+        return None
+    return state
+
+
+def save_state(
+    state_path: str,
+    model: str,
+    modified_code_snippets: ModifiedCodeSnippets,
+    commit_suggestions: CommitSuggestions,
+):
+    """Store the hunks of this run and the suggestion each was assigned to."""
+    suggestion_indices: Dict[int, int] = {}
+    for suggestion_index, suggestion in enumerate(
+        commit_suggestions.commit_suggestions
+    ):
+        for snippet_index in suggestion.code_snippet_indices:
+            suggestion_indices.setdefault(snippet_index, suggestion_index)
+
+    hunks = []
+    for snippet_index, snippet in enumerate(
+        modified_code_snippets.modified_code_snippets
+    ):
+        filename, content_hash = hunk_key(snippet)
+        hunks.append(
+            HunkAssignment(
+                filename=filename,
+                content_hash=content_hash,
+                suggestion_index=suggestion_indices.get(snippet_index),
+            )
+        )
+    state = IncrementalState(
+        model=model,
+        messages=[
+            suggestion.message for suggestion in commit_suggestions.commit_suggestions
+        ],
+        hunks=hunks,
+    )
+
+    # Write to a temporary file first so a crash never leaves a partial state
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(state_path))
+    with os.fdopen(file_descriptor, "w") as state_file:
+        state_file.write(state.model_dump_json())
+    os.replace(temp_path, state_path)
+
+
+def generate_incrementally(
+    modified_code_snippets: ModifiedCodeSnippets,
+    state_path: str,
+    model: str,
+    generate: Callable[[ModifiedCodeSnippets], Optional[CommitSuggestions]],
+) -> Optional[CommitSuggestions]:
+    """Reuse the last run's suggestions for unchanged hunks and only `generate` suggestions for new or changed ones."""
+    snippets = modified_code_snippets.modified_code_snippets
+    state = load_state(state_path, model)
+
+    # Match current hunks with the hunks of the last run (a hunk can appear more than once)
+    previous_assignments: Dict[Tuple[str, str], List[Optional[int]]] = {}
+    if state is not None:
+        for hunk in state.hunks:
+            previous_assignments.setdefault(
+                (hunk.filename, hunk.content_hash), []
+            ).append(hunk.suggestion_index)
+
+    reused_indices: Dict[int, List[int]] = {}
+    new_indices: List[int] = []
+    for snippet_index, snippet in enumerate(snippets):
+        assignments = previous_assignments.get(hunk_key(snippet))
+        suggestion_index = assignments.pop(0) if assignments else None
+        if suggestion_index is None:
+            # Hunks the model never assigned are worth asking about again
+            new_indices.append(snippet_index)
+        else:
+            reused_indices.setdefault(suggestion_index, []).append(snippet_index)
+
+    # Only the new and changed hunks go to the model
+    new_suggestions = CommitSuggestions(commit_suggestions=[])
+    if new_indices:
+        generated_suggestions = generate(
+            ModifiedCodeSnippets(
+                modified_code_snippets=[snippets[index] for index in new_indices]
+            )
+        )
+        if generated_suggestions is None:
+            return None
+        new_suggestions = merge_batch_suggestions(
+            [new_indices], [generated_suggestions]
+        )
+
+    # Keep the old suggestions that still have hunks, in their original order
+    commit_suggestions = CommitSuggestions(commit_suggestions=[])
+    if state is not None:
+        for suggestion_index, message in enumerate(state.messages):
+            if suggestion_index in reused_indices:
+                commit_suggestions.commit_suggestions.append(
+                    CommitSuggestion(
+                        message=message,
+                        code_snippet_indices=reused_indices[suggestion_index],
+                    )
+                )
+    commit_suggestions.commit_suggestions.extend(new_suggestions.commit_suggestions)
+
+    save_state(state_path, model, modified_code_snippets, commit_suggestions)
+    return commit_suggestions
@@ -0,0 +1,639 @@
+from commit_suggestions.backends import LLMBackend, create_backend
+from commit_suggestions.cache import ResponseCache, can_cache
+from commit_suggestions.config import (
+    DEFAULT_BACKOFF_SECONDS,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_MODEL,
+    DEFAULT_TOKEN_BUDGET,
+)
+from commit_suggestions.grouping import group_snippets
+from commit_suggestions.models import (
+    BackendConfig,
+    CommitSuggestion,
+    CommitSuggestions,
+    ModifiedCodeSnippets,
+    PromptEncoding,
+    TokenUsage,
+)
+from commit_suggestions.profiling import NULL_PROFILER, Profiler
+from commit_suggestions.prompt_encoding import (
+    DEFAULT_ENCODING,
+    encode_snippet,
+    encode_snippets,
+    estimate_tokens,
+)
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import asyncio
+import os
+import queue
+import threading
+
+# Errors that are worth retrying since they are usually temporary
+RETRYABLE_ERRORS = (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+
+JSON_INPUT_DETAILS = """* A modified code snippet contains:
+        * `filename` (The filepath to the modified code)
+        * `start_line` and `end_line` (line numbers of changes in `filename`)
+        * `modified_code` (the actual code change)"""
+
+COMPACT_INPUT_DETAILS = """* Each modified code snippet starts with a `### <index> <filename> <start_line>-<end_line>` line followed by its diff lines
+      (`+` added, `-` removed, ` ` unchanged).
+    * Headers ending in parentheses summarize a snippet instead of showing it: lockfiles and generated files, whitespace-only
+      changes, and changes that are the same as an earlier snippet."""
+
+
+def create_prompt(
+    num_snippets: int, encoding: PromptEncoding = DEFAULT_ENCODING
+) -> str:
+    """Create the system prompt for a request containing `num_snippets` code snippets."""
+    input_details = COMPACT_INPUT_DETAILS if encoding.compact else JSON_INPUT_DETAILS
+    if encoding.context_lines is not None:
+        input_details += f"""
+    * Unchanged lines more than {encoding.context_lines} lines away from a change are left out and replaced by a `= <count> unchanged lines` line."""
+    return f"""
+    You are a commit message generator. You will be given a series of code changes (parsed from the `git diff` command), and you are expected
+    to return suggested git commits.
+
+    Input Details:
+    * The code changes are called modified code snippets.
+    {input_details}
+    * The order that the code changes are given does not matter, so do not assume that the changes are in sequential order.
+
+    Output Details:
+    * Each commit suggestion should include:
+        * A commit message (following Conventional Commits Format)
+        * The modified code snippet indices from the input associated with the commit.
+            * Possible indices are in the range 0-{num_snippets - 1}
+            * Don't be afraid to group hunks that you think are related!
+    * The commits should be ordered logically, grouping related changes together (e.g., refactoring before feature additions).
+    * The git commit suggestion is made up of a suggested message and modified code snippets to stage.
+        * The generated message should use conventional commit standards. The `start_line` should be the line number the code snippet starts on and the `end_line` should be the end line of the code snippet.
+    * Commit messages should be concise and clear (limit the subject line to 72 characters).
+    """
+
+
+class BatchPlanner:
+    """Packs units of snippet indices (files or local groups) into token-budgeted batches as they are added."""
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        if token_budget <= 0:
+            raise ValueError("Token budget must be positive")
+        self.token_budget = token_budget
+        self.current_batch: List[int] = []
+        self.current_tokens = 0
+
+    def add(self, indices: List[int], snippet_tokens: Sequence[int]) -> List[List[int]]:
+        """Add a unit, returning the batches that are full. `snippet_tokens` holds each snippet's token estimate."""
+        batches: List[List[int]] = []
+        file_tokens = sum(snippet_tokens[index] for index in indices)
+
+        # Start a new batch if the whole file doesn't fit in the current one
+        if self.current_batch and self.current_tokens + file_tokens > self.token_budget:
+            batches.append(self.current_batch)
+            self.current_batch, self.current_tokens = [], 0
+
+        # Files bigger than the budget get split across batches
+        for index in indices:
+            if (
+                self.current_batch
+                and self.current_tokens + snippet_tokens[index] > self.token_budget
+            ):
+                batches.append(self.current_batch)
+                self.current_batch, self.current_tokens = [], 0
+            self.current_batch.append(index)
+            self.current_tokens += snippet_tokens[index]
+        return batches
+
+    def finish(self) -> List[List[int]]:
+        """Return the last batch, if it isn't empty."""
+        batches = [self.current_batch] if self.current_batch else []
+        self.current_batch, self.current_tokens = [], 0
+        return batches
+
+
+def plan_batches(
+    modified_code_snippets: ModifiedCodeSnippets,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    groups: Optional[List[List[int]]] = None,
+) -> List[List[int]]:
+    """Split snippet indices into token-budgeted batches, keeping snippets from the same file and directory together.
+
+    Local `groups` of related snippets (see `grouping.group_snippets`) are kept together instead of files if given.
+    """
+    planner = BatchPlanner(token_budget)
+    snippets = modified_code_snippets.modified_code_snippets
+
+    # Group snippet indices by the file they modify
+    file_groups: Dict[str, List[int]] = {}
+    snippet_tokens: List[int] = []
+    for index, snippet in enumerate(snippets):
+        file_groups.setdefault(snippet.filename, []).append(index)
+        snippet_tokens.append(estimate_tokens(encode_snippet(snippet, encoding)))
+    units = list(file_groups.values()) if groups is None else groups
+
+    # Order files (or groups, by their first file) by directory so neighbouring files land in the same batch
+    units = sorted(
+        units,
+        key=lambda indices: (
+            os.path.dirname(snippets[indices[0]].filename),
+            snippets[indices[0]].filename,
+        ),
+    )
+
+    batches: List[List[int]] = []
+    for indices in units:
+        batches.extend(planner.add(indices, snippet_tokens))
+    batches.extend(planner.finish())
+    return batches
+
+
+def remap_suggestion(
+    batch: List[int], suggestion: CommitSuggestion
+) -> Optional[CommitSuggestion]:
+    """Remap the batch-local indices of a suggestion to global snippet indices, or None if none are valid."""
+    # Drop indices the model made up that aren't in the batch
+    global_indices = [
+        batch[index]
+        for index in suggestion.code_snippet_indices
+        if 0 <= index < len(batch)
+    ]
+    if not global_indices:
+        return None
+    return CommitSuggestion(
+        message=suggestion.message, code_snippet_indices=global_indices
+    )
+
+
+def merge_batch_suggestions(
+    batches: List[List[int]],
+    batch_suggestions: List[CommitSuggestions],
+) -> CommitSuggestions:
+    """Merge per-batch commit suggestions, remapping batch-local indices to global snippet indices."""
+    merged = CommitSuggestions(commit_suggestions=[])
+    for batch, suggestions in zip(batches, batch_suggestions):
+        for suggestion in suggestions.commit_suggestions:
+            remapped_suggestion = remap_suggestion(batch, suggestion)
+            if remapped_suggestion is not None:
+                merged.commit_suggestions.append(remapped_suggestion)
+    return merged
+
+
+def create_messages(
+    modified_code_snippets: ModifiedCodeSnippets,
+    user_content: str,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+) -> List[Dict[str, str]]:
+    """Create the system and user messages of a request."""
+    return [
+        {
+            "role": "system",
+            "content": create_prompt(
+                len(modified_code_snippets.modified_code_snippets), encoding
+            ),
+        },
+        {
+            "role": "user",
+            "content": user_content,
+        },
+    ]
+
+
+async def request_commit_suggestions(
+    backend: LLMBackend,
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    usage: Optional[TokenUsage] = None,
+    profiler: Profiler = NULL_PROFILER,
+    track: int = 0,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+) -> Optional[CommitSuggestions]:
+    """Ask the model for commit suggestions for one batch, retrying temporary failures with exponential backoff.
+
+    Token usage of the completion is added to `usage` if it is given.
+    """
+    with profiler.span("serialize", track) as span:
+        user_content = encode_snippets(modified_code_snippets, encoding)
+        span.count(bytes=len(user_content))
+
+    attempt = 0
+    while True:
+        try:
+            with profiler.span("llm request", track) as span:
+                commit_suggestions, completion_usage = await backend.complete(
+                    modified_code_snippets,
+                    create_messages(modified_code_snippets, user_content, encoding),
+                    model,
+                )
+                if completion_usage is not None:
+                    span.count(
+                        prompt_tokens=completion_usage.prompt_tokens,
+                        completion_tokens=completion_usage.completion_tokens,
+                    )
+                    if usage is not None:
+                        usage.add(completion_usage)
+            return commit_suggestions
+        except RETRYABLE_ERRORS:
+            if attempt >= max_retries:
+                raise
+            await asyncio.sleep(backoff_seconds * 2**attempt)
+            attempt += 1
+
+
+def batch_snippets(
+    modified_code_snippets: ModifiedCodeSnippets, batch: List[int]
+) -> ModifiedCodeSnippets:
+    """Select the snippets of one batch."""
+    snippets = modified_code_snippets.modified_code_snippets
+    return ModifiedCodeSnippets(
+        modified_code_snippets=[snippets[index] for index in batch]
+    )
+
+
+def get_cached_commit_suggestions(
+    cache: ResponseCache,
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    groups: Optional[List[List[int]]] = None,
+) -> Optional[CommitSuggestions]:
+    """Return merged suggestions if every batch is already cached, otherwise None."""
+    batches = plan_batches(modified_code_snippets, token_budget, encoding, groups)
+    batch_suggestions = []
+    for batch in batches:
+        cached_suggestions = cache.get(
+            cache.key(
+                batch_snippets(modified_code_snippets, batch),
+                create_prompt(len(batch), encoding),
+                model,
+            )
+        )
+        if cached_suggestions is None:
+            return None
+        batch_suggestions.append(cached_suggestions)
+    return merge_batch_suggestions(batches, batch_suggestions)
+
+
+def prepare_generation(
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    cache: Optional[ResponseCache] = None,
+    profiler: Profiler = NULL_PROFILER,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    pre_group: bool = False,
+    backend_config: Optional[BackendConfig] = None,
+) -> Tuple[
+    Optional[ResponseCache], Optional[List[List[int]]], Optional[CommitSuggestions]
+]:
+    """Get the cache and snippet groups to generate suggestions with.
+
+    Also returns the suggestions if every batch is already cached, so that no backend has
+    to be created at all.
+    """
+    if not can_cache(backend_config):
+        cache = None
+
+    groups = None
+    if pre_group:
+        with profiler.span("group") as span:
+            groups = group_snippets(modified_code_snippets)
+            span.count(groups=len(groups))
+
+    cached_suggestions = None
+    if cache is not None:
+        with profiler.span("cache lookup"):
+            cached_suggestions = get_cached_commit_suggestions(
+                cache,
+                modified_code_snippets,
+                model=model,
+                token_budget=token_budget,
+                encoding=encoding,
+                groups=groups,
+            )
+    return cache, groups, cached_suggestions
+
+
+async def generate_commit_suggestions_async(
+    backend: LLMBackend,
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    cache: Optional[ResponseCache] = None,
+    usage: Optional[TokenUsage] = None,
+    profiler: Profiler = NULL_PROFILER,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    groups: Optional[List[List[int]]] = None,
+) -> Optional[CommitSuggestions]:
+    """Send token-budgeted batches of snippets to the model concurrently and merge the results.
+
+    Batches found in `cache` are answered without an API call.
+    """
+    batches = plan_batches(modified_code_snippets, token_budget, encoding, groups)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request_batch(
+        batch_index: int, batch: List[int]
+    ) -> Optional[CommitSuggestions]:
+        snippets = batch_snippets(modified_code_snippets, batch)
+        cache_key = ""
+        if cache is not None:
+            cache_key = cache.key(snippets, create_prompt(len(batch), encoding), model)
+            cached_suggestions = cache.get(cache_key)
+            if cached_suggestions is not None:
+                return cached_suggestions
+
+        async with semaphore:
+            commit_suggestions = await request_commit_suggestions(
+                backend,
+                snippets,
+                model=model,
+                max_retries=max_retries,
+                backoff_seconds=backoff_seconds,
+                usage=usage,
+                profiler=profiler,
+                # Each batch gets its own track since batches run concurrently
+                track=batch_index + 1,
+                encoding=encoding,
+            )
+        if cache is not None and commit_suggestions is not None:
+            cache.put(cache_key, commit_suggestions)
+        return commit_suggestions
+
+    batch_suggestions = await asyncio.gather(
+        *(request_batch(index, batch) for index, batch in enumerate(batches))
+    )
+    if any(suggestions is None for suggestions in batch_suggestions):
+        return None
+    return merge_batch_suggestions(batches, batch_suggestions)
+
+
+def generate_commit_suggestions(
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    cache: Optional[ResponseCache] = None,
+    usage: Optional[TokenUsage] = None,
+    profiler: Profiler = NULL_PROFILER,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    pre_group: bool = False,
+    backend_config: Optional[BackendConfig] = None,
+) -> Optional[CommitSuggestions]:
+    """Create commit suggestions for all snippets with the backend in `backend_config` (OpenAI by default).
+
+    With `pre_group`, related snippets are clustered locally first and sent in the same batch.
+    """
+    cache, groups, cached_suggestions = prepare_generation(
+        modified_code_snippets,
+        model=model,
+        token_budget=token_budget,
+        cache=cache,
+        profiler=profiler,
+        encoding=encoding,
+        pre_group=pre_group,
+        backend_config=backend_config,
+    )
+    if cached_suggestions is not None:
+        return cached_suggestions
+
+    async def run() -> Optional[CommitSuggestions]:
+        # Batches share the backend's pool of keep-alive connections
+        async with create_backend(
+            backend_config, max_connections=concurrency
+        ) as backend:
+            return await generate_commit_suggestions_async(
+                backend,
+                modified_code_snippets,
+                model=model,
+                token_budget=token_budget,
+                concurrency=concurrency,
+                cache=cache,
+                usage=usage,
+                profiler=profiler,
+                encoding=encoding,
+                groups=groups,
+            )
+
+    return asyncio.run(run())
+
+
+async def stream_commit_suggestions_async(
+    backend: LLMBackend,
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    cache: Optional[ResponseCache] = None,
+    usage: Optional[TokenUsage] = None,
+    profiler: Profiler = NULL_PROFILER,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    groups: Optional[List[List[int]]] = None,
+    batches: Optional[AsyncIterable[List[int]]] = None,
+) -> AsyncIterator[CommitSuggestion]:
+    """Like `generate_commit_suggestions_async`, but yield each suggestion (with global indices) as soon as the model completes it.
+
+    Batches are streamed concurrently, so suggestions of different batches may interleave.
+    `batches` may be given instead of planning them from all snippets, e.g. while the diff
+    is still being parsed. Each batch starts as soon as it arrives, so its snippets must
+    already be in `modified_code_snippets` by then.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # Holds suggestions, a finished batch's index, or the error that stopped a batch
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def stream_batch(batch_index: int, batch: List[int]):
+        snippets = batch_snippets(modified_code_snippets, batch)
+        cache_key = ""
+        if cache is not None:
+            cache_key = cache.key(snippets, create_prompt(len(batch), encoding), model)
+            cached_suggestions = cache.get(cache_key)
+            if cached_suggestions is not None:
+                for suggestion in cached_suggestions.commit_suggestions:
+                    await events.put(remap_suggestion(batch, suggestion))
+                return
+
+        with profiler.span("serialize", batch_index + 1) as span:
+            user_content = encode_snippets(snippets, encoding)
+            span.count(bytes=len(user_content))
+        messages = create_messages(snippets, user_content, encoding)
+
+        suggestions: List[CommitSuggestion] = []
+        attempt = 0
+        async with semaphore:
+            while True:
+                try:
+                    with profiler.span("llm request", batch_index + 1) as span:
+                        async for suggestion in backend.stream(
+                            snippets, messages, model, usage
+                        ):
+                            suggestions.append(suggestion)
+                            await events.put(remap_suggestion(batch, suggestion))
+                        span.count(suggestions=len(suggestions))
+                    break
+                except RETRYABLE_ERRORS:
+                    # Suggestions that were already shown can't be taken back
+                    if suggestions or attempt >= max_retries:
+                        raise
+                    await asyncio.sleep(backoff_seconds * 2**attempt)
+                    attempt += 1
+        if cache is not None:
+            cache.put(cache_key, CommitSuggestions(commit_suggestions=suggestions))
+
+    async def run_batch(batch_index: int, batch: List[int]):
+        try:
+            await stream_batch(batch_index, batch)
+        except Exception as error:
+            await events.put(error)
+        finally:
+            await events.put(batch_index)
+
+    tasks: List[asyncio.Task] = []
+    planned = object()
+
+    async def start_batches():
+        try:
+            if batches is None:
+                for batch in plan_batches(
+                    modified_code_snippets, token_budget, encoding, groups
+                ):
+                    tasks.append(asyncio.create_task(run_batch(len(tasks), batch)))
+            else:
+                async for batch in batches:
+                    tasks.append(asyncio.create_task(run_batch(len(tasks), batch)))
+        except Exception as error:
+            await events.put(error)
+        finally:
+            await events.put(planned)
+
+    planner_task = asyncio.create_task(start_batches())
+    try:
+        finished_batches = 0
+        planning = True
+        while planning or finished_batches < len(tasks):
+            item = await events.get()
+            if item is planned:
+                planning = False
+            elif isinstance(item, int):
+                finished_batches += 1
+            elif isinstance(item, Exception):
+                raise item
+            elif item is not None:
+                yield item
+    finally:
+        planner_task.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+def iter_commit_suggestions(
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    cache: Optional[ResponseCache] = None,
+    usage: Optional[TokenUsage] = None,
+    profiler: Profiler = NULL_PROFILER,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    pre_group: bool = False,
+    backend_config: Optional[BackendConfig] = None,
+) -> Iterator[CommitSuggestion]:
+    """Stream commit suggestions on a background thread, yielding each as soon as it is complete.
+
+    This lets the user review the first suggestions while the rest are still being generated.
+    """
+    cache, groups, cached_suggestions = prepare_generation(
+        modified_code_snippets,
+        model=model,
+        token_budget=token_budget,
+        cache=cache,
+        profiler=profiler,
+        encoding=encoding,
+        pre_group=pre_group,
+        backend_config=backend_config,
+    )
+    if cached_suggestions is not None:
+        yield from cached_suggestions.commit_suggestions
+        return
+
+    # Holds suggestions, then the error that stopped the stream (if any), then `done`
+    suggestion_queue: queue.Queue = queue.Queue()
+    done = object()
+    loop = asyncio.new_event_loop()
+
+    async def produce():
+        async with create_backend(
+            backend_config, max_connections=concurrency
+        ) as backend:
+            async for suggestion in stream_commit_suggestions_async(
+                backend,
+                modified_code_snippets,
+                model=model,
+                token_budget=token_budget,
+                concurrency=concurrency,
+                cache=cache,
+                usage=usage,
+                profiler=profiler,
+                encoding=encoding,
+                groups=groups,
+            ):
+                suggestion_queue.put(suggestion)
+
+    def run():
+        try:
+            loop.run_until_complete(produce_task)
+        except BaseException as error:
+            suggestion_queue.put(error)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+            suggestion_queue.put(done)
+
+    produce_task = loop.create_task(produce())
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while (item := suggestion_queue.get()) is not done:
+            if isinstance(item, asyncio.CancelledError):
+                continue
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Stop generating if the caller stops reading early
+        if thread.is_alive():
+            try:
+                loop.call_soon_threadsafe(produce_task.cancel)
+            except RuntimeError:
+                pass
+        thread.join()
@@ -1,149 +1,563 @@
-from openai import OpenAI
-from rich.console import Console
-from rich.table import Table
-from rich.prompt import Confirm
-from commit_suggestions.models import CommitSuggestions, Hunks, ModifiedCodeSnippets
-from commit_suggestions.utils import (
-    parse_git_diff_into_hunks,
-    get_snippets_from_hunks,
-    color_code,
+# NOTE: Only light modules are imported here. openai, pydantic, git, and rich are imported
+# where they are used so that runs without changes exit before loading them.
+from commit_suggestions.config import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MODEL,
+    DEFAULT_TOKEN_BUDGET,
+    positive_int,
 )
+from commit_suggestions.profiling import NULL_PROFILER, Profiler, count_line_bytes
+from functools import cache, partial
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Union
+import argparse
+import json
 import subprocess
-from git import Repo
+import time
 
-console = Console()
+if TYPE_CHECKING:
+    from commit_suggestions.hunk_index import HunkIndex
+    from commit_suggestions.models import (
+        BackendConfig,
+        CommitSuggestion,
+        CommitSuggestions,
+        Hunks,
+        ModifiedCodeSnippets,
+        PromptEncoding,
+        ViewerOptions,
+    )
+    from commit_suggestions.staging import StagingBackend
+    from git import Repo
+    from rich.console import Console
+
+
+@cache
+def get_console() -> "Console":
+    """Create the rich console the first time it is needed."""
+    from rich.console import Console
+
+    return Console()
 
 
 def prompt_user(
-    commit_suggestions: CommitSuggestions,
-    modified_code_snippets: ModifiedCodeSnippets,
-    hunks: Hunks,
-    repo: Repo,
+    commit_suggestions: Union["CommitSuggestions", Iterable["CommitSuggestion"]],
+    modified_code_snippets: "ModifiedCodeSnippets",
+    hunks: "Hunks",
+    repo: "Repo",
+    staging_backend: Optional["StagingBackend"] = None,
+    profiler: Profiler = NULL_PROFILER,
+    hunk_index: Optional["HunkIndex"] = None,
+    viewer_options: Optional["ViewerOptions"] = None,
 ):
-    """Given a set of commit suggestions, show them to the user. Let them edit, reject, or execute them."""
+    """Given a set of commit suggestions, show them to the user. Let them edit, reject, or execute them.
+
+    Suggestions may also be a stream, in which case each is shown as soon as it arrives.
+    """
+    from commit_suggestions.hunk_index import HunkIndex
+    from commit_suggestions.models import CommitSuggestions
+    from commit_suggestions.review import ReviewPipeline
+    from commit_suggestions.staging import SubprocessStagingBackend
+    from commit_suggestions.viewer import page_suggestion
+    from rich.markup import escape
+    from rich.prompt import Confirm, Prompt
+
+    console = get_console()
+    if staging_backend is None:
+        staging_backend = SubprocessStagingBackend(repo.working_dir)
+    if hunk_index is None:
+        hunk_index = HunkIndex.from_hunks(hunks)
+    if isinstance(commit_suggestions, CommitSuggestions):
+        commit_suggestions = commit_suggestions.commit_suggestions
+
+    def print_failed_hunks(failed_hunks: Dict[int, str], action: str):
+        for index, error in failed_hunks.items():
+            filename = hunk_index[index].path
+            console.print(
+                f"[red]{action} snippet {index} of {escape(filename)}:[/] "
+                f"{escape(error)}"
+            )
+
+    # The next suggestions are rendered and checked while the user reads the current one
+    review_pipeline = ReviewPipeline(
+        commit_suggestions,
+        modified_code_snippets,
+        hunks,
+        hunk_index,
+        staging_backend,
+        console,
+        profiler,
+        viewer_options=viewer_options,
+    )
+
     console.print("[blue bold]Modified Code:[/]")
     # Show the user each commit suggestion
-    for commit_suggestion in commit_suggestions.commit_suggestions:
-        # Show all the code changes associated with the suggested commit
-        for code_snippet_index in commit_suggestion.code_snippet_indices:
-            modified_code = modified_code_snippets.modified_code_snippets[
-                code_snippet_index
-            ]
-
-            table = Table()
-            table.add_column(modified_code.filename)
-            table.add_row(color_code(modified_code.modified_code))
-            console.print(table)
-
-        # Show the suggested commit message
-        console.print(f"[bold blue]Suggested Message:[/] {commit_suggestion.message}")
-
-        # Ask the user if they accept the suggested commit message
-        accepted_suggested_commit = Confirm.ask(
-            "Would you like to accept the suggested commit?"
-        )
+    try:
+        for prepared in review_pipeline:
+            commit_suggestion = prepared.suggestion
+            # Show all the code changes associated with the suggested commit, one table per file
+            with profiler.span("show"):
+                for renderable in prepared.renderables:
+                    console.print(renderable)
 
-        # Execute git commands depending on response
-        console.print("[blue]Staging code snippets...[/]")
-        if accepted_suggested_commit:
-            for index in commit_suggestion.code_snippet_indices:
-                hunk = hunks.hunks[index]
-                # I'll have to work with this:  git diff | git apply --cached
-                git_diff_bytes = "".join(
-                    [
-                        hunk.file_header,
-                        "\n",
-                        hunk.index_line,
-                        "\n",
-                        hunk.file_path_indicators,
-                        "\n",
-                        hunk.hunk_header,
-                        "\n",
-                        hunk.modified_code,
-                        "\n",
-                    ]
-                )
-                subprocess.run(
-                    ["git", "apply", "--cached", "-"],
-                    input=git_diff_bytes,
-                    text=True,
-                    cwd=repo.working_dir,
+                # Show the suggested commit message
+                console.print(
+                    f"[bold blue]Suggested Message:[/] {commit_suggestion.message}"
                 )
-            console.print("[blue]Executing git commit...[/]")
-            subprocess.run(["git", "commit", "-m", f"{commit_suggestion.message}"])
-            console.print("[blue]Finished making git commit!")
+                # Flag conflicts before asking
+                print_failed_hunks(prepared.check.failed_hunks, "Can't stage")
+
+            # Ask the user if they accept the suggested commit message
+            with profiler.span("user prompt"):
+                if prepared.cut_lines:
+                    # Long hunks were cut off, so offer to show all of them in a pager
+                    console.print(
+                        f"[yellow]{prepared.cut_lines} more lines are not shown, "
+                        "enter `v` to view every line[/]"
+                    )
+                    answer = "v"
+                    while answer == "v":
+                        answer = Prompt.ask(
+                            "Would you like to accept the suggested commit?",
+                            choices=["y", "n", "v"],
+                        )
+                        if answer == "v":
+                            page_suggestion(
+                                console,
+                                commit_suggestion,
+                                modified_code_snippets,
+                                hunk_index,
+                            )
+                    accepted_suggested_commit = answer == "y"
+                else:
+                    accepted_suggested_commit = Confirm.ask(
+                        "Would you like to accept the suggested commit?"
+                    )
+
+            # Execute git commands depending on response
+            console.print("[blue]Staging code snippets...[/]")
+            if accepted_suggested_commit:
+                with profiler.span("stage") as span:
+                    staging_result = staging_backend.stage(
+                        hunks, commit_suggestion.code_snippet_indices, hunk_index
+                    )
+                    span.count(
+                        hunks=len(staging_result.staged_indices),
+                        failed_hunks=len(staging_result.failed_hunks),
+                    )
+                review_pipeline.staged(prepared)
+                print_failed_hunks(staging_result.failed_hunks, "Failed to stage")
+                console.print("[blue]Executing git commit...[/]")
+                with profiler.span("commit"):
+                    committed = staging_backend.commit(commit_suggestion.message)
+                if committed:
+                    console.print("[blue]Finished making git commit!")
+                else:
+                    console.print("[red]Nothing was committed![/]")
+    except BaseException:
+        # An error or Ctrl-C mid review leaves nothing half done
+        staging_backend.abort()
+        raise
+    if not staging_backend.finish():
+        console.print(
+            "[red]HEAD moved during the review, so none of the commits were made![/]"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="commit-suggestions",
+        description="Suggest commits for the changes in the current git repository.",
+    )
+    parser.add_argument(
+        "--model", default=DEFAULT_MODEL, help="OpenAI model used for suggestions"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["openai", "stub"],
+        default="openai",
+        help="Ask OpenAI (or the server at --base-url), or a built-in stub that needs no network",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="URL of an OpenAI-compatible API, e.g. a local inference server",
+    )
+    parser.add_argument(
+        "--stub-latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="How long the stub backend takes to answer each request",
+    )
+    parser.add_argument(
+        "--diff-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Collect `git diff` with N processes, each diffing and parsing a shard of the changed paths",
+    )
+    parser.add_argument(
+        "--split-hunks",
+        action="store_true",
+        help="Split hunks at the unchanged lines between their changes, so each part can go into a different commit",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=positive_int,
+        default=DEFAULT_TOKEN_BUDGET,
+        help="Maximum estimated tokens of code snippets sent in one request",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of requests sent to OpenAI at the same time",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read or write cached suggestions in the `.git` directory",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse the last run's suggestions for unchanged hunks and only send new or changed hunks",
+    )
+    parser.add_argument(
+        "--compact-prompt",
+        action="store_true",
+        help="Send snippets in a terse line format, summarizing lockfile, generated, whitespace-only, and duplicate hunks",
+    )
+    parser.add_argument(
+        "--context-lines",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Only send N unchanged lines around each change",
+    )
+    parser.add_argument(
+        "--pre-group",
+        action="store_true",
+        help="Cluster related hunks locally and send each cluster to the model in the same request",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Suggest one commit per local cluster of hunks without calling OpenAI",
+    )
+    parser.add_argument(
+        "--max-lines",
+        type=int,
+        default=200,
+        metavar="N",
+        help="Show at most N lines of each hunk while reviewing, offering a pager for the rest (0 shows every line)",
+    )
+    parser.add_argument(
+        "--review-context",
+        type=int,
+        default=3,
+        metavar="N",
+        help="Collapse unchanged lines further than N lines from a change while reviewing (-1 shows every line)",
+    )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for every suggestion before showing the first one",
+    )
+    parser.add_argument(
+        "--staging",
+        choices=["subprocess", "in-process", "transaction"],
+        default="subprocess",
+        help="Stage and commit with the git CLI, in process with GitPython, or in a temporary index with HEAD moved once at the end",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Apply every suggestion without prompting and print a JSON report",
+    )
+    parser.add_argument(
+        "--repos",
+        nargs="+",
+        metavar="PATH",
+        help="Repositories to process concurrently in batch mode",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes used for --repos (defaults to the number of cores)",
+    )
+    parser.add_argument(
+        "--async-pipeline",
+        action="store_true",
+        help="In batch mode, parse the diff, request suggestions, and commit them at the same time in one event loop",
+    )
+    parser.add_argument(
+        "--output",
+        default="-",
+        help="File the batch mode JSON report is written to (defaults to stdout)",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["table", "json", "chrome"],
+        help="Record the time and work of each stage and report it as a table, JSON, or Chrome trace",
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="File the json or chrome profile is written to",
+    )
+    args = parser.parse_args(argv)
+    if args.async_pipeline:
+        if not (args.batch or args.repos):
+            parser.error("--async-pipeline only works in batch mode")
+        if (
+            args.incremental
+            or args.pre_group
+            or args.offline
+            or args.diff_workers
+            or args.staging != "subprocess"
+        ):
+            parser.error(
+                "--async-pipeline can't be combined with --incremental, --pre-group, "
+                "--offline, --diff-workers, or --staging"
+            )
+    return args
+
+
+def get_prompt_encoding(args: argparse.Namespace) -> "PromptEncoding":
+    """Get the prompt encoding chosen on the command line."""
+    from commit_suggestions.models import PromptEncoding
+
+    return PromptEncoding(compact=args.compact_prompt, context_lines=args.context_lines)
+
+
+def get_backend_config(args: argparse.Namespace) -> "BackendConfig":
+    """Get the model backend chosen on the command line."""
+    from commit_suggestions.models import BackendConfig
+
+    return BackendConfig(
+        provider=args.backend, base_url=args.base_url, latency=args.stub_latency
+    )
+
+
+def get_viewer_options(args: argparse.Namespace) -> "ViewerOptions":
+    """Get how much of each hunk is shown while reviewing."""
+    from commit_suggestions.models import ViewerOptions
+
+    return ViewerOptions(
+        max_lines=args.max_lines or None,
+        context_lines=None if args.review_context < 0 else args.review_context,
+    )
+
+
+def main_batch(args: argparse.Namespace):
+    """Run batch mode and write the JSON report."""
+    from commit_suggestions.batch import run_batches
+
+    reports = run_batches(
+        args.repos or ["."],
+        workers=args.workers,
+        model=args.model,
+        token_budget=args.token_budget,
+        concurrency=args.concurrency,
+        use_cache=not args.no_cache,
+        incremental=args.incremental,
+        staging=args.staging,
+        encoding=get_prompt_encoding(args),
+        pre_group=args.pre_group,
+        offline=args.offline,
+        backend_config=get_backend_config(args),
+        diff_workers=args.diff_workers,
+        split_hunks=args.split_hunks,
+        async_pipeline=args.async_pipeline,
+    )
+    report_json = json.dumps(
+        [report.model_dump(mode="json") for report in reports], indent=2
+    )
+    if args.output == "-":
+        print(report_json)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(report_json + "\n")
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.batch or args.repos:
+        main_batch(args)
+        return
 
+    profiler = Profiler(enabled=args.profile is not None)
+    try:
+        # Exit before loading the heavy imports when there is nothing to do
+        with profiler.span("check for changes"):
+            has_changes = has_unstaged_changes()
+        if has_changes is False:
+            print("There are no changes! Exiting Program!")
+            return
+        run_interactive(args, profiler)
+    finally:
+        if args.profile is not None:
+            profiler.write(args.profile, get_console(), args.profile_output)
+
+
+def has_unstaged_changes() -> Optional[bool]:
+    """Check for unstaged changes with `git diff --quiet`, or None if git failed (e.g. not a repository)."""
+    result = subprocess.run(
+        ["git", "diff", "--quiet"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode in (0, 1):
+        return result.returncode == 1
+    return None
+
+
+def report_first_suggestion(
+    commit_suggestions: Iterable["CommitSuggestion"], profiler: Profiler
+) -> Iterator["CommitSuggestion"]:
+    """Pass streamed suggestions through, printing how long the first one took to arrive."""
+    commit_suggestions = iter(commit_suggestions)
+    start = time.perf_counter()
+    with profiler.span("first suggestion"):
+        first_suggestion = next(commit_suggestions, None)
+    if first_suggestion is None:
+        return
+    get_console().print(
+        f"[yellow]First suggestion ready after {time.perf_counter() - start:.2f} s[/]"
+    )
+    yield first_suggestion
+    yield from commit_suggestions
+
+
+def run_interactive(args: argparse.Namespace, profiler: Profiler):
+    """Suggest commits for the current repository and review them with the user."""
+    from commit_suggestions.cache import ResponseCache
+    from commit_suggestions.diff_collection import iter_parallel_hunks
+    from commit_suggestions.grouping import OFFLINE_MODEL, suggest_commits_offline
+    from commit_suggestions.hunk_index import HunkIndex
+    from commit_suggestions.hunk_splitting import iter_split_hunks
+    from commit_suggestions.incremental import generate_incrementally, get_state_path
+    from commit_suggestions.llm import (
+        generate_commit_suggestions,
+        iter_commit_suggestions,
+    )
+    from commit_suggestions.models import Hunks
+    from commit_suggestions.staging import (
+        InProcessStagingBackend,
+        SubprocessStagingBackend,
+        TransactionStagingBackend,
+    )
+    from commit_suggestions.utils import (
+        get_snippets_from_hunks,
+        iter_git_diff_lines,
+        iter_hunks,
+    )
+    from git import Repo
+
+    console = get_console()
 
-def main():
     # Get differences between working directory and git HEAD
     console.rule("[bold blue]GATHERING CHANGES TO CODEBASE[/]")
     console.print("[yellow]Parsing `git diff` into code snippets...[/]")
     current_repo = Repo()
-    diff_txt = current_repo.git.diff()
-    hunks = parse_git_diff_into_hunks(diff_txt)
+    hunks = Hunks(hunks=[])
+    hunk_index = HunkIndex()
+    with profiler.span("diff and parse") as span:
+        if args.diff_workers:
+            diff_hunks = iter_parallel_hunks(
+                current_repo.working_dir, args.diff_workers
+            )
+        else:
+            diff_lines = iter_git_diff_lines(current_repo.working_dir)
+            if profiler.enabled:
+                diff_lines = count_line_bytes(diff_lines, span)
+            diff_hunks = iter_hunks(diff_lines)
+        if args.split_hunks:
+            diff_hunks = iter_split_hunks(diff_hunks)
+        # Index each hunk's file and line range as it is parsed
+        for hunk in diff_hunks:
+            hunks.hunks.append(hunk)
+            hunk_index.add(hunk)
+        span.count(hunks=len(hunks.hunks))
     if len(hunks.hunks) == 0:
         console.print("There are no changes! Exiting Program!")
         return
-    modified_code_snippets = get_snippets_from_hunks(hunks)
+    with profiler.span("snippets") as span:
+        modified_code_snippets = get_snippets_from_hunks(hunks, hunk_index)
+        span.count(snippets=len(modified_code_snippets.modified_code_snippets))
     console.print("[green]Done parsing `git diff`![/]")
 
-    # Create a openai client
-    client = OpenAI()
-
-    commit_message_generator_prompt = f"""
-    You are a commit message generator. You will be given a series of code changes (parsed from the `git diff` command), and you are expected
-    to return suggested git commits.
-
-    Input Details:
-    * The code changes are called modified code snippets.
-    * A modified code snippet contains:
-        * `filename` (The filepath to the modified code)
-        * `start_line` and `end_line` (line numbers of changes in `filename`)
-        * `modified_code` (the actual code change)
-    * The order that the code changes are given does not matter, so do not assume that the changes are in sequential order.
-
-    Output Details:
-    * Each commit suggestion should include:
-        * A commit message (following Conventional Commits Format)
-        * The modified code snippet indices from the input associated with the commit.
-            * Possible indices are in the range 0-{len(modified_code_snippets.modified_code_snippets) - 1}
-            * Don't be afraid to group hunks that you think are related!
-    * The commits should be ordered logically, grouping related changes together (e.g., refactoring before feature additions).
-    * The git commit suggestion is made up of a suggested message and modified code snippets to stage.
-        * The generated message should use conventional commit standards. The `start_line` should be the line number the code snippet starts on and the `end_line` should be the end line of the code snippet.
-    * Commit messages should be concise and clear (limit the subject line to 72 characters).
-    """
+    if args.staging == "in-process":
+        staging_backend = InProcessStagingBackend(current_repo)
+    elif args.staging == "transaction":
+        staging_backend = TransactionStagingBackend(current_repo.working_dir)
+    else:
+        staging_backend = SubprocessStagingBackend(current_repo.working_dir)
 
     # Ask chat gpt for commit suggestions
     console.rule("[bold blue]CREATING COMMITS[/]")
     console.print("[yellow]Creating commit suggestions...[/]")
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        store=True,
-        messages=[
-            {
-                "role": "system",
-                "content": commit_message_generator_prompt,
-            },
-            {
-                "role": "user",
-                "content": modified_code_snippets.model_dump_json(indent=2),
-            },
-        ],
-        response_format=CommitSuggestions,
-    )
-
-    commit_suggestions = completion.choices[0].message.parsed
+    options = dict(
+        model=args.model,
+        token_budget=args.token_budget,
+        concurrency=args.concurrency,
+        cache=None
+        if args.no_cache
+        else ResponseCache.for_git_dir(current_repo.git_dir),
+        profiler=profiler,
+        encoding=get_prompt_encoding(args),
+        pre_group=args.pre_group,
+        backend_config=get_backend_config(args),
+    )
+
+    # Review suggestions as they stream in, unless the whole answer is needed first
+    if not (args.no_stream or args.offline or args.incremental):
+        console.rule("[bold blue]SUGGESTING COMMITS![/]")
+        prompt_user(
+            report_first_suggestion(
+                iter_commit_suggestions(modified_code_snippets, **options), profiler
+            ),
+            modified_code_snippets,
+            hunks,
+            current_repo,
+            staging_backend,
+            profiler,
+            hunk_index,
+            get_viewer_options(args),
+        )
+        console.print("Exiting Program! You're so good at commits ;)")
+        return
+
+    generate = partial(generate_commit_suggestions, **options)
+    if args.offline:
+        generate = suggest_commits_offline
+    if args.incremental:
+        commit_suggestions = generate_incrementally(
+            modified_code_snippets,
+            get_state_path(current_repo.git_dir),
+            OFFLINE_MODEL if args.offline else args.model,
+            generate,
+        )
+    else:
+        commit_suggestions = generate(modified_code_snippets)
     if commit_suggestions is None:
         console.print("There was an error generating prompts! Exiting Program!")
         return
     console.print("[yellow]Done creating commit suggestions![/]")
 
     console.rule("[bold blue]SUGGESTING COMMITS![/]")
-    prompt_user(commit_suggestions, modified_code_snippets, hunks, current_repo)
+    prompt_user(
+        commit_suggestions,
+        modified_code_snippets,
+        hunks,
+        current_repo,
+        staging_backend,
+        profiler,
+        hunk_index,
+        get_viewer_options(args),
+    )
     console.print("Exiting Program! You're so good at commits ;)")
 
 
 if __name__ == "__main__":
-    print("Hello")
     main()
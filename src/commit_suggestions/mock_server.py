@@ -0,0 +1,225 @@
+"""A local OpenAI-compatible server answering chat completions with deterministic commit suggestions.
+
+Usage: python -m commit_suggestions.mock_server [--port 8000] [--latency 0.2]
+
+Point the tool at it with `--base-url http://127.0.0.1:8000/v1` to run or load-test without network access.
+"""
+
+from commit_suggestions.grouping import suggest_commits_offline
+from commit_suggestions.models import ModifiedCodeSnippet, ModifiedCodeSnippets
+from commit_suggestions.prompt_encoding import estimate_tokens
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pydantic import ValidationError
+from typing import List, Optional
+import argparse
+import json
+import re
+import threading
+import time
+
+COMPACT_HEADER_PATTERN = re.compile(r"^### (\d+) (.+) (\d+)-(\d+)(?: \(.*\))?$")
+
+# Characters of the completion sent in each streamed chunk
+STREAM_CHUNK_SIZE = 16
+
+
+def parse_user_content(content: str) -> ModifiedCodeSnippets:
+    """Read the snippets back from a request in the JSON or compact prompt encoding."""
+    try:
+        return ModifiedCodeSnippets.model_validate_json(content)
+    except ValidationError:
+        pass
+
+    snippets: List[ModifiedCodeSnippet] = []
+    code_lines: List[str] = []
+    for line in content.split("\n"):
+        match = COMPACT_HEADER_PATTERN.match(line)
+        if match is None:
+            code_lines.append(line)
+            continue
+        if snippets:
+            snippets[-1].modified_code = "\n".join(code_lines)
+        code_lines = []
+        _, filename, start_line, end_line = match.groups()
+        snippets.append(
+            ModifiedCodeSnippet(
+                filename=filename,
+                modified_code="",
+                start_line=int(start_line),
+                end_line=int(end_line),
+            )
+        )
+    if snippets:
+        snippets[-1].modified_code = "\n".join(code_lines)
+    return ModifiedCodeSnippets(modified_code_snippets=snippets)
+
+
+class MockServer(ThreadingHTTPServer):
+    """Serves `/v1/chat/completions` and counts requests and connections, e.g. to check keep-alive reuse."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), MockRequestHandler)
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockServer":
+        """Serve requests on a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+
+        messages = request["messages"]
+        user_content = next(
+            message["content"] for message in messages if message["role"] == "user"
+        )
+        content = suggest_commits_offline(
+            parse_user_content(user_content)
+        ).model_dump_json()
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        completion_tokens = estimate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-mock-{self.server.requests}"
+        if request.get("stream"):
+            self.send_stream(request, completion_id, content, usage)
+            return
+        self.send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    def send_stream(self, request: dict, completion_id: str, content: str, usage: dict):
+        """Send the completion as server-sent events, a few characters at a time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data: str):
+            event = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+
+        def send_chunk(delta: dict, finish_reason: Optional[str] = None, **extra):
+            send_event(
+                json.dumps(
+                    {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": delta,
+                                "finish_reason": finish_reason,
+                            }
+                        ]
+                        if delta is not None
+                        else [],
+                        **extra,
+                    }
+                )
+            )
+
+        send_chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(content), STREAM_CHUNK_SIZE):
+            send_chunk({"content": content[start : start + STREAM_CHUNK_SIZE]})
+        send_chunk({}, "stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_chunk(None, usage=usage)
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to wait before answering"
+    )
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.port, args.latency)
+    print(f"Serving mock completions at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
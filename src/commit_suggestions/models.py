@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 
 
 class AddedFiles(BaseModel):
@@ -17,6 +17,9 @@ class ModifiedCodeSnippet(BaseModel):
     modified_code: str
     start_line: int
     end_line: int
+    # The kind of a file-level change (e.g. "binary" or "rename"), whose code is a one-line
+    # summary. It is left out of prompts, which only show the summary.
+    file_change: Optional[str] = Field(default=None, exclude=True)
 
 
 class ModifiedCodeSnippets(BaseModel):
@@ -54,3 +57,96 @@ class CommitSuggestion(BaseModel):
 
 class CommitSuggestions(BaseModel):
     commit_suggestions: List[CommitSuggestion]
+
+
+class TokenUsage(BaseModel):
+    """Tokens used by requests to the model."""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+    def add(self, usage):
+        """Add the `usage` of a completion to the totals."""
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.total_tokens += usage.total_tokens
+
+
+class StagingResult(BaseModel):
+    """The outcome of staging a set of hunks."""
+
+    staged_indices: List[int]
+    failed_hunks: Dict[int, str]
+
+
+class HunkMapping(BaseModel):
+    """Where the hunk behind a code snippet index is in the repository."""
+
+    index: int
+    filename: str
+    start_line: int
+    end_line: int
+
+
+class CommitResult(BaseModel):
+    """The outcome of applying a single commit suggestion."""
+
+    message: str
+    code_snippet_indices: List[int]
+    staging_result: StagingResult
+    committed: bool
+
+
+class BatchReport(BaseModel):
+    """The machine-readable result of processing one repository in batch mode."""
+
+    repo: str
+    suggestions: Optional[CommitSuggestions] = None
+    hunks: List[HunkMapping] = []
+    commits: List[CommitResult] = []
+    timings: Dict[str, float] = {}
+    usage: TokenUsage = TokenUsage()
+    error: Optional[str] = None
+
+
+class HunkAssignment(BaseModel):
+    """A hunk from an earlier run and the commit suggestion it was assigned to."""
+
+    filename: str
+    content_hash: str
+    suggestion_index: Optional[int]
+
+
+class IncrementalState(BaseModel):
+    """The hunks and commit suggestions of the last run, used to only re-analyze changed hunks."""
+
+    model: str
+    messages: List[str]
+    hunks: List[HunkAssignment]
+
+
+class PromptEncoding(BaseModel):
+    """How code snippets are written into the prompt sent to the model."""
+
+    compact: bool = False
+    context_lines: Optional[int] = None
+
+
+class BackendConfig(BaseModel):
+    """Which model backend answers requests for commit suggestions."""
+
+    # "openai" (OpenAI or any OpenAI-compatible `base_url`) or "stub"
+    provider: str = "openai"
+    base_url: Optional[str] = None
+    # Seconds the stub backend waits before answering
+    latency: float = 0.0
+
+
+class ViewerOptions(BaseModel):
+    """How much of each hunk is shown while reviewing suggestions."""
+
+    # Lines shown per hunk before the rest is cut off (None shows every line)
+    max_lines: Optional[int] = 200
+    # Unchanged lines kept around each change, collapsing longer runs (None keeps all)
+    context_lines: Optional[int] = 3
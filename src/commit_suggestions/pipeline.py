@@ -0,0 +1,304 @@
+from commit_suggestions.backends import LLMBackend, create_backend
+from commit_suggestions.cache import ResponseCache, can_cache
+from commit_suggestions.config import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MODEL,
+    DEFAULT_TOKEN_BUDGET,
+)
+from commit_suggestions.hunk_index import HunkIndex
+from commit_suggestions.hunk_splitting import iter_split_hunks
+from commit_suggestions.llm import BatchPlanner, stream_commit_suggestions_async
+from commit_suggestions.models import (
+    BackendConfig,
+    BatchReport,
+    CommitResult,
+    CommitSuggestion,
+    CommitSuggestions,
+    Hunk,
+    HunkMapping,
+    Hunks,
+    ModifiedCodeSnippets,
+    PromptEncoding,
+    StagingResult,
+    TokenUsage,
+)
+from commit_suggestions.prompt_encoding import (
+    DEFAULT_ENCODING,
+    encode_snippet,
+    estimate_tokens,
+)
+from commit_suggestions.staging import stage_steps
+from commit_suggestions.utils import get_snippet_from_hunk, iter_hunks
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import codecs
+import io
+import subprocess
+import time
+
+# Bytes read from the `git diff` pipe at a time
+DIFF_CHUNK_SIZE = 1 << 16
+
+
+async def run_git_async(
+    repo_dir: str, *args: str, input: Optional[str] = None
+) -> Tuple[int, str, str]:
+    """Run git without blocking the event loop, returning its exit code, output, and errors."""
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        *args,
+        cwd=repo_dir,
+        stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(
+        None if input is None else input.encode("utf-8", "surrogateescape")
+    )
+    assert process.returncode is not None
+    return (
+        process.returncode,
+        stdout.decode("utf-8", "replace").strip(),
+        stderr.decode("utf-8", "replace").strip(),
+    )
+
+
+async def aiter_git_diff_lines(repo_dir: str) -> AsyncIterator[str]:
+    """Stream the lines of `git diff` like `iter_git_diff_lines`, without blocking the event loop."""
+    process = await asyncio.create_subprocess_exec(
+        "git", "diff", cwd=repo_dir, stdout=subprocess.PIPE
+    )
+    assert process.stdout is not None
+    # Decode and translate line endings the same way as a text mode pipe
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")("replace"), translate=True
+    )
+    # The start of a line that continues in the next chunk
+    pending: List[str] = []
+    finished = False
+    try:
+        while chunk := await process.stdout.read(DIFF_CHUNK_SIZE):
+            *lines, rest = decoder.decode(chunk).split("\n")
+            if lines:
+                lines[0] = "".join(pending) + lines[0]
+                pending = []
+                for line in lines:
+                    yield line
+            pending.append(rest)
+        last_line = "".join(pending) + decoder.decode(b"", final=True)
+        if last_line:
+            yield last_line
+        finished = True
+    finally:
+        if not finished and process.returncode is None:
+            process.kill()
+        return_code = await process.wait()
+    if return_code != 0:
+        raise subprocess.CalledProcessError(return_code, ["git", "diff"])
+
+
+async def aiter_file_hunks(
+    repo_dir: str, split_hunks: bool = False
+) -> AsyncIterator[List[Hunk]]:
+    """Yield the hunks of `git diff` one file at a time, parsing each file as soon as its lines are in."""
+    file_lines: List[str] = []
+    async for line in aiter_git_diff_lines(repo_dir):
+        # Every line of a file's diff is prefixed, so only file headers start like this
+        if line.startswith("diff --git") and file_lines:
+            yield parse_file_hunks(file_lines, split_hunks)
+            file_lines = []
+        file_lines.append(line)
+    if file_lines:
+        yield parse_file_hunks(file_lines, split_hunks)
+
+
+def parse_file_hunks(file_lines: List[str], split_hunks: bool) -> List[Hunk]:
+    hunks = iter_hunks(file_lines)
+    if split_hunks:
+        hunks = iter_split_hunks(hunks)
+    return list(hunks)
+
+
+async def stream_repo_suggestions(
+    repo_dir: str,
+    backend: LLMBackend,
+    hunks: Hunks,
+    hunk_index: HunkIndex,
+    modified_code_snippets: ModifiedCodeSnippets,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    cache: Optional[ResponseCache] = None,
+    usage: Optional[TokenUsage] = None,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+    split_hunks: bool = False,
+    timings: Optional[Dict[str, float]] = None,
+) -> AsyncIterator[CommitSuggestion]:
+    """Diff and parse a repository while requesting suggestions for the parts that are parsed.
+
+    `hunks`, `hunk_index`, and `modified_code_snippets` are filled in as the diff is parsed,
+    and each batch is sent as soon as it is full, instead of after the whole diff. Batches
+    follow the order of the diff, which keeps files of a directory together. The time the
+    diff took is stored under "parse" in `timings` if given.
+    """
+    start = time.perf_counter()
+    snippets = modified_code_snippets.modified_code_snippets
+    snippet_tokens: List[int] = []
+
+    async def iter_batches() -> AsyncIterator[List[int]]:
+        planner = BatchPlanner(token_budget)
+        async for file_hunks in aiter_file_hunks(repo_dir, split_hunks):
+            file_indices: List[int] = []
+            for hunk in file_hunks:
+                file_indices.append(len(hunks.hunks))
+                hunks.hunks.append(hunk)
+                snippets.append(get_snippet_from_hunk(hunk, hunk_index.add(hunk)))
+                snippet_tokens.append(
+                    estimate_tokens(encode_snippet(snippets[-1], encoding))
+                )
+            for batch in planner.add(file_indices, snippet_tokens):
+                yield batch
+        if timings is not None:
+            timings["parse"] = time.perf_counter() - start
+        for batch in planner.finish():
+            yield batch
+
+    async for suggestion in stream_commit_suggestions_async(
+        backend,
+        modified_code_snippets,
+        model=model,
+        token_budget=token_budget,
+        concurrency=concurrency,
+        cache=cache,
+        usage=usage,
+        encoding=encoding,
+        batches=iter_batches(),
+    ):
+        yield suggestion
+
+
+async def stage_hunks_async(
+    hunks: Hunks,
+    indices: Sequence[int],
+    repo_dir: str,
+    hunk_index: Optional[HunkIndex] = None,
+) -> StagingResult:
+    """Like `staging.stage_hunks`, but run `git apply` and `git add` without blocking the event loop."""
+    steps = stage_steps(hunks, indices, hunk_index=hunk_index)
+    try:
+        args, patch = next(steps)
+        while True:
+            return_code, _, error = await run_git_async(repo_dir, *args, input=patch)
+            args, patch = steps.send((return_code, error))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_pipeline(
+    repo_dir: str,
+    model: str = DEFAULT_MODEL,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    use_cache: bool = True,
+    encoding: Optional[PromptEncoding] = None,
+    backend_config: Optional[BackendConfig] = None,
+    split_hunks: bool = False,
+    apply: bool = True,
+) -> BatchReport:
+    """Suggest commits for a repository and apply them, overlapping every stage in one event loop.
+
+    The diff is parsed while `git diff` is still running, batches are sent to the model as
+    soon as they are parsed, and each suggestion is staged and committed while later ones
+    are still being generated. Suggestions of different batches are committed in the order
+    they arrive. Pass `apply=False` to only collect the suggestions.
+
+    Since the stages overlap, each timing is from the start of the run to the end of its stage.
+    """
+    report = BatchReport(repo=repo_dir)
+    run_start = time.perf_counter()
+    suggestions: List[CommitSuggestion] = []
+    hunks = Hunks(hunks=[])
+    hunk_index = HunkIndex()
+    commit_queue: asyncio.Queue = asyncio.Queue()
+
+    async def apply_commits():
+        # Commits are made one at a time, since they share the index
+        while (suggestion := await commit_queue.get()) is not None:
+            staging_result = await stage_hunks_async(
+                hunks, suggestion.code_snippet_indices, repo_dir, hunk_index
+            )
+            committed = False
+            if staging_result.staged_indices:
+                return_code, _, _ = await run_git_async(
+                    repo_dir, "commit", "-q", "-m", suggestion.message
+                )
+                committed = return_code == 0
+            report.commits.append(
+                CommitResult(
+                    message=suggestion.message,
+                    code_snippet_indices=suggestion.code_snippet_indices,
+                    staging_result=staging_result,
+                    committed=committed,
+                )
+            )
+        report.timings["apply"] = time.perf_counter() - run_start
+
+    committer = asyncio.create_task(apply_commits())
+    try:
+        cache = None
+        if use_cache and can_cache(backend_config):
+            return_code, git_dir, error = await run_git_async(
+                repo_dir, "rev-parse", "--absolute-git-dir"
+            )
+            if return_code != 0:
+                raise RuntimeError(error)
+            cache = ResponseCache.for_git_dir(git_dir)
+
+        async with create_backend(
+            backend_config, max_connections=concurrency
+        ) as backend:
+            async for suggestion in stream_repo_suggestions(
+                repo_dir,
+                backend,
+                hunks,
+                hunk_index,
+                ModifiedCodeSnippets(modified_code_snippets=[]),
+                model=model,
+                token_budget=token_budget,
+                concurrency=concurrency,
+                cache=cache,
+                usage=report.usage,
+                encoding=encoding or DEFAULT_ENCODING,
+                split_hunks=split_hunks,
+                timings=report.timings,
+            ):
+                suggestions.append(suggestion)
+                if apply:
+                    commit_queue.put_nowait(suggestion)
+        report.timings["generate"] = time.perf_counter() - run_start
+        report.suggestions = CommitSuggestions(commit_suggestions=suggestions)
+
+        commit_queue.put_nowait(None)
+        await committer
+    except Exception as error:
+        # Report the error like batch mode does, instead of raising it
+        report.error = f"{type(error).__name__}: {error}"
+    finally:
+        if not committer.done():
+            # Let the suggestion being committed finish, so nothing is left staged
+            # without its commit, and drop the ones still waiting
+            while not commit_queue.empty():
+                commit_queue.get_nowait()
+            commit_queue.put_nowait(None)
+            await asyncio.gather(committer, return_exceptions=True)
+        report.hunks = [
+            HunkMapping(
+                index=metadata.index,
+                filename=metadata.path,
+                start_line=metadata.new_start,
+                end_line=metadata.new_start + metadata.new_length,
+            )
+            for metadata in hunk_index
+        ]
+        report.timings["total"] = time.perf_counter() - run_start
+    return report
@@ -0,0 +1,178 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
+import json
+import time
+
+if TYPE_CHECKING:
+    from rich.console import Console
+
+
+class Span:
+    """A timed stage of a run, with counters such as bytes, hunks, or tokens processed."""
+
+    __slots__ = ("profiler", "name", "track", "start", "end", "counters")
+
+    def __init__(self, profiler: "Profiler", name: str, track: int = 0):
+        self.profiler = profiler
+        self.name = name
+        self.track = track
+        self.start = 0.0
+        self.end = 0.0
+        self.counters: Dict[str, int] = {}
+
+    def count(self, **counters: int):
+        """Add to the span's counters."""
+        for counter, value in counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end = time.perf_counter()
+        self.profiler.spans.append(self)
+
+
+class NullSpan:
+    """A span that records nothing, used when profiling is turned off."""
+
+    __slots__ = ()
+
+    def count(self, **counters: int):
+        pass
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler:
+    """Records spans around the stages of a run.
+
+    A disabled profiler hands out a shared no-op span, so instrumentation costs a method call.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.spans: List[Span] = []
+        self.created = time.perf_counter()
+
+    def span(self, name: str, track: int = 0):
+        """Create a span to use as a context manager. Spans on different tracks may overlap."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, track)
+
+    def totals(self) -> Dict[str, Dict[str, Any]]:
+        """Sum the time and counters of spans with the same name, in the order they first ran."""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            total = totals.setdefault(
+                span.name, {"calls": 0, "seconds": 0.0, "counters": {}}
+            )
+            total["calls"] += 1
+            total["seconds"] += span.seconds
+            for counter, value in span.counters.items():
+                total["counters"][counter] = total["counters"].get(counter, 0) + value
+        return totals
+
+    def to_json(self) -> str:
+        """Serialize the spans and their totals as JSON."""
+        return json.dumps(
+            {
+                "totals": self.totals(),
+                "spans": [
+                    {
+                        "name": span.name,
+                        "track": span.track,
+                        "start": span.start - self.created,
+                        "seconds": span.seconds,
+                        "counters": span.counters,
+                    }
+                    for span in self.spans
+                ],
+            },
+            indent=2,
+        )
+
+    def to_chrome_trace(self) -> str:
+        """Serialize the spans in the Chrome trace event format (for chrome://tracing or Perfetto)."""
+        return json.dumps(
+            {
+                "traceEvents": [
+                    {
+                        "name": span.name,
+                        "ph": "X",
+                        "ts": (span.start - self.created) * 1e6,
+                        "dur": span.seconds * 1e6,
+                        "pid": 1,
+                        "tid": span.track,
+                        "args": span.counters,
+                    }
+                    for span in self.spans
+                ]
+            }
+        )
+
+    def print_table(self, console: "Console"):
+        """Print a summary table of time spent in each stage."""
+        from rich.table import Table
+
+        totals = self.totals()
+        total_seconds = time.perf_counter() - self.created
+
+        table = Table(title="Profile")
+        table.add_column("Stage")
+        table.add_column("Calls", justify="right")
+        table.add_column("Wall Time", justify="right")
+        table.add_column("% of Run", justify="right")
+        table.add_column("Counters")
+        for name, total in totals.items():
+            table.add_row(
+                name,
+                str(total["calls"]),
+                f"{total['seconds'] * 1000:.1f} ms",
+                f"{total['seconds'] / total_seconds * 100:.1f}%",
+                ", ".join(
+                    f"{counter}={value:,}"
+                    for counter, value in total["counters"].items()
+                ),
+            )
+        console.print(table)
+
+    def write(self, output_format: str, console: "Console", path: Optional[str] = None):
+        """Write the profile as a `table`, `json`, or `chrome` trace."""
+        if output_format == "table":
+            self.print_table(console)
+            return
+
+        contents = self.to_json() if output_format == "json" else self.to_chrome_trace()
+        if path is None:
+            path = f"commit-suggestions-{output_format}-profile.json"
+        with open(path, "w") as profile_file:
+            profile_file.write(contents)
+        console.print(f"[blue]Wrote {output_format} profile to {path}[/]")
+
+
+def count_line_bytes(lines: Iterable[str], span: Span) -> Iterator[str]:
+    """Pass lines through while counting their bytes (roughly, as characters) in `span`."""
+    num_bytes = 0
+    try:
+        for line in lines:
+            num_bytes += len(line) + 1
+            yield line
+    finally:
+        span.count(bytes=num_bytes)
+
+
+# Shared disabled profiler used as the default everywhere
+NULL_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,188 @@
+from commit_suggestions.models import (
+    ModifiedCodeSnippet,
+    ModifiedCodeSnippets,
+    PromptEncoding,
+)
+from fnmatch import fnmatch
+from typing import Dict, List, Optional, Tuple
+import os
+
+# Files whose changes are produced by tools, so their contents say little about intent
+GENERATED_FILE_PATTERNS = (
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "poetry.lock",
+    "uv.lock",
+    "Pipfile.lock",
+    "Cargo.lock",
+    "Gemfile.lock",
+    "composer.lock",
+    "go.sum",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*_pb2.py",
+    "*_pb2_grpc.py",
+    "*.pb.go",
+)
+
+DEFAULT_ENCODING = PromptEncoding()
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a piece of text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def is_generated_file(filename: str) -> bool:
+    """Check if a file is a lockfile or another generated file."""
+    basename = os.path.basename(filename)
+    return any(fnmatch(basename, pattern) for pattern in GENERATED_FILE_PATTERNS)
+
+
+def count_changed_lines(modified_code: str) -> Tuple[int, int]:
+    """Count the added and removed lines of a snippet."""
+    added = removed = 0
+    for line in modified_code.split("\n"):
+        if line.startswith("+"):
+            added += 1
+        elif line.startswith("-"):
+            removed += 1
+    return added, removed
+
+
+def is_whitespace_only(modified_code: str) -> bool:
+    """Check if a snippet only changes whitespace, including blank lines."""
+    added_lines: List[str] = []
+    removed_lines: List[str] = []
+    for line in modified_code.split("\n"):
+        if line.startswith("+"):
+            added_lines.append("".join(line[1:].split()))
+        elif line.startswith("-"):
+            removed_lines.append("".join(line[1:].split()))
+    if not added_lines and not removed_lines:
+        return False
+    return [line for line in added_lines if line] == [
+        line for line in removed_lines if line
+    ]
+
+
+def trim_context(modified_code: str, context_lines: int) -> str:
+    """Keep at most `context_lines` unchanged lines around changes, replacing the rest with a `=` line."""
+    lines = modified_code.split("\n")
+    # Distance of each line to the closest changed line, looking both ways
+    distances = [len(lines)] * len(lines)
+    distance = len(lines)
+    for position, line in enumerate(lines):
+        distance = 0 if line[:1] in ("+", "-", "\\") else distance + 1
+        distances[position] = distance
+    distance = len(lines)
+    for position in range(len(lines) - 1, -1, -1):
+        distance = 0 if lines[position][:1] in ("+", "-", "\\") else distance + 1
+        distances[position] = min(distances[position], distance)
+
+    trimmed_lines: List[str] = []
+    skipped_lines: List[str] = []
+
+    def flush_skipped_lines():
+        marker = f"= {len(skipped_lines)} unchanged lines"
+        # Keep short runs since the marker would be longer than the lines it replaces
+        if sum(len(line) + 1 for line in skipped_lines) > len(marker):
+            trimmed_lines.append(marker)
+        else:
+            trimmed_lines.extend(skipped_lines)
+        skipped_lines.clear()
+
+    for line, distance in zip(lines, distances):
+        if distance <= context_lines:
+            if skipped_lines:
+                flush_skipped_lines()
+            trimmed_lines.append(line)
+        else:
+            skipped_lines.append(line)
+    if skipped_lines:
+        flush_skipped_lines()
+    return "\n".join(trimmed_lines)
+
+
+def prepare_code(snippet: ModifiedCodeSnippet, encoding: PromptEncoding) -> str:
+    """Get the code of a snippet as it is sent to the model."""
+    if encoding.context_lines is None:
+        return snippet.modified_code
+    return trim_context(snippet.modified_code, encoding.context_lines)
+
+
+def summarize_snippet(snippet: ModifiedCodeSnippet) -> Optional[str]:
+    """Summarize snippets the model doesn't need to read, or None if it should see the code."""
+    if snippet.file_change is not None:
+        # File-level changes are already a one-line summary
+        return snippet.modified_code
+    if is_generated_file(snippet.filename):
+        kind = "lockfile or generated file"
+    elif is_whitespace_only(snippet.modified_code):
+        kind = "whitespace-only change"
+    else:
+        return None
+    added, removed = count_changed_lines(snippet.modified_code)
+    return f"{kind}: {added} added, {removed} removed lines"
+
+
+def encode_compact(
+    modified_code_snippets: ModifiedCodeSnippets, encoding: PromptEncoding
+) -> str:
+    """Write snippets in a terse line-oriented format, summarizing and deduplicating hunks."""
+    parts: List[str] = []
+    first_index_of_code: Dict[str, int] = {}
+    for index, snippet in enumerate(modified_code_snippets.modified_code_snippets):
+        header = (
+            f"### {index} {snippet.filename} {snippet.start_line}-{snippet.end_line}"
+        )
+        summary = summarize_snippet(snippet)
+        if summary is not None:
+            parts.append(f"{header} ({summary})")
+            continue
+
+        code = prepare_code(snippet, encoding)
+        duplicate_of = first_index_of_code.setdefault(code, index)
+        if duplicate_of != index:
+            parts.append(f"{header} (same change as {duplicate_of})")
+            continue
+        parts.append(header)
+        parts.append(code)
+    return "\n".join(parts)
+
+
+def encode_snippet(
+    snippet: ModifiedCodeSnippet, encoding: PromptEncoding = DEFAULT_ENCODING
+) -> str:
+    """Encode a single snippet on its own, used to estimate its share of a request."""
+    if encoding.compact:
+        return encode_compact(
+            ModifiedCodeSnippets(modified_code_snippets=[snippet]), encoding
+        )
+    if encoding.context_lines is not None:
+        snippet = snippet.model_copy(
+            update={"modified_code": prepare_code(snippet, encoding)}
+        )
+    return snippet.model_dump_json(indent=2)
+
+
+def encode_snippets(
+    modified_code_snippets: ModifiedCodeSnippets,
+    encoding: PromptEncoding = DEFAULT_ENCODING,
+) -> str:
+    """Encode snippets as the user message of a request."""
+    if encoding.compact:
+        return encode_compact(modified_code_snippets, encoding)
+    if encoding.context_lines is not None:
+        modified_code_snippets = ModifiedCodeSnippets(
+            modified_code_snippets=[
+                snippet.model_copy(
+                    update={"modified_code": prepare_code(snippet, encoding)}
+                )
+                for snippet in modified_code_snippets.modified_code_snippets
+            ]
+        )
+    return modified_code_snippets.model_dump_json(indent=2)
@@ -0,0 +1,204 @@
+from commit_suggestions.hunk_index import HunkIndex
+from commit_suggestions.models import (
+    CommitSuggestion,
+    Hunks,
+    ModifiedCodeSnippets,
+    StagingResult,
+    ViewerOptions,
+)
+from commit_suggestions.profiling import NULL_PROFILER, Profiler
+from commit_suggestions.staging import StagingBackend
+from commit_suggestions.viewer import render_code
+from rich.console import Console, RenderableType
+from rich.segment import Segments
+from rich.table import Table
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import queue
+import threading
+
+# Number of suggestions prepared ahead of the one being reviewed
+DEFAULT_LOOKAHEAD = 2
+
+# Worker spans overlap the prompts of the main thread, so they get their own track
+WORKER_TRACK = -1
+
+
+class PreparedSuggestion:
+    """A suggestion with its tables already rendered and its hunks already checked against the index."""
+
+    __slots__ = (
+        "suggestion",
+        "renderables",
+        "cut_lines",
+        "check",
+        "checked_generation",
+    )
+
+    def __init__(
+        self,
+        suggestion: CommitSuggestion,
+        renderables: List[RenderableType],
+        cut_lines: int,
+        check: StagingResult,
+        checked_generation: int,
+    ):
+        self.suggestion = suggestion
+        self.renderables = renderables
+        # Lines left out of the renderables by the viewer's line cap
+        self.cut_lines = cut_lines
+        self.check = check
+        self.checked_generation = checked_generation
+
+
+def render_suggestion(
+    suggestion: CommitSuggestion,
+    modified_code_snippets: ModifiedCodeSnippets,
+    hunk_index: HunkIndex,
+    console: Console,
+    profiler: Profiler = NULL_PROFILER,
+    track: int = 0,
+    viewer_options: Optional[ViewerOptions] = None,
+) -> Tuple[List[RenderableType], int]:
+    """Render the changes of a suggestion, one table per file, into segments ready to print.
+
+    Returns the renderables and the number of lines cut off by the line cap.
+    """
+    renderables: List[RenderableType] = []
+    cut_lines = 0
+    with profiler.span("render", track) as span:
+        for filename, file_hunks in hunk_index.group_by_file(
+            suggestion.code_snippet_indices
+        ).items():
+            table = Table()
+            table.add_column(filename)
+            for metadata in file_hunks:
+                modified_code = modified_code_snippets.modified_code_snippets[
+                    metadata.index
+                ].modified_code
+                code_text, code_cut_lines = render_code(modified_code, viewer_options)
+                table.add_row(code_text)
+                cut_lines += code_cut_lines
+                span.count(snippets=1, bytes=len(modified_code))
+            renderables.append(Segments(list(console.render(table))))
+    return renderables, cut_lines
+
+
+class ReviewPipeline:
+    """Prepares the next suggestions on a worker thread while the user reviews the current one.
+
+    Preparing a suggestion renders its tables and checks (and, for `git apply`, builds) its patch.
+    Suggestions may come from a stream, and are prepared in the order they arrive.
+    """
+
+    def __init__(
+        self,
+        commit_suggestions: Iterable[CommitSuggestion],
+        modified_code_snippets: ModifiedCodeSnippets,
+        hunks: Hunks,
+        hunk_index: HunkIndex,
+        staging_backend: StagingBackend,
+        console: Console,
+        profiler: Profiler = NULL_PROFILER,
+        lookahead: int = DEFAULT_LOOKAHEAD,
+        viewer_options: Optional[ViewerOptions] = None,
+    ):
+        self.commit_suggestions = commit_suggestions
+        self.modified_code_snippets = modified_code_snippets
+        self.hunks = hunks
+        self.hunk_index = hunk_index
+        self.staging_backend = staging_backend
+        self.console = console
+        self.profiler = profiler
+        self.viewer_options = viewer_options
+        # Holds prepared suggestions, then the error that stopped the worker (if any), then `done`
+        self.prepared: queue.Queue = queue.Queue(maxsize=max(lookahead, 1))
+        self.done = object()
+        self.stopped = threading.Event()
+        # Incremented whenever the index changes, so checks made before can be redone
+        self.generation = 0
+        # The generation each hunk was last touched by staging itself or a hunk overlapping it
+        self.hunk_generations: Dict[int, int] = {}
+        self.thread = threading.Thread(target=self._prepare_all, daemon=True)
+
+    def prepare(
+        self, suggestion: CommitSuggestion, track: int = 0
+    ) -> PreparedSuggestion:
+        """Render a suggestion and check its hunks against the index."""
+        renderables, cut_lines = render_suggestion(
+            suggestion,
+            self.modified_code_snippets,
+            self.hunk_index,
+            self.console,
+            self.profiler,
+            track,
+            self.viewer_options,
+        )
+        return PreparedSuggestion(
+            suggestion, renderables, cut_lines, *self._check(suggestion, track)
+        )
+
+    def _check(self, suggestion: CommitSuggestion, track: int):
+        generation = self.generation
+        with self.profiler.span("check", track) as span:
+            check = self.staging_backend.check(
+                self.hunks, suggestion.code_snippet_indices, self.hunk_index
+            )
+            span.count(failed_hunks=len(check.failed_hunks))
+        return check, generation
+
+    def _put(self, item) -> bool:
+        """Wait for room in the queue, returning False if the pipeline was closed meanwhile."""
+        while not self.stopped.is_set():
+            try:
+                self.prepared.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _prepare_all(self):
+        commit_suggestions = iter(self.commit_suggestions)
+        try:
+            for suggestion in commit_suggestions:
+                if not self._put(self.prepare(suggestion, WORKER_TRACK)):
+                    break
+        except BaseException as error:
+            self._put(error)
+        finally:
+            close = getattr(commit_suggestions, "close", None)
+            if close is not None:
+                close()
+            self._put(self.done)
+
+    def staged(self, prepared: PreparedSuggestion):
+        """Record that a suggestion was staged, so checks of later suggestions with overlapping hunks are redone."""
+        self.generation += 1
+        for index in prepared.suggestion.code_snippet_indices:
+            metadata = self.hunk_index[index]
+            # `git apply` finds hunks by their context, so other lines of the file don't matter
+            for overlapping in self.hunk_index.lookup(
+                metadata.path, metadata.new_start, metadata.new_last_line
+            ):
+                self.hunk_generations[overlapping.index] = self.generation
+
+    def __iter__(self) -> Iterator[PreparedSuggestion]:
+        self.thread.start()
+        try:
+            while (item := self.prepared.get()) is not self.done:
+                if isinstance(item, BaseException):
+                    raise item
+                # Staging since the check may have changed what applies
+                if any(
+                    self.hunk_generations.get(index, 0) > item.checked_generation
+                    for index in item.suggestion.code_snippet_indices
+                ):
+                    item.check, item.checked_generation = self._check(
+                        item.suggestion, 0
+                    )
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop preparing suggestions. The worker stops once its current suggestion is prepared."""
+        self.stopped.set()
@@ -0,0 +1,605 @@
+from commit_suggestions.hunk_index import HunkIndex, HunkMetadata
+from commit_suggestions.hunk_splitting import merge_overlapping_hunks
+from commit_suggestions.models import Hunk, Hunks, StagingResult
+from abc import ABC, abstractmethod
+from git import IndexFile, Repo
+from git.index.fun import read_header
+from git.objects import Blob
+from gitdb import IStream
+from io import BytesIO
+from typing import Dict, Generator, List, Optional, Sequence, Tuple, TypeVar
+import os
+import shutil
+import subprocess
+
+
+T = TypeVar("T")
+
+# The arguments of a git command, and the patch piped into it (if any)
+GitCommand = Tuple[List[str], Optional[str]]
+# The exit code and errors of a git command
+GitResult = Tuple[int, str]
+# Decisions that yield the git commands they need, get their results back, and return T
+GitSteps = Generator[GitCommand, GitResult, T]
+
+
+class PatchError(ValueError):
+    """Raised when hunks can't be applied to the content in the index."""
+
+
+def build_patch(hunks: Sequence[Hunk]) -> str:
+    """Combine hunks into a single patch with one header per file."""
+    # Group hunks by their file while keeping the order files first appear in
+    file_hunks: Dict[Tuple[str, str, str], List[Hunk]] = {}
+    for hunk in hunks:
+        file_key = (hunk.file_header, hunk.index_line, hunk.file_path_indicators)
+        file_hunks.setdefault(file_key, []).append(hunk)
+
+    patch_parts: List[str] = []
+    for (
+        file_header,
+        index_line,
+        file_path_indicators,
+    ), hunks_in_file in file_hunks.items():
+        # File-level changes (e.g. renames) may have no index or ---/+++ lines
+        for line in (file_header, index_line, file_path_indicators):
+            if line:
+                patch_parts.extend([line, "\n"])
+        # Pieces of a split hunk staged together share lines, which `git apply` rejects
+        for hunk in merge_overlapping_hunks(hunks_in_file):
+            # File-level changes are metadata-only patches without a hunk
+            if hunk.hunk_header:
+                patch_parts.extend([hunk.hunk_header, "\n", hunk.modified_code, "\n"])
+    return "".join(patch_parts)
+
+
+def get_metadata(
+    hunks: Hunks, indices: Sequence[int], hunk_index: Optional[HunkIndex] = None
+) -> List[HunkMetadata]:
+    """Get the metadata of the hunks at `indices` from `hunk_index`, or parse it if not given."""
+    if hunk_index is not None:
+        return [hunk_index[index] for index in indices]
+    return [HunkMetadata.from_hunk(hunks.hunks[index], index) for index in indices]
+
+
+def is_binary_change(metadata: HunkMetadata) -> bool:
+    """Check if a hunk is a binary file change, which a text patch can't carry."""
+    return metadata.file_change == "binary"
+
+
+def get_paths(hunk_metadata: Sequence[HunkMetadata]) -> List[str]:
+    """Get the sorted old and new paths of the files the hunks change."""
+    paths = set()
+    for metadata in hunk_metadata:
+        paths.update(
+            path for path in (metadata.old_path, metadata.new_path) if path is not None
+        )
+    return sorted(paths)
+
+
+def add_paths_command(hunk_metadata: Sequence[HunkMetadata]) -> GitCommand:
+    """Stage whole files (e.g. binary changes) from the working tree with `git add`, including deletions."""
+    return ["--literal-pathspecs", "add", "-A", "--", *get_paths(hunk_metadata)], None
+
+
+def apply_patch_command(patch: str, check: bool = False) -> GitCommand:
+    """Apply a patch to the index with `git apply --cached`, or only check that it applies."""
+    return ["apply", "--cached", *(["--check"] if check else []), "-"], patch
+
+
+def run_git_command(
+    command: GitCommand, repo_dir: str, env: Optional[Dict[str, str]] = None
+) -> GitResult:
+    """Run a git command, returning its exit code and errors.
+
+    `env` is the environment of `git`, e.g. with `GIT_INDEX_FILE` to patch another index.
+    """
+    args, patch = command
+    result = subprocess.run(
+        ["git", *args],
+        input=patch,
+        text=True,
+        cwd=repo_dir,
+        capture_output=True,
+        env=env,
+    )
+    return result.returncode, result.stderr.strip()
+
+
+def run_git_steps(
+    steps: GitSteps[T], repo_dir: str, env: Optional[Dict[str, str]] = None
+) -> T:
+    """Run each git command the steps ask for, and return what they decide."""
+    try:
+        command = next(steps)
+        while True:
+            command = steps.send(run_git_command(command, repo_dir, env))
+    except StopIteration as stop:
+        return stop.value
+
+
+def find_failed_hunks(
+    hunks: Hunks, indices: Sequence[int]
+) -> GitSteps[Tuple[List[int], Dict[int, str]]]:
+    """Check each hunk at `indices` on its own, returning the ones that apply and the errors of the rest."""
+    failed_hunks: Dict[int, str] = {}
+    valid_indices: List[int] = []
+    for index in indices:
+        return_code, error = yield apply_patch_command(
+            build_patch([hunks.hunks[index]]), check=True
+        )
+        if return_code == 0:
+            valid_indices.append(index)
+        else:
+            failed_hunks[index] = error
+    return valid_indices, failed_hunks
+
+
+def check_steps(
+    hunks: Hunks, indices: Sequence[int], hunk_index: Optional[HunkIndex] = None
+) -> GitSteps[Tuple[str, StagingResult]]:
+    """Check with `git apply --check --cached` which hunks at `indices` would stage, without changing the index.
+
+    Returns the combined patch along with the result, so that staging can reuse it.
+    """
+    sorted_indices, binary_indices = split_binary_changes(hunks, indices, hunk_index)
+    patch = build_patch([hunks.hunks[index] for index in sorted_indices])
+    valid_indices: List[int] = sorted_indices
+    failed_hunks: Dict[int, str] = {}
+    if sorted_indices:
+        return_code, _ = yield apply_patch_command(patch, check=True)
+        if return_code != 0:
+            valid_indices, failed_hunks = yield from find_failed_hunks(
+                hunks, sorted_indices
+            )
+    # Binary changes are staged from the working tree, which always works
+    return patch, StagingResult(
+        staged_indices=sorted(valid_indices + binary_indices), failed_hunks=failed_hunks
+    )
+
+
+def check_hunks(
+    hunks: Hunks,
+    indices: Sequence[int],
+    repo_dir: str,
+    env: Optional[Dict[str, str]] = None,
+    hunk_index: Optional[HunkIndex] = None,
+) -> Tuple[str, StagingResult]:
+    """Run `check_steps` with `git` in `repo_dir`."""
+    return run_git_steps(check_steps(hunks, indices, hunk_index), repo_dir, env)
+
+
+def split_binary_changes(
+    hunks: Hunks, indices: Sequence[int], hunk_index: Optional[HunkIndex] = None
+) -> Tuple[List[int], List[int]]:
+    """Split sorted `indices` into hunks that can be patched and binary file changes."""
+    patch_indices: List[int] = []
+    binary_indices: List[int] = []
+    for metadata in get_metadata(hunks, sorted(set(indices)), hunk_index):
+        if is_binary_change(metadata):
+            binary_indices.append(metadata.index)
+        else:
+            patch_indices.append(metadata.index)
+    return patch_indices, binary_indices
+
+
+def stage_steps(
+    hunks: Hunks,
+    indices: Sequence[int],
+    patch: Optional[str] = None,
+    hunk_index: Optional[HunkIndex] = None,
+) -> GitSteps[StagingResult]:
+    """Stage the hunks at `indices` with a single `git apply` call.
+
+    `git apply` is all or nothing, so if the combined patch fails each hunk is checked on
+    its own to report which ones are at fault, and the rest are staged together.
+    `patch` is the combined patch of the hunks, if it was already built. Binary file
+    changes can't be patched, so their files are staged with `git add` instead.
+    `hunk_index` holds the hunks' paths, if given.
+
+    Each git command is yielded and its result sent back, so the same decisions are made
+    whether git runs blocking (`stage_hunks`) or in an event loop.
+    """
+    # Hunks in a file must be applied from top to bottom
+    sorted_indices, binary_indices = split_binary_changes(hunks, indices, hunk_index)
+    staged_indices: List[int] = []
+    failed_hunks: Dict[int, str] = {}
+    if binary_indices:
+        return_code, error = yield add_paths_command(
+            get_metadata(hunks, binary_indices, hunk_index)
+        )
+        if return_code == 0:
+            staged_indices.extend(binary_indices)
+        else:
+            failed_hunks.update((index, error) for index in binary_indices)
+    if not sorted_indices:
+        return StagingResult(staged_indices=staged_indices, failed_hunks=failed_hunks)
+
+    if patch is None:
+        patch = build_patch([hunks.hunks[index] for index in sorted_indices])
+    return_code, _ = yield apply_patch_command(patch)
+    if return_code == 0:
+        staged_indices.extend(sorted_indices)
+    else:
+        valid_indices, hunk_errors = yield from find_failed_hunks(hunks, sorted_indices)
+        failed_hunks.update(hunk_errors)
+        if valid_indices:
+            return_code, error = yield apply_patch_command(
+                build_patch([hunks.hunks[index] for index in valid_indices])
+            )
+            if return_code == 0:
+                staged_indices.extend(valid_indices)
+            else:
+                # The hunks only fail together, so none of them could be staged
+                failed_hunks.update((index, error) for index in valid_indices)
+    return StagingResult(
+        staged_indices=sorted(staged_indices), failed_hunks=failed_hunks
+    )
+
+
+def stage_hunks(
+    hunks: Hunks,
+    indices: Sequence[int],
+    repo_dir: str,
+    patch: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    hunk_index: Optional[HunkIndex] = None,
+) -> StagingResult:
+    """Run `stage_steps` with `git` in `repo_dir`, with `env` as the environment of every call."""
+    return run_git_steps(stage_steps(hunks, indices, patch, hunk_index), repo_dir, env)
+
+
+def apply_hunks_to_lines(
+    old_lines: List[str],
+    hunks: Sequence[Hunk],
+    hunk_metadata: Optional[Sequence[HunkMetadata]] = None,
+) -> List[str]:
+    """Apply the hunks of a single file to its lines (which keep their line endings).
+
+    `hunk_metadata` holds the metadata of each hunk, and is computed when it isn't given.
+    """
+    if hunk_metadata is None:
+        hunk_metadata = [HunkMetadata.from_hunk(hunk) for hunk in hunks]
+
+    sorted_pairs = sorted(zip(hunk_metadata, hunks), key=lambda pair: pair[0].old_start)
+    merged_hunks = merge_overlapping_hunks([hunk for _, hunk in sorted_pairs])
+    if len(merged_hunks) < len(sorted_pairs):
+        # Pieces of a split hunk that share lines are applied as one hunk
+        sorted_pairs = [(HunkMetadata.from_hunk(hunk), hunk) for hunk in merged_hunks]
+
+    new_lines: List[str] = []
+    position = 0
+    for metadata, hunk in sorted_pairs:
+        old_start, old_length = metadata.old_start, metadata.old_length
+        # Hunks that don't remove lines insert after `old_start` instead of at it
+        start = old_start - 1 if old_length > 0 else old_start
+        if start < position:
+            raise PatchError(f"Overlapping hunk: {hunk.hunk_header}")
+        new_lines.extend(old_lines[position:start])
+        position = start
+
+        expected_lines: List[str] = []
+        replacement_lines: List[str] = []
+        previous_marker = " "
+        code_lines = hunk.modified_code.split("\n") if hunk.modified_code else []
+        for code_line in code_lines:
+            marker, text = code_line[:1], code_line[1:]
+            if marker == "\\":
+                # "\ No newline at end of file" applies to the line before it
+                if previous_marker in "- " and expected_lines:
+                    expected_lines[-1] = expected_lines[-1].removesuffix("\n")
+                if previous_marker in "+ " and replacement_lines:
+                    replacement_lines[-1] = replacement_lines[-1].removesuffix("\n")
+                continue
+            if marker == "-":
+                expected_lines.append(text + "\n")
+            elif marker == "+":
+                replacement_lines.append(text + "\n")
+            else:
+                expected_lines.append(text + "\n")
+                replacement_lines.append(text + "\n")
+            previous_marker = marker or " "
+
+        if old_lines[position : position + len(expected_lines)] != expected_lines:
+            raise PatchError(f"Hunk doesn't match the index: {hunk.hunk_header}")
+        new_lines.extend(replacement_lines)
+        position += len(expected_lines)
+
+    new_lines.extend(old_lines[position:])
+    return new_lines
+
+
+class StagingBackend(ABC):
+    """Stages hunks and creates commits in a repository."""
+
+    @abstractmethod
+    def stage(
+        self,
+        hunks: Hunks,
+        indices: Sequence[int],
+        hunk_index: Optional[HunkIndex] = None,
+    ) -> StagingResult:
+        """Stage the hunks at `indices`, using `hunk_index` for their paths and line ranges if given."""
+
+    def check(
+        self,
+        hunks: Hunks,
+        indices: Sequence[int],
+        hunk_index: Optional[HunkIndex] = None,
+    ) -> StagingResult:
+        """Check which hunks at `indices` would stage without changing the index. This may run on another thread.
+
+        Backends that can't check ahead of time report every hunk as staging.
+        """
+        return StagingResult(staged_indices=sorted(set(indices)), failed_hunks={})
+
+    @abstractmethod
+    def commit(self, message: str) -> bool:
+        """Commit the staged changes, returning whether it succeeded."""
+
+    def finish(self) -> bool:
+        """Make the commits part of the branch, for backends that hold them back until the end.
+
+        Returns whether it succeeded. Backends that commit right away have nothing to do.
+        """
+        return True
+
+    def abort(self):
+        """Drop the commits that haven't been finished, leaving the repository as it was."""
+
+
+class SubprocessStagingBackend(StagingBackend):
+    """Stages hunks with `git apply` and commits with `git commit`."""
+
+    def __init__(self, repo_dir: str, quiet: bool = False):
+        self.repo_dir = repo_dir
+        self.quiet = quiet
+        # Patches built by `check`, reused when the same hunks are staged
+        self.patches: Dict[Tuple[int, ...], str] = {}
+        # The environment of every `git apply` and `git add` call
+        self.env: Optional[Dict[str, str]] = None
+
+    def stage(
+        self,
+        hunks: Hunks,
+        indices: Sequence[int],
+        hunk_index: Optional[HunkIndex] = None,
+    ) -> StagingResult:
+        patch = self.patches.pop(tuple(sorted(set(indices))), None)
+        return stage_hunks(hunks, indices, self.repo_dir, patch, self.env, hunk_index)
+
+    def check(
+        self,
+        hunks: Hunks,
+        indices: Sequence[int],
+        hunk_index: Optional[HunkIndex] = None,
+    ) -> StagingResult:
+        patch, result = check_hunks(hunks, indices, self.repo_dir, self.env, hunk_index)
+        self.patches[tuple(sorted(set(indices)))] = patch
+        return result
+
+    def commit(self, message: str) -> bool:
+        result = subprocess.run(
+            ["git", "commit", "-m", message],
+            cwd=self.repo_dir,
+            capture_output=self.quiet,
+        )
+        return result.returncode == 0
+
+
+class TransactionStagingBackend(SubprocessStagingBackend):
+    """Stages hunks in a temporary index and commits with `git write-tree` and `git commit-tree`.
+
+    Neither the index nor HEAD change until `finish`, which moves HEAD to the last commit
+    with one atomic `git update-ref` and puts the temporary index in place. If anything
+    fails before that, `abort` drops the temporary index and the repository is left as it
+    was. Unlike `git commit`, no hooks run.
+    """
+
+    def __init__(self, repo_dir: str, quiet: bool = False):
+        super().__init__(repo_dir, quiet)
+        self.repo_dir = os.path.abspath(repo_dir)
+        git_index_path = self._git("rev-parse", "--git-path", "index")
+        assert git_index_path is not None
+        self.index_path = os.path.join(self.repo_dir, git_index_path)
+        self.temp_index_path = f"{self.index_path}.commit-suggestions-{os.getpid()}"
+        # Start from the real index, so changes staged before are committed too
+        if os.path.exists(self.index_path):
+            shutil.copyfile(self.index_path, self.temp_index_path)
+        self.env = {**os.environ, "GIT_INDEX_FILE": self.temp_index_path}
+        # Both are None on a branch without commits
+        self.start_head = self._git("rev-parse", "--verify", "-q", "HEAD", check=False)
+        self.head = self.start_head
+        self.tree = self._git("rev-parse", "--verify", "-q", "HEAD^{tree}", check=False)
+        self.commits: List[str] = []
+
+    def _git(
+        self, *args: str, input: Optional[str] = None, check: bool = True
+    ) -> Optional[str]:
+        """Run a plumbing command against the temporary index and return its output.
+
+        Failures raise if `check` is set, and return None otherwise.
+        """
+        result = subprocess.run(
+            ["git", *args],
+            cwd=self.repo_dir,
+            input=input,
+            capture_output=True,
+            text=True,
+            env=self.env,
+        )
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(
+                result.returncode, result.args, result.stdout, result.stderr
+            )
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def commit(self, message: str) -> bool:
+        tree = self._git("write-tree", check=False)
+        # Like `git commit`, there must be something to commit
+        if tree is None or tree == self.tree:
+            return False
+        parents = ["-p", self.head] if self.head else []
+        if not message.endswith("\n"):
+            message += "\n"
+        commit = self._git("commit-tree", tree, *parents, input=message, check=False)
+        if commit is None:
+            return False
+        self.head, self.tree = commit, tree
+        self.commits.append(commit)
+        return True
+
+    def finish(self) -> bool:
+        if self.head != self.start_head:
+            # Only moves HEAD if it still points where it did when we started
+            moved = self._git(
+                "update-ref",
+                "-m",
+                f"commit-suggestions: {len(self.commits)} commits",
+                "HEAD",
+                self.head,
+                # An empty old value means the branch must not exist yet
+                self.start_head or "",
+                check=False,
+            )
+            if moved is None:
+                self.abort()
+                return False
+        if os.path.exists(self.temp_index_path):
+            os.replace(self.temp_index_path, self.index_path)
+        return True
+
+    def abort(self):
+        # The commits stay in the object database until `git gc` prunes them
+        if os.path.exists(self.temp_index_path):
+            os.remove(self.temp_index_path)
+
+
+class InProcessStagingBackend(StagingBackend):
+    """Stages hunks by writing blobs and updating the index with GitPython, without a `git` process.
+
+    Files that can't be patched in process (new, deleted, or renamed files, or content that
+    doesn't match exactly) fall back to `git apply`.
+    """
+
+    def __init__(self, repo: Repo, quiet: bool = False):
+        self.repo = repo
+        self.fallback = SubprocessStagingBackend(repo.working_dir, quiet)
+
+    def _read_index(self) -> Optional[IndexFile]:
+        """Read the index, or None if GitPython can't (e.g. version 3 from `git add -N`).
+
+        Everything falls back to `git` when the index can't be read.
+        """
+        index_file = self.repo.index
+        try:
+            with open(index_file.path, "rb") as stream:
+                read_header(stream)
+        except FileNotFoundError:
+            # New repositories have no index yet, which GitPython reads as empty
+            return index_file
+        except (AssertionError, OSError, ValueError):
+            return None
+        return index_file
+
+    def stage(
+        self,
+        hunks: Hunks,
+        indices: Sequence[int],
+        hunk_index: Optional[HunkIndex] = None,
+    ) -> StagingResult:
+        index_file = self._read_index()
+        if index_file is None:
+            return self.fallback.stage(hunks, indices, hunk_index)
+        if hunk_index is None:
+            hunk_index = HunkIndex.from_hunks(hunks)
+
+        # Group the hunks by the file they modify
+        file_indices: Dict[str, List[int]] = {}
+        fallback_indices: List[int] = []
+        for index in sorted(set(indices)):
+            metadata = hunk_index[index]
+            if metadata.modifies_in_place:
+                file_indices.setdefault(metadata.path, []).append(index)
+            else:
+                fallback_indices.append(index)
+
+        new_blobs: List[Blob] = []
+        staged_indices: List[int] = []
+        for path, path_indices in file_indices.items():
+            try:
+                new_blobs.append(
+                    self._patch_blob(
+                        index_file,
+                        path,
+                        [hunks.hunks[index] for index in path_indices],
+                        [hunk_index[index] for index in path_indices],
+                    )
+                )
+                staged_indices.extend(path_indices)
+            except PatchError:
+                fallback_indices.extend(path_indices)
+        if new_blobs:
+            index_file.add(new_blobs, write=True)
+
+        failed_hunks: Dict[int, str] = {}
+        if fallback_indices:
+            fallback_result = self.fallback.stage(hunks, fallback_indices, hunk_index)
+            staged_indices.extend(fallback_result.staged_indices)
+            failed_hunks = fallback_result.failed_hunks
+
+        return StagingResult(
+            staged_indices=sorted(staged_indices), failed_hunks=failed_hunks
+        )
+
+    def check(
+        self,
+        hunks: Hunks,
+        indices: Sequence[int],
+        hunk_index: Optional[HunkIndex] = None,
+    ) -> StagingResult:
+        if self._read_index() is None:
+            # Keeps the checked patches for the fallback's `stage`
+            return self.fallback.check(hunks, indices, hunk_index)
+        # `git apply --check` accepts everything that can be patched in process
+        return check_hunks(
+            hunks, indices, self.repo.working_dir, hunk_index=hunk_index
+        )[1]
+
+    def _patch_blob(
+        self,
+        index_file,
+        path: str,
+        hunks: List[Hunk],
+        hunk_metadata: List[HunkMetadata],
+    ) -> Blob:
+        """Apply hunks to the indexed content of `path` and store the result as a new blob."""
+        entry = index_file.entries.get((path, 0))
+        if entry is None:
+            raise PatchError(f"{path} is not in the index")
+
+        old_data = self.repo.odb.stream(entry.binsha).read()
+        # Only split on "\n" like git does, keeping the line endings
+        old_lines = old_data.decode("utf-8", "surrogateescape").split("\n")
+        old_lines = [line + "\n" for line in old_lines[:-1]] + (
+            [old_lines[-1]] if old_lines[-1] else []
+        )
+        new_lines = apply_hunks_to_lines(old_lines, hunks, hunk_metadata)
+        new_data = "".join(new_lines).encode("utf-8", "surrogateescape")
+
+        istream = self.repo.odb.store(IStream("blob", len(new_data), BytesIO(new_data)))
+        return Blob(self.repo, istream.binsha, entry.mode, path)
+
+    def commit(self, message: str) -> bool:
+        index_file = self._read_index()
+        if index_file is None:
+            return self.fallback.commit(message)
+        tree = index_file.write_tree()
+        # Like `git commit`, there must be something to commit
+        if self.repo.head.is_valid():
+            if tree.binsha == self.repo.head.commit.tree.binsha:
+                return False
+        elif not index_file.entries:
+            return False
+        index_file.commit(message)
+        return True
@@ -0,0 +1,58 @@
+from commit_suggestions.models import CommitSuggestion
+from typing import List
+
+
+class SuggestionStreamParser:
+    """Incrementally parses streamed `CommitSuggestions` JSON, returning each suggestion once its object is complete.
+
+    Text is scanned once as it arrives, tracking nesting and strings, so parsing stays linear in the response size.
+    """
+
+    # `{"commit_suggestions": [ {...}, ... ]}` puts suggestions at this nesting depth
+    SUGGESTION_DEPTH = 3
+
+    def __init__(self):
+        self.text = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = -1
+
+    def feed(self, text: str) -> List[CommitSuggestion]:
+        """Add the next piece of the response, returning the suggestions it completed."""
+        self.text += text
+        completed: List[CommitSuggestion] = []
+        for position in range(self.position, len(self.text)):
+            character = self.text[position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif character == "\\":
+                    self.escaped = True
+                elif character == '"':
+                    self.in_string = False
+            elif character == '"':
+                self.in_string = True
+            elif character in "{[":
+                self.depth += 1
+                if character == "{" and self.depth == self.SUGGESTION_DEPTH:
+                    self.object_start = position
+            elif character in "}]":
+                if character == "}" and self.depth == self.SUGGESTION_DEPTH:
+                    completed.append(
+                        CommitSuggestion.model_validate_json(
+                            self.text[self.object_start : position + 1]
+                        )
+                    )
+                    self.object_start = -1
+                self.depth -= 1
+        self.position = len(self.text)
+
+        # Text before an unfinished suggestion is never needed again
+        cut = self.object_start if self.object_start >= 0 else self.position
+        self.text = self.text[cut:]
+        self.position -= cut
+        if self.object_start >= 0:
+            self.object_start = 0
+        return completed
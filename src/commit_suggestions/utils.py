@@ -1,10 +1,16 @@
+from commit_suggestions.hunk_index import (
+    HunkIndex,
+    HunkMetadata,
+    summarize_file_change,
+)
 from commit_suggestions.models import (
     Hunk,
     Hunks,
     ModifiedCodeSnippets,
     ModifiedCodeSnippet,
 )
-from typing import List
+from typing import Iterable, Iterator, List, Optional
+import subprocess
 
 
 def color_code(uncolored_code_txt: str) -> str:
@@ -26,93 +32,148 @@ def color_code(uncolored_code_txt: str) -> str:
     return "\n".join(colored_code_lines)
 
 
-def parse_git_diff_into_hunks(diff_txt: str) -> Hunks:
-    """Create parsed hunks from git diff txt."""
-    if not isinstance(diff_txt, str):
-        raise TypeError("Argument must be a string")
-
-    # Get rid of whitespace
-    lines = diff_txt.splitlines()
-
-    # Parse hunks from git diff text
-    file_header: str = ""
+def iter_git_diff_lines(repo_dir: str) -> Iterator[str]:
+    """Stream the lines of `git diff` from a pipe instead of buffering the whole output."""
+    process = subprocess.Popen(
+        ["git", "diff"],
+        cwd=repo_dir,
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    assert process.stdout is not None
+    finished = False
+    try:
+        for line in process.stdout:
+            yield line.rstrip("\n")
+        finished = True
+    finally:
+        # Closing the pipe early makes git exit, so waiting here never blocks
+        process.stdout.close()
+        return_code = process.wait()
+    if finished and return_code != 0:
+        raise subprocess.CalledProcessError(return_code, ["git", "diff"])
+
+
+def iter_hunks(lines: Iterable[str]) -> Iterator[Hunk]:
+    """Lazily parse hunks from `git diff` lines, yielding each hunk as soon as it is complete.
+
+    Files without hunks (binary files, pure renames, mode changes, and empty files) are
+    yielded as a single file-level change with an empty hunk header and no code.
+    """
+    line_iter = iter(lines)
+
+    file_header: Optional[str] = None
     index_line: str = ""
     file_path_indicators: str = ""
-    hunk_header: str = ""
-    modified_code: str = ""
-    line_index: int = 0
-    hunks = Hunks(hunks=[])
-    while line_index < len(lines):
-        # Set the hunk meta data for the hunks we're looking at
-        # NOTE: When we change this information, it means we're looking at hunks from a particular file
-        if lines[line_index].startswith("diff --git"):
-            file_header = lines[line_index]
-            line_index += 1
-
-            index_line = lines[line_index]
-            line_index += 1
-
-            file_path_indicators = "\n".join(lines[line_index : line_index + 2])
-            line_index += 2
-
-        # Set the hunk header information
-        hunk_header = lines[line_index]
-        line_index += 1
-
-        # Parse modified code in the hunk
-        modified_code_lines = []
-        while (
-            line_index < len(lines)
-            and not lines[line_index].startswith("@@")
-            and not lines[line_index].startswith("diff --git")
-        ):
-            modified_code_lines.append(lines[line_index])
-            line_index += 1
-        modified_code = "\n".join(modified_code_lines)
-
-        # Add hunk to list of hunks
-        hunks.hunks.append(
-            Hunk(
+    hunk_header: Optional[str] = None
+    extended_header_lines: List[str] = []
+    in_file_meta_data = False
+    modified_code_lines: List[str] = []
+
+    def flush() -> Optional[Hunk]:
+        """Finish the current hunk, or the current file if it had no hunks."""
+        if hunk_header is not None:
+            return Hunk(
                 file_header=file_header,
                 index_line=index_line,
                 file_path_indicators=file_path_indicators,
                 hunk_header=hunk_header,
-                modified_code=modified_code,
+                modified_code="\n".join(modified_code_lines),
             )
-        )
+        if in_file_meta_data:
+            return Hunk(
+                file_header=file_header,
+                index_line="\n".join(extended_header_lines),
+                file_path_indicators=file_path_indicators,
+                hunk_header="",
+                modified_code="",
+            )
+        return None
+
+    for line in line_iter:
+        # NOTE: When we see a file header, every following hunk belongs to that file
+        if line.startswith("diff --git"):
+            hunk = flush()
+            if hunk is not None:
+                yield hunk
+            file_header = line
+            file_path_indicators = ""
+            extended_header_lines = []
+            in_file_meta_data = True
+            hunk_header = None
+        elif in_file_meta_data:
+            if line.startswith("--- "):
+                file_path_indicators = "\n".join([line, next(line_iter, "")])
+            elif line.startswith("@@"):
+                # The meta data ends at the first hunk header. New and deleted files have
+                # a mode line before the index line, so all of them are kept together.
+                index_line = "\n".join(extended_header_lines)
+                in_file_meta_data = False
+                hunk_header = line
+                modified_code_lines = []
+            else:
+                # Mode, rename, copy, and index lines, or "Binary files ... differ"
+                extended_header_lines.append(line)
+        elif line.startswith("@@"):
+            yield flush()
+            hunk_header = line
+            modified_code_lines = []
+        elif hunk_header is not None:
+            modified_code_lines.append(line)
+
+    # Flush the last hunk in the diff
+    hunk = flush()
+    if hunk is not None:
+        yield hunk
 
-    return hunks
+
+def parse_git_diff_into_hunks(diff_txt: str) -> Hunks:
+    """Create parsed hunks from git diff txt."""
+    if not isinstance(diff_txt, str):
+        raise TypeError("Argument must be a string")
+
+    return Hunks(hunks=list(iter_hunks(diff_txt.splitlines())))
 
 
-def get_snippets_from_hunks(hunks: Hunks) -> ModifiedCodeSnippets:
+def get_snippet_from_hunk(
+    hunk: Hunk, metadata: Optional[HunkMetadata] = None
+) -> ModifiedCodeSnippet:
+    """Create a single code snippet from a parsed hunk and its metadata."""
+    if metadata is None:
+        metadata = HunkMetadata.from_hunk(hunk)
+
+    if metadata.file_change is not None:
+        # The model only needs a one-line summary of file-level changes
+        return ModifiedCodeSnippet(
+            filename=metadata.path,
+            start_line=0,
+            end_line=0,
+            modified_code=summarize_file_change(hunk.index_line, metadata),
+            file_change=metadata.file_change,
+        )
+    return ModifiedCodeSnippet(
+        filename=metadata.path,
+        start_line=metadata.new_start,
+        end_line=metadata.new_start + metadata.new_length,
+        modified_code=hunk.modified_code,
+    )
+
+
+def get_snippets_from_hunks(
+    hunks: Hunks, hunk_index: Optional[HunkIndex] = None
+) -> ModifiedCodeSnippets:
     """Create Code Snippets from a git diff."""
     if not isinstance(hunks, Hunks):
         raise TypeError("Argument must be `Hunks`")
+    if hunk_index is None:
+        hunk_index = HunkIndex.from_hunks(hunks)
 
     # Create modified code snippets from hunks
-    modified_code_snippets: ModifiedCodeSnippets = ModifiedCodeSnippets(
-        modified_code_snippets=[]
+    return ModifiedCodeSnippets(
+        modified_code_snippets=[
+            get_snippet_from_hunk(hunk, hunk_index[index])
+            for index, hunk in enumerate(hunks.hunks)
+        ]
     )
-    for hunk in hunks.hunks:
-        # Use the new filename as the filename in the code snippet
-        filename = hunk.file_path_indicators.split("+++ b/", 1)[1].split(" ", 1)[0]
-
-        # Use the index line to get the start and end lines of the code snippet
-        start_line, index_line = (
-            hunk.hunk_header.split("@@ ", 1)[1].split(" +", 1)[1].split(",", 1)
-        )
-        start_line = int(start_line)  # Cast string to integer
-        end_line = int(index_line.split(" ", 1)[0]) + start_line
-
-        # Get the modified code
-        modified_code = hunk.modified_code
-
-        modified_code_snippets.modified_code_snippets.append(
-            ModifiedCodeSnippet(
-                filename=filename,
-                start_line=start_line,
-                end_line=end_line,
-                modified_code=modified_code,
-            )
-        )
-    return modified_code_snippets
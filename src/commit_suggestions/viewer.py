@@ -0,0 +1,133 @@
+from collections import deque
+from commit_suggestions.hunk_index import HunkIndex
+from commit_suggestions.models import (
+    CommitSuggestion,
+    ModifiedCodeSnippets,
+    ViewerOptions,
+)
+from rich.console import Console
+from rich.text import Text
+from typing import Deque, Iterator, List, Optional, Tuple, Union
+
+# Longer lines (e.g. minified code) are cut off at this many characters
+MAX_LINE_LENGTH = 1000
+
+LINE_STYLES = {"+": "green", "-": "red", "\\": "dim"}
+COLLAPSED_STYLE = "dim italic"
+
+
+def iter_lines(code: str) -> Iterator[str]:
+    """Yield the lines of `code` one at a time, without splitting all of it up front."""
+    start = 0
+    while True:
+        end = code.find("\n", start)
+        if end < 0:
+            yield code[start:]
+            return
+        yield code[start:end]
+        start = end + 1
+
+
+def iter_visible_lines(
+    code: str, context_lines: Optional[int] = None
+) -> Iterator[Union[str, int]]:
+    """Yield the lines to show, collapsing runs of unchanged lines into the number of lines left out.
+
+    Only `context_lines` unchanged lines are kept next to each change. The run being
+    collapsed is never held in memory, only its first and last `context_lines` lines.
+    """
+    if context_lines is None:
+        yield from iter_lines(code)
+        return
+
+    head: List[str] = []
+    # One extra line, so a run only one line longer than its context is shown whole
+    tail: Deque[str] = deque(maxlen=context_lines + 1)
+    run_length = 0
+    seen_change = False
+
+    def flush_run(before_change: bool) -> Iterator[Union[str, int]]:
+        # Keep context after the previous change and before the next one
+        kept_head = context_lines if seen_change else 0
+        kept_tail = context_lines if before_change else 0
+        hidden = run_length - kept_head - kept_tail
+        run_lines = head + list(tail)
+        # A marker is only worth it when it replaces more than one line
+        if hidden <= 1:
+            yield from run_lines
+            return
+        yield from head[:kept_head]
+        yield hidden
+        yield from run_lines[len(run_lines) - kept_tail :]
+
+    for line in iter_lines(code):
+        if line[:1] in LINE_STYLES:
+            if run_length:
+                yield from flush_run(before_change=True)
+                head, run_length = [], 0
+                tail.clear()
+            seen_change = True
+            yield line
+            continue
+        run_length += 1
+        if len(head) < context_lines:
+            head.append(line)
+        else:
+            tail.append(line)
+    if run_length:
+        yield from flush_run(before_change=False)
+
+
+def render_code(code: str, options: Optional[ViewerOptions] = None) -> Tuple[Text, int]:
+    """Color added lines green and removed lines red with `Text` spans, stopping at the line cap.
+
+    Returns the text and the number of lines cut off by the cap, so work and memory don't
+    grow with the size of the hunk.
+    """
+    if options is None:
+        options = ViewerOptions()
+
+    text = Text()
+    shown_lines = 0
+    source_lines = 0
+    for line in iter_visible_lines(code, options.context_lines):
+        if options.max_lines is not None and shown_lines >= options.max_lines:
+            break
+        if shown_lines:
+            text.append("\n")
+        shown_lines += 1
+        if isinstance(line, int):
+            text.append(f"⋯ {line} unchanged lines", COLLAPSED_STYLE)
+            source_lines += line
+            continue
+        source_lines += 1
+        if len(line) > MAX_LINE_LENGTH:
+            line = line[:MAX_LINE_LENGTH] + "…"
+        text.append(line, LINE_STYLES.get(line[:1]))
+
+    cut_lines = 0
+    if options.max_lines is not None and shown_lines >= options.max_lines:
+        cut_lines = code.count("\n") + 1 - source_lines
+        if cut_lines > 0:
+            text.append(f"\n⋯ {cut_lines} more lines", COLLAPSED_STYLE)
+    return text, max(cut_lines, 0)
+
+
+def page_suggestion(
+    console: Console,
+    suggestion: CommitSuggestion,
+    modified_code_snippets: ModifiedCodeSnippets,
+    hunk_index: HunkIndex,
+):
+    """Show every line of a suggestion's changes in the system pager."""
+    full_view = ViewerOptions(max_lines=None, context_lines=None)
+    with console.pager(styles=True):
+        for filename, file_hunks in hunk_index.group_by_file(
+            suggestion.code_snippet_indices
+        ).items():
+            console.rule(filename)
+            for metadata in file_hunks:
+                modified_code = modified_code_snippets.modified_code_snippets[
+                    metadata.index
+                ].modified_code
+                console.print(render_code(modified_code, full_view)[0])
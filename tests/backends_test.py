@@ -0,0 +1,75 @@
+from commit_suggestions.backends import LLMBackend
+from commit_suggestions.llm import generate_commit_suggestions, plan_batches
+from commit_suggestions.mock_server import MockServer, parse_user_content
+from commit_suggestions.models import BackendConfig, PromptEncoding, TokenUsage
+from commit_suggestions.prompt_encoding import encode_snippets
+from tests.helpers import make_snippets
+import pytest
+
+
+def suggested_indices(commit_suggestions):
+    return sorted(
+        index
+        for suggestion in commit_suggestions.commit_suggestions
+        for index in suggestion.code_snippet_indices
+    )
+
+
+def test_stub_backend():
+    """Test that the stub backend suggests commits for every snippet and reports usage."""
+    snippets = make_snippets(["src/a.py", "docs/x.md", "src/a.py", "src/b.py"])
+    usage = TokenUsage()
+
+    suggestions = generate_commit_suggestions(
+        snippets,
+        token_budget=300,
+        usage=usage,
+        backend_config=BackendConfig(provider="stub", latency=0.01),
+    )
+
+    assert suggested_indices(suggestions) == [0, 1, 2, 3]
+    assert usage.prompt_tokens > 0
+    assert suggestions == generate_commit_suggestions(
+        snippets, token_budget=300, backend_config=BackendConfig(provider="stub")
+    )
+
+
+def test_mock_server_reuses_connections(monkeypatch):
+    """Test that batches sent to an OpenAI-compatible server share keep-alive connections."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    snippets = make_snippets([f"src/{number}.py" for number in range(12)])
+    batches = plan_batches(snippets, token_budget=300)
+
+    with MockServer(latency=0.01) as server:
+        suggestions = generate_commit_suggestions(
+            snippets,
+            token_budget=300,
+            concurrency=2,
+            backend_config=BackendConfig(base_url=server.base_url),
+        )
+
+    assert suggested_indices(suggestions) == list(range(12))
+    assert server.requests == len(batches) > 2
+    assert server.connections <= 2
+
+
+def test_parse_compact_user_content():
+    """Test that the mock server reads snippets back from the compact encoding."""
+    snippets = make_snippets(["a b.py", "c.py"])
+
+    encoded = encode_snippets(snippets, PromptEncoding(compact=True))
+
+    assert [
+        (snippet.filename, snippet.modified_code)
+        for snippet in parse_user_content(encoded).modified_code_snippets
+    ] == [("a b.py", "+" + "x" * 400), ("c.py", "")]
+
+
+def test_backend_must_implement_complete():
+    """Test that a backend without `complete` fails when it is created, not when it is asked."""
+
+    class IncompleteBackend(LLMBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
@@ -0,0 +1,87 @@
+from commit_suggestions import batch
+from commit_suggestions.batch import run_batch, run_batches
+from commit_suggestions.models import CommitSuggestion, CommitSuggestions
+from tests.helpers import git, init_repo
+import json
+import pytest
+import subprocess
+import sys
+
+
+@pytest.mark.parametrize("staging", ["subprocess", "in-process", "transaction"])
+def test_run_batch_applies_every_suggestion(
+    tmp_path, monkeypatch, git_identity, staging
+):
+    """Test that batch mode commits every suggestion and reports the hunk mappings."""
+    init_repo(tmp_path, {"a.txt": "1\na\n3\n", "b.txt": "1\nb\n3\n"})
+    (tmp_path / "a.txt").write_text("1\nchanged a\n3\n")
+    (tmp_path / "b.txt").write_text("1\nchanged b\n3\n")
+
+    def fake_generate(modified_code_snippets, usage, **kwargs):
+        usage.total_tokens += 10
+        return CommitSuggestions(
+            commit_suggestions=[
+                CommitSuggestion(message="fix: b", code_snippet_indices=[1]),
+                CommitSuggestion(message="fix: a", code_snippet_indices=[0]),
+            ]
+        )
+
+    monkeypatch.setattr(batch, "generate_commit_suggestions", fake_generate)
+    report = run_batch(str(tmp_path), staging=staging)
+
+    assert report.error is None
+    assert [hunk.filename for hunk in report.hunks] == ["a.txt", "b.txt"]
+    assert [commit.committed for commit in report.commits] == [True, True]
+    assert report.usage.total_tokens == 10
+    assert set(report.timings) == {"parse", "generate", "apply", "total"}
+    assert git(tmp_path, "log", "--format=%s") == "fix: a\nfix: b\ninit\n"
+
+
+def test_run_batches_reports_errors_per_repo(tmp_path):
+    """Test that a failing repository is reported without stopping the others."""
+    init_repo(tmp_path, {"a.txt": "a\n"})
+
+    reports = run_batches([str(tmp_path / "missing"), str(tmp_path)], workers=2)
+
+    assert [report.repo for report in reports] == [
+        str(tmp_path / "missing"),
+        str(tmp_path),
+    ]
+    assert reports[0].error is not None
+    # A clean repository has nothing to do
+    assert reports[1].error is None
+    assert reports[1].hunks == []
+
+
+@pytest.mark.parametrize("staging", ["subprocess", "in-process"])
+def test_batch_output_is_json(tmp_path, git_identity, staging):
+    """Test that the batch report is the only thing written to stdout, even when commits fall back to `git commit`."""
+    init_repo(tmp_path, {"a.txt": "a\n"})
+    (tmp_path / "a.txt").write_text("b\n")
+    (tmp_path / "new.txt").write_text("new\n")
+    # GitPython can't read the version 3 index this writes, so the in-process backend falls back
+    git(tmp_path, "add", "-N", "new.txt")
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "commit_suggestions.main",
+            "--batch",
+            "--backend",
+            "stub",
+            "--no-cache",
+            "--staging",
+            staging,
+        ],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    report = json.loads(result.stdout)[0]
+    assert report["error"] is None
+    assert report["commits"] and all(
+        commit["committed"] for commit in report["commits"]
+    )
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture
+def git_identity(monkeypatch):
+    """Let git commit without a configured user."""
+    for variable in ["GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"]:
+        monkeypatch.setenv(variable, "t")
+    for variable in ["GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"]:
+        monkeypatch.setenv(variable, "t@t")
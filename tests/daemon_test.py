@@ -0,0 +1,95 @@
+from commit_suggestions.api import SuggestionSession
+from commit_suggestions.daemon import get_default_socket_path, send_request, serve
+from commit_suggestions.models import BackendConfig
+from tests.helpers import imported_modules, init_repo
+import asyncio
+import os
+import pytest
+import stat
+
+
+def test_client_import_is_light():
+    """Test that the daemon's client side doesn't load the LLM, git, or UI stacks."""
+    result = imported_modules("import commit_suggestions.daemon")
+
+    assert result.heavy_modules == set()
+
+
+def test_daemon_reuses_parsed_state(tmp_path):
+    """Test that the daemon answers from memory until the diff changes, and stops on request."""
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    init_repo(repo_dir, {"a.txt": "a\n", "b.txt": "b\n"})
+    (repo_dir / "a.txt").write_text("changed a\n")
+    socket_path = str(tmp_path / "daemon.sock")
+    session = SuggestionSession(backend_config=BackendConfig(provider="stub"))
+
+    async def request(command):
+        return await asyncio.to_thread(
+            send_request, {"command": command, "repo": str(repo_dir)}, socket_path
+        )
+
+    async def run():
+        started = asyncio.Event()
+        server = asyncio.create_task(serve(session, socket_path, started))
+        await started.wait()
+
+        first = await request("suggest")
+        state = session.repos[os.path.realpath(repo_dir)]
+        suggestions = state.suggestions
+        assert await request("suggest") == first
+        # The same suggestions were reused instead of asking the model again
+        assert state.suggestions is suggestions
+
+        (repo_dir / "b.txt").write_text("changed b\n")
+        changed = await request("suggest")
+        assert await request("unknown") == {"error": "Unknown command: unknown"}
+        assert await request("stop") == {"ok": True}
+        await server
+        return first, changed
+
+    first, changed = asyncio.run(run())
+
+    assert [hunk["file_header"] for hunk in first["hunks"]] == [
+        "diff --git a/a.txt b/a.txt"
+    ]
+    assert first["suggestions"]["commit_suggestions"][0]["code_snippet_indices"] == [0]
+    assert len(changed["hunks"]) == 2
+    assert not os.path.exists(socket_path)
+
+
+def test_default_socket_is_private(monkeypatch, tmp_path):
+    """Test that the default socket is created inside a directory only its user can access."""
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    socket_path = get_default_socket_path()
+    session = SuggestionSession(backend_config=BackendConfig(provider="stub"))
+
+    async def run():
+        started = asyncio.Event()
+        server = asyncio.create_task(serve(session, started=started))
+        await started.wait()
+        modes = [
+            stat.S_IMODE(os.stat(path).st_mode)
+            for path in [os.path.dirname(socket_path), socket_path]
+        ]
+        await asyncio.to_thread(send_request, {"command": "stop"})
+        await server
+        return modes
+
+    directory_mode, socket_mode = asyncio.run(run())
+
+    assert os.path.dirname(os.path.dirname(socket_path)) == str(tmp_path)
+    assert directory_mode == 0o700
+    assert socket_mode & 0o077 == 0
+
+
+def test_shared_socket_directory_is_refused(monkeypatch, tmp_path):
+    """Test that the daemon won't listen in a socket directory others can reach."""
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    socket_dir = os.path.dirname(get_default_socket_path())
+    os.mkdir(socket_dir)
+    os.chmod(socket_dir, 0o755)
+    session = SuggestionSession(backend_config=BackendConfig(provider="stub"))
+
+    with pytest.raises(RuntimeError, match="only you can access"):
+        asyncio.run(serve(session))
@@ -0,0 +1,68 @@
+from commit_suggestions.diff_collection import (
+    iter_parallel_hunks,
+    list_changes,
+    shard_changes,
+)
+from commit_suggestions.utils import iter_git_diff_lines, iter_hunks
+from tests.helpers import git, init_repo
+
+
+def test_shard_changes_keeps_order():
+    """Test that shards are contiguous runs of the changes' paths and respect the minimum size."""
+    paths = [f"file{number:03}" for number in range(100)]
+    changes = [[path] for path in paths]
+
+    shards = shard_changes(changes, workers=4, min_shard_size=10)
+
+    assert len(shards) == 10
+    assert [path for shard in shards for path in shard] == paths
+    assert shard_changes(changes, workers=4, min_shard_size=64) == [paths]
+    assert shard_changes([], workers=4) == []
+    # Both paths of a rename stay in one shard
+    assert shard_changes([["a"], ["b", "c"], ["d"]], workers=4, min_shard_size=1) == [
+        ["a"],
+        ["b", "c"],
+        ["d"],
+    ]
+
+
+def test_parallel_hunks_match_single_diff(tmp_path):
+    """Test that sharded diffs give the same hunks in the same order as one `git diff`."""
+    names = [f"dir{number % 3}/file {number}[*].txt" for number in range(12)]
+    (tmp_path / "dir0").mkdir()
+    (tmp_path / "dir1").mkdir()
+    (tmp_path / "dir2").mkdir()
+    init_repo(tmp_path, {name: "one\ntwo\r\n" for name in names})
+    for name in names[::2]:
+        (tmp_path / name).write_text("one\nchanged\r\n")
+
+    hunks = list(iter_parallel_hunks(str(tmp_path), workers=2, min_shard_size=2))
+
+    assert len(list_changes(str(tmp_path))) == 6
+    assert hunks == list(iter_hunks(iter_git_diff_lines(str(tmp_path))))
+    assert len(hunks) == 6
+    assert list(iter_parallel_hunks(str(tmp_path), workers=1)) == hunks
+
+
+def test_parallel_hunks_keep_renames(tmp_path):
+    """Test that a rename is diffed as one, even when its paths would fall in different shards."""
+    names = [f"f{number}.txt" for number in range(4)]
+    init_repo(
+        tmp_path, {name: "".join(f"{line}\n" for line in range(20)) for name in names}
+    )
+    git(tmp_path, "mv", "f1.txt", "z1.txt")
+    git(tmp_path, "reset", "-q")
+    git(tmp_path, "add", "-N", "z1.txt")
+    for name in ["f0.txt", "f2.txt", "f3.txt"]:
+        (tmp_path / name).write_text("changed\n")
+
+    hunks = list(iter_parallel_hunks(str(tmp_path), workers=2, min_shard_size=1))
+
+    assert list_changes(str(tmp_path)) == [
+        ["f0.txt"],
+        ["f2.txt"],
+        ["f3.txt"],
+        ["f1.txt", "z1.txt"],
+    ]
+    assert hunks == list(iter_hunks(iter_git_diff_lines(str(tmp_path))))
+    assert "rename from f1.txt" in hunks[-1].index_line
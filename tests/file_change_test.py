@@ -0,0 +1,103 @@
+from commit_suggestions.hunk_index import HunkIndex
+from commit_suggestions.models import PromptEncoding
+from commit_suggestions.prompt_encoding import encode_snippets
+from commit_suggestions.utils import (
+    get_snippets_from_hunks,
+    iter_git_diff_lines,
+    iter_hunks,
+    parse_git_diff_into_hunks,
+)
+from commit_suggestions.models import Hunks
+from commit_suggestions.staging import stage_hunks
+from tests.helpers import git, init_repo
+from textwrap import dedent
+
+DIFF_TXT = dedent("""\
+    diff --git a/logo.png b/logo.png
+    index 88768ef..f68ed80 100644
+    Binary files a/logo.png and b/logo.png differ
+    diff --git a/old name.txt b/new name.txt
+    similarity index 100%
+    rename from old name.txt
+    rename to new name.txt
+    diff --git a/run.sh b/run.sh
+    old mode 100644
+    new mode 100755
+    diff --git a/empty.txt b/empty.txt
+    new file mode 100644
+    index 0000000..e69de29
+    diff --git a/main.py b/main.py
+    old mode 100644
+    new mode 100755
+    index 3a5b3c2..7d9f6e1
+    --- a/main.py
+    +++ b/main.py
+    @@ -10 +10 @@ def check_number(n):
+    -    if n > 0:
+    +    if n >= 0:
+    """)
+
+
+def test_parse_file_level_changes():
+    """Test that files without hunks become file-level changes with one-line summaries."""
+    hunks = parse_git_diff_into_hunks(DIFF_TXT)
+    hunk_index = HunkIndex.from_hunks(hunks)
+
+    assert [hunk.hunk_header for hunk in hunks.hunks] == [
+        "",
+        "",
+        "",
+        "",
+        "@@ -10 +10 @@ def check_number(n):",
+    ]
+    assert [
+        (metadata.old_path, metadata.new_path, metadata.file_change)
+        for metadata in hunk_index
+    ] == [
+        ("logo.png", "logo.png", "binary"),
+        ("old name.txt", "new name.txt", "rename"),
+        ("run.sh", "run.sh", "mode"),
+        (None, "empty.txt", "new"),
+        ("main.py", "main.py", None),
+    ]
+    assert not hunk_index[2].modifies_in_place
+    # Mode changes of files with hunks stay in the hunks' header
+    assert hunks.hunks[4].index_line.startswith("old mode 100644\nnew mode 100755")
+
+    snippets = get_snippets_from_hunks(hunks, hunk_index)
+    assert [snippet.modified_code for snippet in snippets.modified_code_snippets][
+        :4
+    ] == [
+        "binary file changed",
+        "renamed from old name.txt",
+        "mode 100644 -> 100755",
+        "empty file added",
+    ]
+    # The summaries are all the model sees, without any extra fields
+    assert '"file_change"' not in encode_snippets(snippets)
+    assert "### 0 logo.png 0-0 (binary file changed)" in encode_snippets(
+        snippets, PromptEncoding(compact=True)
+    )
+
+
+def test_stage_file_level_changes(tmp_path):
+    """Test that binary, rename, mode, and empty file changes are staged with the hunks."""
+    init_repo(
+        tmp_path,
+        {"logo.png": "\0\1", "run.sh": "x\n", "gone.txt": "", "main.py": "a\nb\n"},
+    )
+    (tmp_path / "logo.png").write_bytes(b"\0\2")
+    (tmp_path / "run.sh").chmod(0o755)
+    (tmp_path / "gone.txt").unlink()
+    (tmp_path / "main.py").write_text("a\nc\n")
+    hunks = Hunks(hunks=list(iter_hunks(iter_git_diff_lines(str(tmp_path)))))
+
+    result = stage_hunks(hunks, range(len(hunks.hunks)), str(tmp_path))
+
+    assert len(hunks.hunks) == 4
+    assert result.failed_hunks == {}
+    assert result.staged_indices == [0, 1, 2, 3]
+    assert git(tmp_path, "diff", "--name-only") == ""
+    assert git(tmp_path, "diff", "--cached", "--name-status") == (
+        "D\tgone.txt\nM\tlogo.png\nM\tmain.py\nM\trun.sh\n"
+    )
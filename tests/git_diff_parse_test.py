@@ -1,6 +1,12 @@
-from commit_suggestions.utils import parse_git_diff_into_hunks
+from commit_suggestions.utils import (
+    get_snippets_from_hunks,
+    iter_git_diff_lines,
+    iter_hunks,
+    parse_git_diff_into_hunks,
+)
 from commit_suggestions.models import Hunk, Hunks
 from textwrap import dedent
+import subprocess
 import pytest
 
 
@@ -238,6 +244,75 @@ def test_parse_git_diff_multiple_file_multiple_changes():
     assert expected_hunks.hunks[2] == actual_hunks.hunks[2]
 
 
+def test_hunks_share_their_file_headers():
+    """Test that the hunks of a file share its header strings, and snippets share the hunks' code."""
+    hunks = parse_git_diff_into_hunks(
+        "diff --git a/a.py b/a.py\n"
+        "index 3a5b3c2..7d9f6e1 100644\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -1 +1 @@\n"
+        "-a\n"
+        "+b\n"
+        "@@ -10 +10 @@\n"
+        "-c\n"
+        "+d\n"
+    ).hunks
+    snippets = get_snippets_from_hunks(Hunks(hunks=hunks)).modified_code_snippets
+
+    assert hunks[0].file_header is hunks[1].file_header
+    assert hunks[0].index_line is hunks[1].index_line
+    assert hunks[0].file_path_indicators is hunks[1].file_path_indicators
+    assert snippets[1].modified_code is hunks[1].modified_code
+
+
+def test_iter_hunks_yields_before_reading_whole_diff():
+    """Test that the streaming parser yields a hunk before the rest of the diff is read."""
+    lines_read = []
+
+    def diff_lines():
+        for line in dedent("""\
+            diff --git a/utils.py b/utils.py
+            index 3a5b3c2..7d9f6e1 100644
+            --- a/utils.py
+            +++ b/utils.py
+            @@ -5,2 +5,2 @@ def say_hello(name):
+            -    return f"Hello, {name}"
+            @@ -10,2 +10,2 @@ def check_number(n):
+            -    if n > 0:
+            @@ -20,2 +20,2 @@ def check_number(n):
+            +    if n >= 0:""").splitlines():
+            lines_read.append(line)
+            yield line
+
+    hunks = iter_hunks(diff_lines())
+    first_hunk = next(hunks)
+    assert first_hunk.hunk_header == "@@ -5,2 +5,2 @@ def say_hello(name):"
+    assert first_hunk.modified_code == '-    return f"Hello, {name}"'
+    # Only the first line of the second hunk has been consumed
+    assert len(lines_read) == 7
+    assert len(list(hunks)) == 2
+
+
+def test_iter_git_diff_lines_matches_parse(tmp_path):
+    """Test that streaming `git diff` from a pipe gives the same hunks as parsing the full text."""
+
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], cwd=tmp_path, check=True, capture_output=True, text=True
+        ).stdout
+
+    git("init", "-q")
+    (tmp_path / "a.py").write_text("one\ntwo\nthree\n")
+    git("add", "a.py")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "init")
+    (tmp_path / "a.py").write_text("one\n2\nthree\nfour\n")
+
+    streamed_hunks = Hunks(hunks=list(iter_hunks(iter_git_diff_lines(str(tmp_path)))))
+    assert streamed_hunks == parse_git_diff_into_hunks(git("diff"))
+    assert len(streamed_hunks.hunks) == 1
+
+
 """
 Other test cases for future:
     RENAME TEST CASE
@@ -0,0 +1,106 @@
+from commit_suggestions.grouping import (
+    get_test_subject,
+    group_snippets,
+    suggest_commits_offline,
+)
+from commit_suggestions.llm import plan_batches
+from tests.helpers import make_snippets
+import pytest
+
+
+@pytest.mark.parametrize(
+    "basename, expected",
+    [
+        ("parser.py", ("parser", False)),
+        ("test_parser.py", ("parser", True)),
+        ("parser_test.py", ("parser", True)),
+        ("parser.test.ts", ("parser", True)),
+        ("ParserTest.java", ("Parser", True)),
+        (".gitignore", (".gitignore", False)),
+    ],
+)
+def test_get_test_subject(basename, expected):
+    """Test that test files and the files they test share a subject."""
+    assert get_test_subject(basename) == expected
+
+
+def test_group_snippets():
+    """Test that files, shared identifiers, tests, moves, and renames are grouped."""
+    moved_code = "def helper():\n    return compute_total(items)"
+    snippets = make_snippets(
+        [
+            (
+                "src/app/parser.py",
+                "-    tokens = split(line)\n+    tokens = tokenize(line)",
+                10,
+                12,
+            ),
+            ("README.md", "+Some documentation", 3, 4),
+            ("tests/parser_test.py", "+    assert parse('a') == ['a']", 5, 6),
+            ("src/app/parser.py", "+import re", 1, 2),
+            (
+                "src/app/lexer.py",
+                "-    tokens = split(line)\n+    tokens = tokenize(line)",
+                8,
+                10,
+            ),
+            (
+                "src/old_utils.py",
+                "\n".join("-" + line for line in moved_code.split("\n")),
+                0,
+                0,
+            ),
+            (
+                "src/new_utils.py",
+                "\n".join("+" + line for line in moved_code.split("\n")),
+                20,
+                22,
+            ),
+            ("src/config.py", "-DEBUG = True", 0, 0),
+            ("src/settings/config.py", "+DEBUG = False", 1, 2),
+            ("CHANGELOG.md", "+Unrelated", 1, 2),
+        ]
+    )
+
+    assert group_snippets(snippets) == [[0, 2, 3, 4], [1], [5, 6], [7, 8], [9]]
+
+
+def test_suggest_commits_offline():
+    """Test that offline suggestions cover every snippet with one commit per group."""
+    snippets = make_snippets(
+        [
+            ("uv.lock", '-version = "1"\n+version = "2"', 3, 4),
+            ("tests/test_cli.py", "+    assert main() is None", 5, 6),
+            ("docs/guide.md", "+More docs", 3, 4),
+        ]
+    )
+
+    suggestions = suggest_commits_offline(snippets).commit_suggestions
+
+    assert [suggestion.code_snippet_indices for suggestion in suggestions] == [
+        [0],
+        [1],
+        [2],
+    ]
+    assert [suggestion.message for suggestion in suggestions] == [
+        "build: update uv.lock",
+        "test: update tests/test_cli.py",
+        "docs: update docs/guide.md",
+    ]
+
+
+def test_plan_batches_keeps_groups_together():
+    """Test that groups of related snippets from different files share a batch."""
+    snippets = make_snippets(
+        [
+            ("a/one.py", "+" + "x" * 400, 1, 2),
+            ("b/two.py", "+" + "x" * 400, 1, 2),
+            ("c/three.py", "+" + "x" * 400, 1, 2),
+        ]
+    )
+
+    assert plan_batches(snippets, token_budget=300) == [[0, 1], [2]]
+    assert plan_batches(snippets, token_budget=300, groups=[[0, 2], [1]]) == [
+        [0, 2],
+        [1],
+    ]
@@ -0,0 +1,134 @@
+from commit_suggestions.backends import OpenAIBackend
+from commit_suggestions.models import (
+    CommitSuggestion,
+    CommitSuggestions,
+    ModifiedCodeSnippet,
+    ModifiedCodeSnippets,
+)
+from openai import APIConnectionError
+from types import SimpleNamespace
+import asyncio
+import httpx
+import json
+import subprocess
+import sys
+
+# Modules the entry points must not load before they need them
+HEAVY_MODULES = {"openai", "pydantic", "git", "rich", "httpx"}
+
+
+def git(repo_dir, *args) -> str:
+    """Run git in a repository and return its output."""
+    return subprocess.run(
+        ["git", *args], cwd=repo_dir, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def init_repo(repo_dir, files):
+    """Create a repository with `files` committed in it."""
+    git(repo_dir, "init", "-q")
+    for filename, content in files.items():
+        (repo_dir / filename).write_text(content)
+    git(repo_dir, "add", ".")
+    git(
+        repo_dir,
+        "-c",
+        "user.name=t",
+        "-c",
+        "user.email=t@t",
+        "commit",
+        "-q",
+        "-m",
+        "init",
+    )
+
+
+def make_snippets(changes) -> ModifiedCodeSnippets:
+    """Create snippets from filenames or `(filename, code, start_line, end_line)` tuples.
+
+    Everything after the filename is optional.
+    """
+    snippets = []
+    for change in changes:
+        filename, *rest = (change,) if isinstance(change, str) else change
+        code, start_line, end_line = [*rest, *[None] * (3 - len(rest))]
+        snippets.append(
+            ModifiedCodeSnippet(
+                filename=filename,
+                modified_code="+" + "x" * 400 if code is None else code,
+                start_line=start_line or 1,
+                end_line=end_line or (start_line or 1) + 1,
+            )
+        )
+    return ModifiedCodeSnippets(modified_code_snippets=snippets)
+
+
+def imported_modules(code: str, cwd=None) -> subprocess.CompletedProcess:
+    """Run code under `python -X importtime -c` and collect the top level modules it imported.
+
+    The result's `heavy_modules` are the LLM, git, and UI stacks among them.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    result.modules = {
+        line.rsplit("|", 1)[1].strip().split(".")[0]
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+    result.heavy_modules = result.modules & HEAVY_MODULES
+    return result
+
+
+class FakeCompletions:
+    """Stands in for `AsyncOpenAI().beta.chat.completions` and suggests one commit per file."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def parse(self, messages, **kwargs):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise APIConnectionError(request=httpx.Request("POST", "http://fake"))
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        snippets = json.loads(messages[1]["content"])["modified_code_snippets"]
+        files = {}
+        for index, snippet in enumerate(snippets):
+            files.setdefault(snippet["filename"], []).append(index)
+        parsed = CommitSuggestions(
+            commit_suggestions=[
+                CommitSuggestion(message=f"feat: {name}", code_snippet_indices=indices)
+                for name, indices in files.items()
+            ]
+        )
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))]
+        )
+
+
+def fake_openai(failures: int = 0):
+    """Create an OpenAI backend whose completions fail `failures` times, then suggest one commit per file.
+
+    Returns the backend and its fake completions, which count the calls.
+    """
+    completions = FakeCompletions(failures)
+    backend = OpenAIBackend(
+        client=SimpleNamespace(
+            beta=SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        )
+    )
+    return backend, completions
@@ -0,0 +1,142 @@
+from commit_suggestions.hunk_index import HunkIndex, parse_file_paths
+from commit_suggestions.hunk_splitting import split_hunk
+from commit_suggestions.models import Hunks
+from commit_suggestions.utils import get_snippets_from_hunks, parse_git_diff_into_hunks
+from tests.helpers import git
+import pytest
+
+
+@pytest.mark.parametrize(
+    "file_header, file_path_indicators, expected",
+    [
+        (
+            "diff --git a/main.py b/main.py",
+            "--- a/main.py\n+++ b/main.py",
+            ("main.py", "main.py"),
+        ),
+        (
+            "diff --git a/new.py b/new.py",
+            "--- /dev/null\n+++ b/new.py",
+            (None, "new.py"),
+        ),
+        (
+            "diff --git a/old.py b/old.py",
+            "--- a/old.py\n+++ /dev/null",
+            ("old.py", None),
+        ),
+        (
+            "diff --git a/before.py b/after.py",
+            "--- a/before.py\n+++ b/after.py",
+            ("before.py", "after.py"),
+        ),
+        (
+            "diff --git a/sp ace.txt b/sp ace.txt",
+            "--- a/sp ace.txt\t\n+++ b/sp ace.txt\t",
+            ("sp ace.txt", "sp ace.txt"),
+        ),
+        (
+            'diff --git "a/t\\303\\251st.txt" "b/t\\303\\251st.txt"',
+            '--- "a/t\\303\\251st.txt"\n+++ "b/t\\303\\251st.txt"',
+            ("tést.txt", "tést.txt"),
+        ),
+        (
+            "diff --git a/b c.txt b/b c.txt",
+            "",
+            ("b c.txt", "b c.txt"),
+        ),
+    ],
+)
+def test_parse_file_paths(file_header, file_path_indicators, expected):
+    """Test that added, deleted, renamed, spaced, and quoted paths are parsed."""
+    assert parse_file_paths(file_header, file_path_indicators) == expected
+
+
+def test_lookup_by_line_range():
+    """Test that lookup finds exactly the hunks of a file overlapping a line range."""
+    hunks = parse_git_diff_into_hunks(
+        "diff --git a/a.py b/a.py\n"
+        "index 3a5b3c2..7d9f6e1 100644\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -20,2 +20,2 @@\n"
+        "-x\n"
+        "+y\n"
+        "@@ -1,3 +1,3 @@\n"
+        "-a\n"
+        "+b\n"
+        "@@ -40 +40 @@\n"
+        "-c\n"
+        "+d\n"
+        "diff --git a/b.py b/b.py\n"
+        "index 3a5b3c2..7d9f6e1 100644\n"
+        "--- a/b.py\n"
+        "+++ b/b.py\n"
+        "@@ -1,50 +1,50 @@\n"
+        "-e\n"
+        "+f\n"
+    )
+    hunk_index = HunkIndex.from_hunks(hunks)
+
+    def lookup(path, start_line, end_line):
+        return [
+            metadata.index for metadata in hunk_index.lookup(path, start_line, end_line)
+        ]
+
+    assert lookup("a.py", 1, 100) == [1, 0, 2]
+    assert lookup("a.py", 3, 20) == [1, 0]
+    assert lookup("a.py", 4, 19) == []
+    assert lookup("a.py", 40, 40) == [2]
+    assert lookup("b.py", 30, 30) == [3]
+    assert lookup("c.py", 1, 100) == []
+    assert list(hunk_index.group_by_file([2, 3, 1])) == ["a.py", "b.py"]
+
+
+def test_lookup_split_pieces():
+    """Test that lookup finds every piece of a split hunk sharing a line."""
+    hunks = parse_git_diff_into_hunks(
+        "diff --git a/a.py b/a.py\n"
+        "index 3a5b3c2..7d9f6e1 100644\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -1,5 +1,5 @@\n"
+        "-a\n"
+        "+A\n"
+        " b\n"
+        " c\n"
+        "-d\n"
+        "+D\n"
+    )
+    hunk_index = HunkIndex.from_hunks(Hunks(hunks=split_hunk(hunks.hunks[0])))
+
+    def lookup(start_line, end_line):
+        return [
+            metadata.index
+            for metadata in hunk_index.lookup("a.py", start_line, end_line)
+        ]
+
+    assert len(hunk_index) == 2
+    assert lookup(2, 3) == [0, 1]
+    assert lookup(1, 1) == [0]
+    assert lookup(4, 4) == [1]
+
+
+def test_snippets_for_added_deleted_and_single_line_hunks(tmp_path):
+    """Test that snippets get their paths and lines from the index for every kind of file."""
+    git(tmp_path, "init", "-q")
+    (tmp_path / "one.txt").write_text("one\n")
+    (tmp_path / "gone.txt").write_text("gone\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    (tmp_path / "one.txt").write_text("uno\n")
+    (tmp_path / "gone.txt").unlink()
+    (tmp_path / "new.txt").write_text("new\n")
+    git(tmp_path, "add", "-A")
+
+    hunks = parse_git_diff_into_hunks(git(tmp_path, "diff", "--cached"))
+    snippets = get_snippets_from_hunks(hunks).modified_code_snippets
+
+    assert [(snippet.filename, snippet.start_line) for snippet in snippets] == [
+        ("gone.txt", 0),
+        ("new.txt", 1),
+        ("one.txt", 1),
+    ]
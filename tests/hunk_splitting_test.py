@@ -0,0 +1,84 @@
+from commit_suggestions.hunk_splitting import merge_overlapping_hunks, split_hunk
+from commit_suggestions.models import Hunk, Hunks
+from commit_suggestions.staging import (
+    InProcessStagingBackend,
+    build_patch,
+    stage_hunks,
+)
+from commit_suggestions.utils import iter_git_diff_lines, iter_hunks
+from git import Repo
+from tests.helpers import git, init_repo
+import pytest
+
+
+def make_hunk(hunk_header, *lines):
+    return Hunk(
+        file_header="diff --git a/a.py b/a.py",
+        index_line="index 3a5b3c2..7d9f6e1 100644",
+        file_path_indicators="--- a/a.py\n+++ b/a.py",
+        hunk_header=hunk_header,
+        modified_code="\n".join(lines),
+    )
+
+
+def test_split_hunk_recomputes_headers():
+    """Test that pieces share the unchanged lines between them and get their own line ranges."""
+    hunk = make_hunk(
+        "@@ -10,6 +10,7 @@ def main():",
+        " a",
+        "-b",
+        "+B",
+        " c",
+        " d",
+        "+new",
+        " e",
+        "-f",
+        "\\ No newline at end of file",
+        "+F",
+        "\\ No newline at end of file",
+    )
+
+    pieces = split_hunk(hunk)
+
+    assert [(piece.hunk_header, piece.modified_code) for piece in pieces] == [
+        ("@@ -10,4 +10,4 @@ def main():", " a\n-b\n+B\n c\n d"),
+        ("@@ -12,3 +12,4 @@", " c\n d\n+new\n e"),
+        (
+            "@@ -14,2 +15,2 @@",
+            " e\n-f\n\\ No newline at end of file\n+F\n\\ No newline at end of file",
+        ),
+    ]
+    assert merge_overlapping_hunks(pieces) == [hunk]
+    # Pieces that aren't next to each other stay apart
+    assert merge_overlapping_hunks(pieces[::2]) == pieces[::2]
+    assert split_hunk(make_hunk("@@ -1,3 +1,3 @@", " a", "-b", "+c")) == [
+        make_hunk("@@ -1,3 +1,3 @@", " a", "-b", "+c")
+    ]
+
+
+@pytest.mark.parametrize("staging", ["subprocess", "in-process"])
+def test_stage_pieces_on_their_own(tmp_path, staging):
+    """Test that pieces of a split hunk stage together or on their own."""
+    lines = [f"{number}\n" for number in range(1, 21)]
+    init_repo(tmp_path, {"a.txt": "".join(lines)})
+    lines[4], lines[8], lines[11] = "five\n", "nine\nten\n", ""
+    (tmp_path / "a.txt").write_text("".join(lines))
+    hunks = Hunks(hunks=list(iter_hunks(iter_git_diff_lines(str(tmp_path)))))
+    pieces = Hunks(hunks=split_hunk(hunks.hunks[0]))
+
+    def stage(indices):
+        if staging == "subprocess":
+            return stage_hunks(pieces, indices, str(tmp_path))
+        return InProcessStagingBackend(Repo(tmp_path)).stage(pieces, indices)
+
+    assert len(hunks.hunks) == 1
+    assert len(pieces.hunks) == 3
+    assert build_patch(pieces.hunks) == build_patch(hunks.hunks)
+    # Neighbouring pieces share lines, but stage together
+    assert stage([0, 1]).staged_indices == [0, 1]
+    assert "+five" in git(tmp_path, "diff", "--cached")
+    assert "+nine" in git(tmp_path, "diff", "--cached")
+    assert "-12" not in git(tmp_path, "diff", "--cached")
+    # The last piece on its own, after the lines above it have moved
+    assert stage([2]).failed_hunks == {}
+    assert git(tmp_path, "diff") == ""
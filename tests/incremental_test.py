@@ -0,0 +1,64 @@
+from commit_suggestions.incremental import generate_incrementally, get_state_path
+from commit_suggestions.models import (
+    CommitSuggestion,
+    CommitSuggestions,
+)
+from tests.helpers import make_snippets
+
+
+class FakeGenerate:
+    """Suggests one commit per snippet and remembers what it was asked about."""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, modified_code_snippets):
+        snippets = modified_code_snippets.modified_code_snippets
+        self.requests.append([snippet.modified_code for snippet in snippets])
+        return CommitSuggestions(
+            commit_suggestions=[
+                CommitSuggestion(
+                    message=f"feat: {snippet.modified_code}",
+                    code_snippet_indices=[index],
+                )
+                for index, snippet in enumerate(snippets)
+            ]
+        )
+
+
+def test_generate_incrementally_only_sends_changed_hunks(tmp_path):
+    """Test that unchanged hunks keep their suggestions and only new hunks are sent."""
+    state_path = get_state_path(str(tmp_path))
+    generate = FakeGenerate()
+
+    first = generate_incrementally(
+        make_snippets([("a.py", "+a"), ("b.py", "+b")]), state_path, "gpt-4o", generate
+    )
+    assert len(first.commit_suggestions) == 2
+
+    # b.py changed and c.py is new, while a.py moved to a different index
+    second = generate_incrementally(
+        make_snippets([("c.py", "+c"), ("a.py", "+a"), ("b.py", "+b2")]),
+        state_path,
+        "gpt-4o",
+        generate,
+    )
+
+    assert generate.requests == [["+a", "+b"], ["+c", "+b2"]]
+    assert [
+        (suggestion.message, suggestion.code_snippet_indices)
+        for suggestion in second.commit_suggestions
+    ] == [("feat: +a", [1]), ("feat: +c", [0]), ("feat: +b2", [2])]
+
+
+def test_generate_incrementally_ignores_state_for_other_model(tmp_path):
+    """Test that suggestions from another model aren't reused."""
+    state_path = get_state_path(str(tmp_path))
+    generate = FakeGenerate()
+    snippets = make_snippets([("a.py", "+a")])
+
+    generate_incrementally(snippets, state_path, "gpt-4o", generate)
+    generate_incrementally(snippets, state_path, "gpt-4o", generate)
+    generate_incrementally(snippets, state_path, "gpt-4o-mini", generate)
+
+    assert generate.requests == [["+a"], ["+a"]]
@@ -0,0 +1,73 @@
+from commit_suggestions import daemon, main
+from commit_suggestions.llm import (
+    generate_commit_suggestions_async,
+    plan_batches,
+)
+from tests.helpers import fake_openai, make_snippets
+import asyncio
+import pytest
+
+
+def test_plan_batches_wrong_budget():
+    """Test that planning batches with a non-positive budget fails."""
+    with pytest.raises(ValueError):
+        plan_batches(make_snippets(["a.py"]), token_budget=0)
+
+
+@pytest.mark.parametrize("parse_args", [main.parse_args, daemon.parse_args])
+@pytest.mark.parametrize(
+    "args", [["--concurrency", "0"], ["--token-budget", "-1"], ["--concurrency", "x"]]
+)
+def test_command_line_rejects_counts_below_one(parse_args, args, capsys):
+    """Test that a zero concurrency or token budget is rejected instead of hanging or failing later."""
+    with pytest.raises(SystemExit):
+        parse_args(["ping", *args] if parse_args is daemon.parse_args else args)
+
+    assert "error: argument" in capsys.readouterr().err
+
+
+def test_plan_batches_keeps_files_together():
+    """Test that snippets from the same file and directory are batched together."""
+    snippets = make_snippets(["src/a.py", "docs/x.md", "src/a.py", "src/b.py"])
+
+    batches = plan_batches(snippets, token_budget=300)
+
+    assert batches == [[1], [0, 2], [3]]
+    assert plan_batches(snippets, token_budget=10_000) == [[1, 0, 2, 3]]
+
+
+def test_generate_commit_suggestions_remaps_indices():
+    """Test that batch results are merged back using global snippet indices."""
+    snippets = make_snippets(["src/a.py", "docs/x.md", "src/a.py", "src/b.py"])
+    backend, completions = fake_openai()
+
+    suggestions = asyncio.run(
+        generate_commit_suggestions_async(
+            backend, snippets, token_budget=300, concurrency=2
+        )
+    )
+
+    assert completions.calls == 3
+    assert completions.max_in_flight == 2
+    assert [
+        (suggestion.message, suggestion.code_snippet_indices)
+        for suggestion in suggestions.commit_suggestions
+    ] == [
+        ("feat: docs/x.md", [1]),
+        ("feat: src/a.py", [0, 2]),
+        ("feat: src/b.py", [3]),
+    ]
+
+
+def test_generate_commit_suggestions_retries():
+    """Test that temporary API errors are retried."""
+    backend, completions = fake_openai(failures=2)
+
+    suggestions = asyncio.run(
+        generate_commit_suggestions_async(
+            backend, make_snippets(["a.py"]), backoff_seconds=0
+        )
+    )
+
+    assert completions.calls == 3
+    assert suggestions.commit_suggestions[0].code_snippet_indices == [0]
@@ -0,0 +1,99 @@
+from commit_suggestions import pipeline
+from commit_suggestions.batch import run_batch
+from commit_suggestions.models import BackendConfig, CommitSuggestion
+from commit_suggestions.pipeline import DIFF_CHUNK_SIZE, aiter_file_hunks
+from commit_suggestions.utils import iter_git_diff_lines, iter_hunks
+from tests.helpers import git, init_repo
+import asyncio
+
+
+def test_async_diff_matches_sync_diff(tmp_path):
+    """Test that the streamed diff parses into the same hunks as `iter_git_diff_lines`, one file at a time."""
+    long_line = "x" * (DIFF_CHUNK_SIZE * 2 + 7)
+    init_repo(
+        tmp_path,
+        {"a.txt": "one\r\ntwo\n", "b.bin": "\0\1", "c.txt": "c\n", "d.txt": "d"},
+    )
+    (tmp_path / "a.txt").write_text("one\r\nchanged\n")
+    (tmp_path / "b.bin").write_bytes(b"\0\2")
+    (tmp_path / "c.txt").write_text(f"{long_line}\nc\n")
+    (tmp_path / "d.txt").write_text("d\né")
+
+    async def collect():
+        return [file_hunks async for file_hunks in aiter_file_hunks(str(tmp_path))]
+
+    files = asyncio.run(collect())
+
+    assert [len(file_hunks) for file_hunks in files] == [1, 1, 1, 1]
+    assert [hunk for file_hunks in files for hunk in file_hunks] == list(
+        iter_hunks(iter_git_diff_lines(str(tmp_path)))
+    )
+
+
+def test_async_pipeline_commits_suggestions(tmp_path, git_identity):
+    """Test that batch mode's async pipeline commits every suggestion while batches are generated."""
+    names = [f"file{number}.txt" for number in range(6)]
+    init_repo(tmp_path, {name: "a\nb\n" for name in names})
+    for name in names:
+        (tmp_path / name).write_text(f"a\n{name}\n")
+
+    # A tiny budget puts every file in its own batch
+    report = run_batch(
+        str(tmp_path),
+        token_budget=1,
+        use_cache=False,
+        backend_config=BackendConfig(provider="stub"),
+        async_pipeline=True,
+    )
+
+    assert report.error is None
+    assert [hunk.filename for hunk in report.hunks] == names
+    assert len(report.suggestions.commit_suggestions) == len(names)
+    assert all(commit.committed for commit in report.commits)
+    assert set(report.timings) == {"parse", "generate", "apply", "total"}
+    assert git(tmp_path, "status", "--short") == ""
+    assert len(git(tmp_path, "log", "--format=%s").splitlines()) == len(names) + 1
+
+
+def test_failed_run_finishes_the_commit_in_progress(
+    monkeypatch, tmp_path, git_identity
+):
+    """Test that a run failing between staging and committing a suggestion still commits it."""
+    init_repo(tmp_path, {"a.txt": "a\n"})
+    (tmp_path / "a.txt").write_text("b\n")
+    staged = asyncio.Event()
+
+    async def stream_repo_suggestions(
+        repo_dir, backend, hunks, hunk_index, *args, **kwargs
+    ):
+        async for file_hunks in aiter_file_hunks(repo_dir):
+            for hunk in file_hunks:
+                hunks.hunks.append(hunk)
+                hunk_index.add(hunk)
+        yield CommitSuggestion(message="fix: a", code_snippet_indices=[0])
+        await staged.wait()
+        raise RuntimeError("The model went away")
+
+    stage_hunks_async = pipeline.stage_hunks_async
+
+    async def stage_and_signal(*args, **kwargs):
+        staging_result = await stage_hunks_async(*args, **kwargs)
+        staged.set()
+        # Give the failing stream a chance to run before the commit
+        await asyncio.sleep(0)
+        return staging_result
+
+    monkeypatch.setattr(pipeline, "stream_repo_suggestions", stream_repo_suggestions)
+    monkeypatch.setattr(pipeline, "stage_hunks_async", stage_and_signal)
+
+    report = asyncio.run(
+        pipeline.run_pipeline(
+            str(tmp_path),
+            use_cache=False,
+            backend_config=BackendConfig(provider="stub"),
+        )
+    )
+
+    assert report.error == "RuntimeError: The model went away"
+    assert git(tmp_path, "log", "-1", "--format=%s").strip() == "fix: a"
+    assert git(tmp_path, "diff", "--cached") == ""
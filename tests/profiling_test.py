@@ -0,0 +1,51 @@
+from commit_suggestions.main import main
+from commit_suggestions.profiling import NULL_SPAN, Profiler
+from tests.helpers import init_repo
+import json
+
+
+def test_disabled_profiler_records_nothing():
+    """Test that a disabled profiler hands out the shared no-op span."""
+    profiler = Profiler(enabled=False)
+
+    with profiler.span("parse") as span:
+        span.count(hunks=3)
+
+    assert span is NULL_SPAN
+    assert profiler.spans == []
+
+
+def test_profiler_totals_and_chrome_trace():
+    """Test that spans with the same name are summed and exported as trace events."""
+    profiler = Profiler()
+
+    for hunks in [2, 3]:
+        with profiler.span("stage") as span:
+            span.count(hunks=hunks)
+    with profiler.span("llm request", track=1) as span:
+        span.count(prompt_tokens=100, completion_tokens=20)
+
+    totals = profiler.totals()
+    assert list(totals) == ["stage", "llm request"]
+    assert totals["stage"]["calls"] == 2
+    assert totals["stage"]["counters"] == {"hunks": 5}
+
+    events = json.loads(profiler.to_chrome_trace())["traceEvents"]
+    assert [(event["name"], event["ph"], event["tid"]) for event in events] == [
+        ("stage", "X", 0),
+        ("stage", "X", 0),
+        ("llm request", "X", 1),
+    ]
+    assert events[2]["args"] == {"prompt_tokens": 100, "completion_tokens": 20}
+
+
+def test_main_writes_json_profile(tmp_path, monkeypatch):
+    """Test that `--profile json` writes the profile even when there are no changes."""
+    init_repo(tmp_path, {"a.txt": "a\n"})
+    monkeypatch.chdir(tmp_path)
+    profile_path = tmp_path / "profile.json"
+
+    main(["--profile", "json", "--profile-output", str(profile_path)])
+
+    profile = json.loads(profile_path.read_text())
+    assert list(profile["totals"]) == ["check for changes"]
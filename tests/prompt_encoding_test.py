@@ -0,0 +1,89 @@
+from commit_suggestions.llm import create_prompt
+from commit_suggestions.models import (
+    ModifiedCodeSnippet,
+    ModifiedCodeSnippets,
+    PromptEncoding,
+)
+from commit_suggestions.prompt_encoding import (
+    encode_snippets,
+    is_whitespace_only,
+    trim_context,
+)
+import json
+
+
+def make_snippet(filename, modified_code, start_line=1):
+    return ModifiedCodeSnippet(
+        filename=filename,
+        modified_code=modified_code,
+        start_line=start_line,
+        end_line=start_line + 3,
+    )
+
+
+def test_default_encoding_is_unchanged_json():
+    """Test that the default encoding is the pretty-printed JSON sent before."""
+    snippets = ModifiedCodeSnippets(modified_code_snippets=[make_snippet("a.py", "+a")])
+
+    assert encode_snippets(snippets) == snippets.model_dump_json(indent=2)
+    assert "modified_code" in create_prompt(1)
+
+
+def test_trim_context():
+    """Test that long runs of unchanged lines are replaced, and short runs are kept."""
+    context = [f" unchanged line number {number}" for number in range(6)]
+    code = "\n".join([*context, "-old", "+new", *context, " x"])
+
+    assert trim_context(code, 1).split("\n") == [
+        "= 5 unchanged lines",
+        context[-1],
+        "-old",
+        "+new",
+        context[0],
+        "= 6 unchanged lines",
+    ]
+    assert trim_context(" a\n-b\n c", 0) == " a\n-b\n c"
+
+
+def test_is_whitespace_only():
+    """Test that reindented lines and blank lines count as whitespace-only changes."""
+    assert is_whitespace_only("-    x = 1\n+  x  =  1\n+")
+    assert not is_whitespace_only("-x = 1\n+x = 2")
+    assert not is_whitespace_only(" context only")
+
+
+def test_compact_encoding_summarizes_and_dedupes():
+    """Test that the compact format keeps every index but summarizes what the model doesn't need to read."""
+    snippets = ModifiedCodeSnippets(
+        modified_code_snippets=[
+            make_snippet("src/a.py", " def a():\n-    pass\n+    return 1"),
+            make_snippet("uv.lock", '-version = "1"\n+version = "2"'),
+            make_snippet("src/b.py", "-x  =  1\n+x = 1"),
+            make_snippet("src/c.py", " def a():\n-    pass\n+    return 1", 9),
+        ]
+    )
+    encoding = PromptEncoding(compact=True)
+
+    assert encode_snippets(snippets, encoding).split("\n") == [
+        "### 0 src/a.py 1-4",
+        " def a():",
+        "-    pass",
+        "+    return 1",
+        "### 1 uv.lock 1-4 (lockfile or generated file: 1 added, 1 removed lines)",
+        "### 2 src/b.py 1-4 (whitespace-only change: 1 added, 1 removed lines)",
+        "### 3 src/c.py 9-12 (same change as 0)",
+    ]
+    assert "### <index>" in create_prompt(4, encoding)
+    assert create_prompt(4, encoding) != create_prompt(4)
+
+
+def test_trimmed_json_encoding():
+    """Test that trimming context also applies to the JSON encoding."""
+    code = "\n".join([" " + "context" * 10] * 5 + ["+new"])
+    snippets = ModifiedCodeSnippets(modified_code_snippets=[make_snippet("a.py", code)])
+
+    encoded = json.loads(encode_snippets(snippets, PromptEncoding(context_lines=0)))
+
+    assert encoded["modified_code_snippets"][0]["modified_code"] == (
+        "= 5 unchanged lines\n+new"
+    )
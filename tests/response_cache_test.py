@@ -0,0 +1,98 @@
+from commit_suggestions import llm
+from commit_suggestions.cache import ResponseCache
+from commit_suggestions.llm import (
+    generate_commit_suggestions,
+    generate_commit_suggestions_async,
+    iter_commit_suggestions,
+)
+from commit_suggestions.models import CommitSuggestion, CommitSuggestions
+from tests.helpers import fake_openai, make_snippets
+import asyncio
+import os
+import pytest
+
+
+def make_suggestions(message: str) -> CommitSuggestions:
+    return CommitSuggestions(
+        commit_suggestions=[CommitSuggestion(message=message, code_snippet_indices=[0])]
+    )
+
+
+def test_cache_round_trip(tmp_path):
+    """Test that stored suggestions are returned for the same snippets, prompt, and model."""
+    cache = ResponseCache.for_git_dir(str(tmp_path))
+    key = cache.key(make_snippets(["a.py"]), "prompt", "gpt-4o")
+
+    assert cache.get(key) is None
+    cache.put(key, make_suggestions("feat: a"))
+
+    assert cache.get(key) == make_suggestions("feat: a")
+    assert key != cache.key(make_snippets(["a.py"]), "prompt", "gpt-4o-mini")
+    assert key != cache.key(make_snippets(["b.py"]), "prompt", "gpt-4o")
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Test that the least recently used entry is evicted when the cache is full."""
+    cache = ResponseCache(str(tmp_path), max_entries=2)
+    cache.put("first", make_suggestions("first"))
+    cache.put("second", make_suggestions("second"))
+    os.utime(tmp_path / "first.json", ns=(1, 1))
+    os.utime(tmp_path / "second.json", ns=(2, 2))
+
+    # Reading an entry makes it the most recently used one
+    cache.get("first")
+    cache.put("third", make_suggestions("third"))
+
+    assert cache.get("second") is None
+    assert cache.get("first") == make_suggestions("first")
+    assert cache.get("third") == make_suggestions("third")
+
+
+def test_cache_partial_batch_hits(tmp_path):
+    """Test that only batches missing from the cache are sent to the model."""
+    cache = ResponseCache(str(tmp_path))
+
+    def run(filenames):
+        backend, completions = fake_openai()
+        suggestions = asyncio.run(
+            generate_commit_suggestions_async(
+                backend,
+                make_snippets(filenames),
+                token_budget=150,
+                cache=cache,
+            )
+        )
+        return suggestions, completions.calls
+
+    first_suggestions, calls = run(["src/a.py", "src/b.py"])
+    assert calls == 2
+    assert run(["src/a.py", "src/b.py"]) == (first_suggestions, 0)
+    assert run(["src/a.py", "src/c.py"])[1] == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_fully_cached_run_creates_no_backend(tmp_path, monkeypatch, stream):
+    """Test that a repeat run on unchanged snippets is answered without creating a client."""
+    cache = ResponseCache(str(tmp_path))
+    snippets = make_snippets(["src/a.py", "src/b.py"])
+    backend, _ = fake_openai()
+    expected = asyncio.run(
+        generate_commit_suggestions_async(
+            backend, snippets, token_budget=150, cache=cache
+        )
+    )
+
+    def create_backend(*args, **kwargs):
+        raise AssertionError("A backend was created")
+
+    monkeypatch.setattr(llm, "create_backend", create_backend)
+    if stream:
+        suggestions = list(
+            iter_commit_suggestions(snippets, token_budget=150, cache=cache)
+        )
+    else:
+        suggestions = generate_commit_suggestions(
+            snippets, token_budget=150, cache=cache
+        ).commit_suggestions
+
+    assert suggestions == expected.commit_suggestions
@@ -0,0 +1,76 @@
+from commit_suggestions.hunk_index import HunkIndex
+from commit_suggestions.models import CommitSuggestion
+from commit_suggestions.review import ReviewPipeline
+from commit_suggestions.staging import SubprocessStagingBackend
+from commit_suggestions.utils import get_snippets_from_hunks, parse_git_diff_into_hunks
+from rich.console import Console
+from tests.helpers import git, init_repo
+import io
+import pytest
+import time
+
+
+@pytest.fixture
+def make_pipeline(tmp_path):
+    def make(suggestions, lookahead=2):
+        init_repo(tmp_path, {"a.txt": "a\n", "b.txt": "b\n"})
+        (tmp_path / "a.txt").write_text("changed a\n")
+        (tmp_path / "b.txt").write_text("changed b\n")
+        hunks = parse_git_diff_into_hunks(git(tmp_path, "diff"))
+        hunk_index = HunkIndex.from_hunks(hunks)
+        staging_backend = SubprocessStagingBackend(str(tmp_path), quiet=True)
+        pipeline = ReviewPipeline(
+            suggestions,
+            get_snippets_from_hunks(hunks, hunk_index),
+            hunks,
+            hunk_index,
+            staging_backend,
+            Console(file=io.StringIO(), width=80),
+            lookahead=lookahead,
+        )
+        return pipeline, hunks, staging_backend
+
+    return make
+
+
+def test_prepares_suggestions_in_order(tmp_path, make_pipeline):
+    """Test that suggestions are rendered and checked ahead, and their patches reused for staging."""
+    suggestions = [
+        CommitSuggestion(message="a", code_snippet_indices=[0]),
+        CommitSuggestion(message="b", code_snippet_indices=[1]),
+    ]
+    pipeline, hunks, staging_backend = make_pipeline(iter(suggestions))
+
+    prepared = list(pipeline)
+
+    assert [item.suggestion for item in prepared] == suggestions
+    assert all(item.check.failed_hunks == {} for item in prepared)
+    assert all(item.renderables for item in prepared)
+    assert set(staging_backend.patches) == {(0,), (1,)}
+
+    staging_backend.stage(hunks, [0])
+    assert staging_backend.patches.keys() == {(1,)}
+    assert git(tmp_path, "diff", "--cached", "--name-only") == "a.txt\n"
+
+
+def test_staging_redoes_stale_checks(tmp_path, make_pipeline):
+    """Test that a check made before an earlier suggestion was staged is redone before it is shown."""
+    suggestions = [
+        CommitSuggestion(message="a", code_snippet_indices=[0]),
+        CommitSuggestion(message="a again", code_snippet_indices=[0]),
+    ]
+    pipeline, hunks, staging_backend = make_pipeline(suggestions)
+
+    iterator = iter(pipeline)
+    first = next(iterator)
+    # Wait for the second suggestion to be checked against the unchanged index
+    while pipeline.prepared.qsize() == 0:
+        time.sleep(0.01)
+    staging_backend.stage(hunks, first.suggestion.code_snippet_indices)
+    pipeline.staged(first)
+    # Only checks of hunks overlapping the staged ones are redone
+    assert pipeline.hunk_generations == {0: 1}
+    second = next(iterator)
+
+    assert list(second.check.failed_hunks) == [0]
+    assert list(iterator) == []
@@ -0,0 +1,226 @@
+from commit_suggestions.models import Hunk, StagingResult
+from commit_suggestions.staging import (
+    InProcessStagingBackend,
+    PatchError,
+    StagingBackend,
+    SubprocessStagingBackend,
+    TransactionStagingBackend,
+    apply_hunks_to_lines,
+    build_patch,
+    stage_hunks,
+)
+from git import Repo
+from commit_suggestions.utils import parse_git_diff_into_hunks
+from tests.helpers import git, init_repo
+from textwrap import dedent
+import pytest
+
+
+def test_build_patch_one_header_per_file():
+    """Test that hunks from the same file share one file header in the patch."""
+    hunks = [
+        Hunk(
+            file_header=f"diff --git a/{name} b/{name}",
+            index_line="index 3a5b3c2..7d9f6e1 100644",
+            file_path_indicators=f"--- a/{name}\n+++ b/{name}",
+            hunk_header=header,
+            modified_code="-a\n+b",
+        )
+        for name, header in [
+            ("a.py", "@@ -1 +1 @@"),
+            ("b.py", "@@ -1 +1 @@"),
+            ("a.py", "@@ -9 +9 @@"),
+        ]
+    ]
+
+    assert build_patch(hunks) == dedent("""\
+        diff --git a/a.py b/a.py
+        index 3a5b3c2..7d9f6e1 100644
+        --- a/a.py
+        +++ b/a.py
+        @@ -1 +1 @@
+        -a
+        +b
+        @@ -9 +9 @@
+        -a
+        +b
+        diff --git a/b.py b/b.py
+        index 3a5b3c2..7d9f6e1 100644
+        --- a/b.py
+        +++ b/b.py
+        @@ -1 +1 @@
+        -a
+        +b
+        """)
+
+
+def test_stage_hunks_in_one_apply(tmp_path):
+    """Test staging several hunks across files with a single patch."""
+    lines = [f"line {number}" for number in range(1, 30)]
+    init_repo(tmp_path, {"a.txt": "\n".join(lines) + "\n", "b.txt": "b\n"})
+    lines[1] = "changed 2"
+    lines[25] = "changed 26"
+    (tmp_path / "a.txt").write_text("\n".join(lines) + "\n")
+    (tmp_path / "b.txt").write_text("changed b\n")
+    hunks = parse_git_diff_into_hunks(git(tmp_path, "diff"))
+    assert len(hunks.hunks) == 3
+
+    result = stage_hunks(hunks, [2, 0], str(tmp_path))
+
+    assert result.staged_indices == [0, 2]
+    assert result.failed_hunks == {}
+    assert git(tmp_path, "diff", "--cached", "--name-only") == "a.txt\nb.txt\n"
+    # Only the second hunk of a.txt is left unstaged
+    assert len(parse_git_diff_into_hunks(git(tmp_path, "diff")).hunks) == 1
+
+
+def test_stage_hunks_reports_failures(tmp_path):
+    """Test that hunks that don't apply are reported while the others are staged."""
+    init_repo(tmp_path, {"a.txt": "a\n", "b.txt": "b\n"})
+    (tmp_path / "a.txt").write_text("changed a\n")
+    (tmp_path / "b.txt").write_text("changed b\n")
+    hunks = parse_git_diff_into_hunks(git(tmp_path, "diff"))
+    hunks.hunks[0].modified_code = "-not in the file\n+changed a"
+
+    result = stage_hunks(hunks, [0, 1], str(tmp_path))
+
+    assert result.staged_indices == [1]
+    assert list(result.failed_hunks) == [0]
+    assert "a.txt" in result.failed_hunks[0]
+    assert git(tmp_path, "diff", "--cached", "--name-only") == "b.txt\n"
+
+
+def test_apply_hunks_to_lines():
+    """Test applying hunks to lines in process, including a missing final newline."""
+    hunks = parse_git_diff_into_hunks(
+        dedent("""\
+        diff --git a/a.txt b/a.txt
+        index 3a5b3c2..7d9f6e1 100644
+        --- a/a.txt
+        +++ b/a.txt
+        @@ -1,2 +1,2 @@
+        -one
+        +1
+         two
+        @@ -4 +3,0 @@
+        -four
+        @@ -5 +5,2 @@
+        -five
+        \\ No newline at end of file
+        +5
+        +six""")
+    )
+
+    new_lines = apply_hunks_to_lines(
+        ["one\n", "two\n", "three\n", "four\n", "five"], hunks.hunks
+    )
+
+    assert new_lines == ["1\n", "two\n", "three\n", "5\n", "six\n"]
+    with pytest.raises(PatchError):
+        apply_hunks_to_lines(["uno\n", "two\n"], hunks.hunks[:1])
+
+
+def test_in_process_backend_matches_git_apply(tmp_path):
+    """Test that in process staging produces the same index as `git apply` and commits it."""
+    lines = [f"line {number}" for number in range(1, 30)]
+    init_repo(tmp_path, {"a.txt": "\n".join(lines) + "\n", "b.txt": "b"})
+    lines[1] = "changed 2"
+    lines[25] = "changed 26"
+    (tmp_path / "a.txt").write_text("\n".join(lines) + "\n")
+    (tmp_path / "b.txt").write_text("changed b\n")
+    hunks = parse_git_diff_into_hunks(git(tmp_path, "diff"))
+
+    SubprocessStagingBackend(str(tmp_path)).stage(hunks, [0, 2])
+    expected_staged_diff = git(tmp_path, "diff", "--cached")
+    git(tmp_path, "reset", "-q")
+
+    backend = InProcessStagingBackend(Repo(tmp_path))
+    result = backend.stage(hunks, [0, 2])
+    assert result.staged_indices == [0, 2]
+    assert git(tmp_path, "diff", "--cached") == expected_staged_diff
+
+    assert backend.commit("feat: stage in process")
+    assert git(tmp_path, "log", "-1", "--format=%s") == "feat: stage in process\n"
+    assert git(tmp_path, "diff", "HEAD~1", "--name-only") == "a.txt\nb.txt\n"
+    # Nothing was staged since the last commit
+    assert not backend.commit("fix: nothing")
+    assert git(tmp_path, "log", "-1", "--format=%s") == "feat: stage in process\n"
+
+
+def test_in_process_commit_falls_back(tmp_path, git_identity):
+    """Test that checking, staging, and committing fall back to git for indexes GitPython can't read."""
+    init_repo(tmp_path, {"a.txt": "a\n"})
+    (tmp_path / "a.txt").write_text("changed a\n")
+    (tmp_path / "new.txt").write_text("new\n")
+    # Intent-to-add entries make git write a version 3 index
+    git(tmp_path, "add", "-N", "new.txt")
+    hunks = parse_git_diff_into_hunks(git(tmp_path, "diff"))
+
+    backend = InProcessStagingBackend(Repo(tmp_path))
+    assert backend.check(hunks, [0]).staged_indices == [0]
+    assert list(backend.fallback.patches) == [(0,)]
+    assert backend.stage(hunks, [0]).staged_indices == [0]
+    assert backend.commit("fix: a")
+    assert git(tmp_path, "log", "-1", "--format=%s") == "fix: a\n"
+    assert git(tmp_path, "diff", "HEAD~1", "HEAD", "--name-only") == "a.txt\n"
+
+
+def test_staging_backend_must_implement_stage_and_commit():
+    """Test that a staging backend missing a method fails when it is created, not mid review."""
+
+    class StageOnlyBackend(StagingBackend):
+        def stage(self, hunks, indices, hunk_index=None):
+            return StagingResult(staged_indices=[], failed_hunks={})
+
+    with pytest.raises(TypeError):
+        StageOnlyBackend()
+
+
+def test_transaction_moves_head_once(tmp_path, git_identity):
+    """Test that commits are made in a temporary index and HEAD only moves when finished."""
+    init_repo(tmp_path, {"a.txt": "a\n", "b.txt": "b\n", "c.txt": "c\n"})
+    for name in ["a.txt", "b.txt", "c.txt"]:
+        (tmp_path / name).write_text(f"changed {name}\n")
+    hunks = parse_git_diff_into_hunks(git(tmp_path, "diff"))
+    head = git(tmp_path, "rev-parse", "HEAD")
+
+    backend = TransactionStagingBackend(str(tmp_path))
+    backend.stage(hunks, [1])
+    assert backend.commit("fix: b")
+    # Nothing was staged since the last commit
+    assert not backend.commit("fix: nothing")
+    backend.stage(hunks, [0])
+    assert backend.commit("fix: a")
+    assert git(tmp_path, "rev-parse", "HEAD") == head
+    assert git(tmp_path, "diff", "--cached") == ""
+
+    assert backend.finish()
+    assert git(tmp_path, "log", "--format=%s") == "fix: a\nfix: b\ninit\n"
+    assert git(tmp_path, "reflog", "-1", "--format=%gs") == (
+        "commit-suggestions: 2 commits\n"
+    )
+    assert git(tmp_path, "status", "--short") == " M c.txt\n"
+
+
+def test_transaction_rolls_back(tmp_path, git_identity):
+    """Test that aborted or conflicting transactions leave HEAD and the index as they were."""
+    init_repo(tmp_path, {"a.txt": "a\n", "b.txt": "b\n"})
+    (tmp_path / "a.txt").write_text("changed a\n")
+    hunks = parse_git_diff_into_hunks(git(tmp_path, "diff"))
+
+    backend = TransactionStagingBackend(str(tmp_path))
+    backend.stage(hunks, [0])
+    backend.commit("fix: a")
+    backend.abort()
+    assert git(tmp_path, "log", "--format=%s") == "init\n"
+    assert git(tmp_path, "status", "--short") == " M a.txt\n"
+
+    backend = TransactionStagingBackend(str(tmp_path))
+    backend.stage(hunks, [0])
+    backend.commit("fix: a")
+    # Someone else commits before the transaction finishes
+    (tmp_path / "b.txt").write_text("changed b\n")
+    git(tmp_path, "commit", "-q", "-am", "fix: b")
+    assert not backend.finish()
+    assert git(tmp_path, "log", "--format=%s") == "fix: b\ninit\n"
+    assert list(tmp_path.glob(".git/index.*")) == []
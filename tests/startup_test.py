@@ -0,0 +1,21 @@
+from tests.helpers import imported_modules, init_repo
+
+
+def test_entry_point_import_is_light():
+    """Test that importing the entry point doesn't load the LLM, git, or UI stacks."""
+    result = imported_modules("import commit_suggestions.main")
+
+    assert "commit_suggestions" in result.modules
+    assert result.heavy_modules == set()
+
+
+def test_no_changes_exits_before_heavy_imports(tmp_path):
+    """Test that a clean working tree exits before the heavy imports are loaded."""
+    init_repo(tmp_path, {"a.txt": "a\n"})
+
+    result = imported_modules(
+        "from commit_suggestions.main import main; main([])", cwd=tmp_path
+    )
+
+    assert result.stdout == "There are no changes! Exiting Program!\n"
+    assert result.heavy_modules == set()
@@ -0,0 +1,116 @@
+from commit_suggestions.backends import LLMBackend, StubBackend
+from commit_suggestions.llm import (
+    iter_commit_suggestions,
+    stream_commit_suggestions_async,
+)
+from commit_suggestions.mock_server import MockServer
+from commit_suggestions.models import (
+    BackendConfig,
+    CommitSuggestion,
+    CommitSuggestions,
+    TokenUsage,
+)
+from commit_suggestions.streaming import SuggestionStreamParser
+from tests.helpers import make_snippets
+import asyncio
+
+
+def test_parser_yields_each_completed_suggestion():
+    """Test that suggestions are parsed as soon as their object closes, even with braces in strings."""
+    commit_suggestions = CommitSuggestions(
+        commit_suggestions=[
+            CommitSuggestion(message='Fix "{" parsing }', code_snippet_indices=[0, 2]),
+            CommitSuggestion(message="Escape \\ and ]", code_snippet_indices=[1]),
+        ]
+    )
+    text = commit_suggestions.model_dump_json()
+    parser = SuggestionStreamParser()
+
+    parsed = []
+    completed_at = []
+    for position in range(0, len(text), 3):
+        for suggestion in parser.feed(text[position : position + 3]):
+            parsed.append(suggestion)
+            completed_at.append(position)
+
+    assert parsed == commit_suggestions.commit_suggestions
+    # The first suggestion is ready as soon as its own object ends
+    first_end = text.index("[0,2]}") + len("[0,2]}")
+    assert first_end <= completed_at[0] + 3 < text.index("Escape")
+
+
+def test_stream_stub_backend():
+    """Test that streamed suggestions of every batch use global snippet indices."""
+    snippets = make_snippets([f"src/{number}.py" for number in range(6)])
+    usage = TokenUsage()
+
+    async def collect():
+        return [
+            suggestion
+            async for suggestion in stream_commit_suggestions_async(
+                StubBackend(latency=0.01), snippets, token_budget=300, usage=usage
+            )
+        ]
+
+    suggestions = asyncio.run(collect())
+
+    assert sorted(
+        index for suggestion in suggestions for index in suggestion.code_snippet_indices
+    ) == list(range(6))
+    assert usage.prompt_tokens > 0
+
+
+def test_stream_from_mock_server(monkeypatch):
+    """Test that suggestions stream from an OpenAI-compatible server and usage is reported."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    snippets = make_snippets(["src/a.py", "docs/x.md", "src/b.py"])
+    usage = TokenUsage()
+
+    with MockServer() as server:
+        suggestions = list(
+            iter_commit_suggestions(
+                snippets,
+                token_budget=10_000,
+                usage=usage,
+                backend_config=BackendConfig(base_url=server.base_url),
+            )
+        )
+
+    assert len(suggestions) > 1
+    assert sorted(
+        index for suggestion in suggestions for index in suggestion.code_snippet_indices
+    ) == [0, 1, 2]
+    assert usage.completion_tokens > 0
+
+
+def test_stop_reading_early():
+    """Test that the stream can be abandoned after the first suggestion."""
+    snippets = make_snippets([f"src/{number}.py" for number in range(12)])
+
+    suggestions = iter_commit_suggestions(
+        snippets,
+        token_budget=300,
+        concurrency=1,
+        backend_config=BackendConfig(provider="stub", latency=0.05),
+    )
+
+    assert next(suggestions).code_snippet_indices
+    suggestions.close()
+
+
+def test_stub_backend_answers_match_when_streamed():
+    """Test that the default `stream` of a backend gives the same suggestions as `complete`."""
+    snippets = make_snippets(["src/a.py", "docs/x.md"])
+    backend = StubBackend()
+
+    async def both():
+        completed, _ = await backend.complete(snippets, [], "model")
+        streamed = [
+            suggestion
+            async for suggestion in LLMBackend.stream(backend, snippets, [], "model")
+        ]
+        return completed, streamed
+
+    completed, streamed = asyncio.run(both())
+
+    assert streamed == completed.commit_suggestions
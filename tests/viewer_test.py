@@ -0,0 +1,67 @@
+from commit_suggestions.models import ViewerOptions
+from commit_suggestions.viewer import iter_visible_lines, render_code
+
+
+def make_code(*runs):
+    return "\n".join(
+        f"{marker}{name}{number}"
+        for marker, name, count in runs
+        for number in range(count)
+    )
+
+
+def test_collapse_unchanged_lines():
+    """Test that only the context around changes is kept, and short runs aren't collapsed."""
+    code = make_code(
+        (" ", "c", 10), ("-", "a", 1), ("+", "b", 1), (" ", "d", 7), ("+", "x", 1)
+    )
+
+    assert list(iter_visible_lines(code, context_lines=3)) == [
+        7,
+        " c7",
+        " c8",
+        " c9",
+        "-a0",
+        "+b0",
+        *(f" d{number}" for number in range(7)),
+        "+x0",
+    ]
+    assert list(iter_visible_lines(code, context_lines=1)) == [
+        9,
+        " c9",
+        "-a0",
+        "+b0",
+        " d0",
+        5,
+        " d6",
+        "+x0",
+    ]
+    assert list(iter_visible_lines(code)) == code.split("\n")
+
+
+def test_render_code_styles_and_line_cap():
+    """Test that lines are colored with spans and the hunk is cut off at the line cap."""
+    code = make_code(("-", "a", 2), ("+", "b", 50_000))
+
+    text, cut_lines = render_code(code, ViewerOptions(max_lines=3))
+
+    assert text.plain.split("\n") == ["-a0", "-a1", "+b0", "⋯ 49999 more lines"]
+    assert [str(span.style) for span in text.spans] == [
+        "red",
+        "red",
+        "green",
+        "dim italic",
+    ]
+    assert cut_lines == 49_999
+
+
+def test_render_code_without_cap():
+    """Test that every line is shown without a cap or collapsed context."""
+    code = make_code((" ", "c", 20), ("+", "b", 1))
+
+    text, cut_lines = render_code(
+        code, ViewerOptions(max_lines=None, context_lines=None)
+    )
+
+    assert text.plain == code
+    assert cut_lines == 0